@@ -0,0 +1,3058 @@
+# Bank Management System - Data Layer
+# DataStore with its storage engines, snapshot format, ledger, read replica, sessions and
+# metrics. Nothing here imports tkinter, so bench.py, the tests and the headless commands
+# run without a display; gui2.py builds the Tk app on top of this module.
+#
+#   python bank_store.py --import customers.csv [--journal] [--engine sqlite]
+#   python bank_store.py --convert data.json data.snap
+#   python bank_store.py --rebalance 8
+#   python bank_store.py --replica [--columnar]
+
+import csv
+import hashlib
+import hmac
+import io
+import json
+import mmap
+import os
+import random
+import re
+import secrets
+import shutil
+import sqlite3
+import string
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import compress
+from multiprocessing.connection import AuthenticationError, Client, Listener
+from pathlib import Path
+
+
+#############################
+# Data Layer
+#############################
+class AccountRow(MutableMapping):
+    """Dict-like view of one account stored in a ColumnarAccounts table."""
+    __slots__ = ("_table", "slot")
+
+    def __init__(self, table, slot):
+        self._table = table
+        self.slot = slot
+
+    def __getitem__(self, key):
+        t = self._table
+        extra = t._extra.get(self.slot)
+        if extra and key in extra:
+            return extra[key]
+        if key in t.INT_COLS:
+            return t._cols[key][self.slot]
+        if key in t.STR_COLS:
+            value = t._cols[key][self.slot]
+            return t._strings[value] if key in t.INTERNED else value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        t = self._table
+        extra = t._extra.get(self.slot)
+        try:
+            if key in t.INT_COLS and type(value) is int:
+                t._cols[key][self.slot] = value
+            elif key in t.STR_COLS and isinstance(value, str):
+                t._cols[key][self.slot] = t._intern(value) if key in t.INTERNED else value
+            else:
+                raise TypeError
+        except (TypeError, OverflowError):
+            # odd types/values (or unknown keys) live in a per-row side dict
+            t._extra.setdefault(self.slot, {})[key] = value
+            return
+        if extra and key in extra:
+            del extra[key]
+
+    def __delitem__(self, key):
+        extra = self._table._extra.get(self.slot)
+        if not extra or key not in extra:
+            raise KeyError(key)
+        del extra[key]
+
+    def __iter__(self):
+        t = self._table
+        yield from t.FIELDS
+        extra = t._extra.get(self.slot)
+        if extra:
+            yield from (k for k in extra if k not in t.FIELDS)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def clear(self):
+        # columns always exist; clearing only drops the side-dict keys
+        self._table._extra.pop(self.slot, None)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class ColumnarAccounts:
+    """
+    List-like account table that keeps each field in a typed array instead of one dict per
+    account. Names are interned in a side table, the mostly unique email and account number
+    columns are plain lists. Rows are exposed as AccountRow views.
+    Deleted slots are not reused; they stay as gaps until enough have piled up, then the
+    table is compacted back into list order, so the columns can be read without a remap.
+    """
+    INT_COLS = {"age": 'i', "pin": 'i', "balance": 'q'}
+    STR_COLS = ("name", "email", "accountNo")
+    INTERNED = ("name",)
+    FIELDS = ("name", "age", "email", "pin", "accountNo", "balance")
+    COMPACT_MIN = 1024  # gaps tolerated before compacting, also at most a quarter of the rows
+
+    def __init__(self, rows=()):
+        self._cols = {k: array(code) for k, code in self.INT_COLS.items()}
+        self._cols.update((k, array('i') if k in self.INTERNED else []) for k in self.STR_COLS)
+        self._alive = bytearray()
+        self._rows = []  # slot -> AccountRow, so the same view is handed out every time
+        self._order = array('i')  # position -> slot, keeps list order across deletes
+        self._ordered = True  # _order is ascending, i.e. slot order is list order
+        self._dead = set()  # deleted slots not recycled yet, still restorable
+        self._extra = {}
+        self._strings = []
+        self._string_ids = {}
+        for r in rows:
+            self.append(r)
+
+    def _intern(self, s):
+        sid = self._string_ids.get(s)
+        if sid is None:
+            sid = self._string_ids[s] = len(self._strings)
+            self._strings.append(s)
+        return sid
+
+    def _store(self, acc):
+        slot = len(self._rows)
+        for col in self._cols.values():
+            col.append(0)
+        self._alive.append(0)
+        self._rows.append(AccountRow(self, slot))
+        row = self._rows[slot]
+        acc = dict(acc)
+        if "accountNo" not in acc and "accountNo." in acc:
+            acc["accountNo"] = acc.pop("accountNo.")  # legacy key
+        for k in self.FIELDS:
+            row[k] = acc.pop(k, "" if k in self.STR_COLS else 0)
+        for k, v in acc.items():
+            row[k] = v
+        self._alive[slot] = 1
+        return slot
+
+    def append(self, acc):
+        self._order.append(self._store(acc))
+
+    def insert(self, pos, acc):
+        if isinstance(acc, AccountRow) and acc._table is self and not self._alive[acc.slot]:
+            # re-inserting a row deleted earlier (transaction rollback): revive its slot
+            self._dead.discard(acc.slot)
+            self._alive[acc.slot] = 1
+            slot = acc.slot
+        else:
+            slot = self._store(acc)
+        order = self._order
+        pos = min(max(pos + len(order), 0) if pos < 0 else pos, len(order))
+        if self._ordered and not ((pos == 0 or order[pos - 1] < slot)
+                                  and (pos == len(order) or slot < order[pos])):
+            self._ordered = False
+        order.insert(pos, slot)
+
+    def __delitem__(self, pos):
+        slot = self._order.pop(pos)
+        self._alive[slot] = 0
+        self._dead.add(slot)  # values stay until recycle(), for rollback
+
+    def recycle(self, slots):
+        # gives up deleted slots once the transaction that deleted them has ended
+        self._dead.difference_update(slots)
+        gaps = len(self._rows) - len(self._order)
+        if not self._dead and (not self._ordered or gaps > max(self.COMPACT_MIN, len(self._order) // 4)):
+            self._compact()
+
+    def _compact(self):
+        # rewrites every column in list order; the row views are renumbered, not replaced
+        order = self._order
+        for k, col in self._cols.items():
+            values = map(col.__getitem__, order)
+            self._cols[k] = array(col.typecode, values) if isinstance(col, array) else list(values)
+        extra = [(self._rows[s], v) for s, v in self._extra.items() if self._alive[s]]
+        self._rows = [self._rows[s] for s in order]
+        for slot, row in enumerate(self._rows):
+            row.slot = slot
+        self._extra = {row.slot: v for row, v in extra}
+        self._alive = bytearray(b"\1") * len(order)
+        self._order = array('i', range(len(order)))
+        self._ordered = True
+
+    def index(self, row):
+        if isinstance(row, AccountRow) and row._table is self:
+            if self._ordered:
+                pos = bisect_left(self._order, row.slot)
+                if pos < len(self._order) and self._order[pos] == row.slot:
+                    return pos
+                raise ValueError("row not in table")
+            return self._order.index(row.slot)
+        raise ValueError("row not in table")
+
+    def remove(self, row):
+        del self[self.index(row)]
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return [self._rows[s] for s in self._order[pos]]
+        return self._rows[self._order[pos]]
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        if self._ordered:
+            return compress(self._rows, self._alive)
+        rows = self._rows
+        return (rows[s] for s in self._order)
+
+    def column(self, field):
+        """Values of one int column for every live account in list order, read off the array."""
+        col = self._cols[field]
+        if not self._ordered:
+            return map(col.__getitem__, self._order)
+        if len(self._order) == len(col):
+            return col[:]
+        return compress(col, self._alive)
+
+
+def _to_plain(obj):
+    # json.dump hook for the columnar table and its row views
+    if isinstance(obj, AccountRow):
+        return dict(obj)
+    if isinstance(obj, ColumnarAccounts):
+        return [dict(r) for r in obj]
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+class NgramIndex:
+    """
+    Case-insensitive substring index (trigram -> row ids) over one text field.
+    Keys get small integer ids in insertion order, which is the order find() returns them in;
+    a renamed key keeps its id, so results follow the table. Postings are int arrays and may
+    hold stale or repeated ids, since every hit is confirmed against the stored text anyway;
+    they are rebuilt once stale entries outnumber live ones.
+    Texts are stored lowercased behind a start marker, so prefix queries use the same postings.
+    """
+    N = 3
+    START = "\x02"
+
+    def __init__(self):
+        self._grams = {}  # gram -> array of ids
+        self._ids = {}  # key -> id, kept after remove so a rolled-back delete returns to its old place
+        self._keys = []  # id -> key
+        self._text = []  # id -> marked, lowercased text, None once removed
+        self._posted = 0  # ids in all postings
+        self._live = 0  # of those, ids whose text still has that gram
+
+    def _split(self, s):
+        return {s[i:i + self.N] for i in range(len(s) - self.N + 1)}
+
+    def _post(self, i, grams):
+        for g in grams:
+            p = self._grams.get(g)
+            if p is None:
+                p = self._grams[g] = array('i')
+            p.append(i)
+        self._posted += len(grams)
+        self._live += len(grams)
+
+    def add(self, key, text):
+        i = self._ids.get(key)
+        if i is None:
+            i = self._ids[key] = len(self._keys)
+            self._keys.append(key)
+            self._text.append(None)
+        self.remove(key)
+        s = self.START + str(text).lower()
+        self._text[i] = s
+        self._post(i, self._split(s))
+
+    def remove(self, key):
+        i = self._ids.get(key)
+        if i is None or self._text[i] is None:
+            return
+        self._live -= len(self._split(self._text[i]))
+        self._text[i] = None
+        if self._posted > 2 * self._live + 4096:
+            self._rebuild()
+
+    def rename(self, old, new):
+        # moves old's id, and with it the key's place in the results, over to new;
+        # only once old has been removed, a live key belongs to some other row
+        i = self._ids.get(old)
+        if i is None or self._text[i] is not None:
+            return
+        del self._ids[old]
+        self.forget(new)
+        self._ids[new] = i
+        self._keys[i] = new
+
+    def forget(self, key):
+        # drops a removed key's id, so a new row reusing the key sorts after the existing ones
+        i = self._ids.get(key)
+        if i is not None and self._text[i] is None:
+            del self._ids[key]
+
+    def _rebuild(self):
+        self._grams, self._posted, self._live = {}, 0, 0
+        for i, s in enumerate(self._text):
+            if s is not None:
+                self._post(i, self._split(s))
+
+    def find(self, q, prefix=False):
+        q = str(q).lower()
+        if prefix:
+            q = self.START + q
+        grams = self._split(q)
+        if grams:
+            # the rarest gram's rows, confirmed by the substring test below
+            ids = sorted(set(min((self._grams.get(g, ()) for g in grams), key=len)))
+        else:
+            ids = range(len(self._text))  # too short to use trigrams
+        text, keys = self._text, self._keys
+        return [keys[i] for i in ids if text[i] is not None and q in text[i]]
+
+
+class AccountNumbers:
+    """
+    Allocator for AAA999 account numbers. Every number maps to one bit of a bytearray
+    (26**3 * 1000 bits, about 2.2 MB), so membership and allocation stay O(1) at any book size.
+    """
+    SIZE = 26 ** 3 * 1000
+    PROBES = 16  # random tries before falling back to a scan for a free bit
+    _FREE_BYTE = re.compile(rb"[^\xff]")
+    _LETTERS = [a + b + c for a in string.ascii_uppercase for b in string.ascii_uppercase
+                for c in string.ascii_uppercase]
+    _DIGITS = [f"{i:03d}" for i in range(1000)]
+
+    def __init__(self):
+        self._bits = bytearray(self.SIZE // 8)
+        self._used = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def encode(cls, acc_no):
+        # None for anything outside the AAA999 format (e.g. legacy numbers), which can't collide
+        if (not isinstance(acc_no, str) or len(acc_no) != 6 or not acc_no[3:].isdigit()
+                or not all("A" <= c <= "Z" for c in acc_no[:3])):
+            return None
+        a, b, c = (ord(ch) - 65 for ch in acc_no[:3])
+        return ((a * 26 + b) * 26 + c) * 1000 + int(acc_no[3:])
+
+    @classmethod
+    def decode(cls, n):
+        return cls._LETTERS[n // 1000] + cls._DIGITS[n % 1000]
+
+    def __contains__(self, acc_no):
+        n = self.encode(acc_no)
+        return n is not None and bool(self._bits[n >> 3] & (1 << (n & 7)))
+
+    def mark(self, acc_no):
+        n = self.encode(acc_no)
+        if n is not None:
+            with self._lock:
+                self._set(n)
+
+    def release(self, acc_no):
+        n = self.encode(acc_no)
+        if n is not None:
+            with self._lock:
+                if self._bits[n >> 3] & (1 << (n & 7)):
+                    self._bits[n >> 3] &= ~(1 << (n & 7))
+                    self._used -= 1
+
+    def _set(self, n):
+        if not self._bits[n >> 3] & (1 << (n & 7)):
+            self._bits[n >> 3] |= 1 << (n & 7)
+            self._used += 1
+
+    def _take(self):
+        if self._used >= self.SIZE:
+            raise ValueError("Account number space exhausted")
+        bits = self._bits
+        for _ in range(self.PROBES):
+            n = random.randrange(self.SIZE)
+            if not bits[n >> 3] & (1 << (n & 7)):
+                break
+        else:
+            # crowded keyspace: jump to the next byte with a free bit, wrapping once
+            start = random.randrange(len(bits))
+            m = self._FREE_BYTE.search(bits, start) or self._FREE_BYTE.search(bits)
+            i = m.start()
+            b = bits[i]
+            n = i * 8 + (~b & (b + 1)).bit_length() - 1  # lowest clear bit
+        self._set(n)
+        return n
+
+    def allocate(self):
+        """A fresh number, marked as used straight away."""
+        with self._lock:
+            return self.decode(self._take())
+
+    def reserve(self, count):
+        """A block of fresh numbers for batch onboarding; hand them back with release()."""
+        with self._lock:
+            if self._used + count > self.SIZE:
+                raise ValueError("Not enough account numbers left")
+            bits = self._bits
+            taken = []
+            while len(taken) < count:
+                need = count - len(taken)
+                if self._used + need > self.SIZE // 2:
+                    taken.extend(self._take() for _ in range(need))  # crowded: one at a time
+                    break
+                # sparse: draw the whole block at once and keep the free ones
+                for n in random.sample(range(self.SIZE), need):
+                    if not bits[n >> 3] & (1 << (n & 7)):
+                        bits[n >> 3] |= 1 << (n & 7)
+                        self._used += 1
+                        taken.append(n)
+            return [self.decode(n) for n in taken]
+
+    def usage(self):
+        used = self._used
+        return {"used": used, "free": self.SIZE - used, "capacity": self.SIZE,
+                "ratio": used / self.SIZE}
+
+
+#############################
+# Snapshot Format
+#############################
+# A compact binary copy of DataStore.data: SNAPSHOT_HEADER, then sections that each start
+# with their byte length (SNAPSHOT_SECTION):
+#   meta JSON: staff, manager, any other top-level keys, and "irregular" accounts
+#   age, pin, balance: little-endian int64 arrays
+#   name, email, accountNo: NUL-separated UTF-8
+# Accounts with exactly SNAPSHOT_FIELDS of the usual types go into the columns; anything else
+# (legacy "accountNo." keys, extra fields) is kept verbatim in the meta JSON with its position.
+# The CRC-32 covers everything after the header.
+SNAPSHOT_MAGIC = b"BKSN"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<4sHxxIQI")  # magic, version, column rows, body bytes, crc32
+SNAPSHOT_SECTION = struct.Struct("<Q")
+SNAPSHOT_INTS = ("age", "pin", "balance")
+SNAPSHOT_STRS = ("name", "email", "accountNo")
+SNAPSHOT_FIELDS = frozenset(SNAPSHOT_INTS + SNAPSHOT_STRS)
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+def _columnar_ok(acc):
+    return (acc.keys() == SNAPSHOT_FIELDS
+            and all(type(acc[k]) is int and _INT64_MIN <= acc[k] <= _INT64_MAX for k in SNAPSHOT_INTS)
+            and all(type(acc[k]) is str and "\0" not in acc[k] for k in SNAPSHOT_STRS))
+
+
+def _snapshot_columns(accounts):
+    # fast path for a book where every account is regular; raises as soon as one is not
+    if any(len(acc) != len(SNAPSHOT_FIELDS) for acc in accounts):
+        raise ValueError
+    ints, strs = {}, {}
+    for k in SNAPSHOT_INTS:
+        values = [acc[k] for acc in accounts]
+        # array('q') would take bools and int subclasses too; _columnar_ok wants plain ints
+        if not set(map(type, values)) <= {int}:
+            raise ValueError
+        ints[k] = array('q', values)
+    for k in SNAPSHOT_STRS:
+        strs[k] = [acc[k] for acc in accounts]
+        if not set(map(type, strs[k])) <= {str}:
+            raise ValueError
+        if "\0".join(strs[k]).count("\0") != max(0, len(accounts) - 1):
+            raise ValueError
+    return ints, strs
+
+
+def encode_snapshot(data):
+    accounts = data.get("accounts", [])
+    irregular = []
+    try:
+        ints, strs = _snapshot_columns(accounts)
+    except (KeyError, TypeError, ValueError, OverflowError):
+        ints = {k: array('q') for k in SNAPSHOT_INTS}
+        strs = {k: [] for k in SNAPSHOT_STRS}
+        for pos, acc in enumerate(accounts):
+            if type(acc) is not dict:
+                acc = dict(acc)
+            if not _columnar_ok(acc):
+                irregular.append([pos, acc])
+                continue
+            for k in SNAPSHOT_INTS:
+                ints[k].append(acc[k])
+            for k in SNAPSHOT_STRS:
+                strs[k].append(acc[k])
+    meta = {k: v for k, v in data.items() if k != "accounts"}
+    meta["irregular"] = irregular
+    sections = [json.dumps(meta, separators=(",", ":"), default=_to_plain).encode("utf-8")]
+    for k in SNAPSHOT_INTS:
+        if sys.byteorder == "big":
+            ints[k].byteswap()
+        sections.append(ints[k].tobytes())
+    sections.extend("\0".join(strs[k]).encode("utf-8") for k in SNAPSHOT_STRS)
+    body = b"".join(SNAPSHOT_SECTION.pack(len(s)) + s for s in sections)
+    count = len(ints["age"])
+    return SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, count, len(body), zlib.crc32(body)) + body
+
+
+def decode_snapshot(buf):
+    if len(buf) < SNAPSHOT_HEADER.size:
+        raise ValueError("Not a snapshot file")
+    magic, version, count, length, crc = SNAPSHOT_HEADER.unpack_from(buf)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("Not a snapshot file")
+    if version > SNAPSHOT_VERSION:
+        raise ValueError(f"Snapshot version {version} is newer than this program supports")
+    body = memoryview(buf)[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + length]
+    if len(body) != length or zlib.crc32(body) != crc:
+        raise ValueError("Snapshot is damaged (checksum mismatch)")
+    sections, off = [], 0
+    while off < length:
+        (n,) = SNAPSHOT_SECTION.unpack_from(body, off)
+        off += SNAPSHOT_SECTION.size
+        sections.append(body[off:off + n])
+        off += n
+    data = json.loads(bytes(sections[0]))
+    cols = {}
+    for k, sec in zip(SNAPSHOT_INTS, sections[1:4]):
+        cols[k] = array('q')
+        cols[k].frombytes(sec)
+        if sys.byteorder == "big":
+            cols[k].byteswap()
+    for k, sec in zip(SNAPSHOT_STRS, sections[4:7]):
+        cols[k] = bytes(sec).decode("utf-8").split("\0") if count else []
+    accounts = [{"name": n, "age": a, "email": e, "pin": p, "accountNo": no, "balance": b}
+                for n, a, e, p, no, b in zip(cols["name"], cols["age"], cols["email"], cols["pin"],
+                                             cols["accountNo"], cols["balance"])]
+    for pos, acc in data.pop("irregular", ()):
+        accounts.insert(pos, acc)
+    data["accounts"] = accounts
+    return data
+
+
+def write_snapshot(path, blob, fsync=False):
+    # atomically replaces path with an encoded snapshot; returns the bytes written
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        n = f.write(blob)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return n
+
+
+def read_snapshot(path):
+    with open(path, 'rb') as f:
+        return decode_snapshot(f.read())
+
+
+def convert_snapshot(src, dst):
+    """Converts data.json <-> snapshot, picking the direction from src's suffix."""
+    if str(src).lower().endswith(".json"):
+        data = {}
+        _load_json_document(src, data)
+        return write_snapshot(dst, encode_snapshot(data), fsync=True)
+    text = json.dumps(read_snapshot(src), separators=(",", ":"))
+    tmp = f"{dst}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        n = f.write(text)
+    os.replace(tmp, dst)
+    return n
+
+
+#############################
+# Storage Engines
+#############################
+# An engine persists DataStore.data. load() fills store.data, recover() replays anything
+# logged after the last snapshot, prepare() turns a transaction's records into queue items
+# (called while the row locks are held), write() makes a batch of items durable and save()
+# writes the whole store. bytes_written counts what each engine hands to the OS.
+def _load_json_document(path, data):
+    # merges a data.json document (or a legacy bare list of accounts) into data
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+    if isinstance(raw, list):
+        data["accounts"] = raw
+    elif isinstance(raw, dict):
+        # merge keys
+        for k in ["accounts", "staff", "manager"]:
+            if k in raw:
+                data[k] = raw[k]
+
+
+class JsonEngine:
+    """data.json as one document, optionally with an append-only journal next to it."""
+
+    def __init__(self, store):
+        self.store = store
+        self.journal = store.journal
+        self.rewrites = not self.journal  # every write rewrites the whole document
+        self._journal_len = 0
+        self._journal_started = False  # JOURNAL_FILE has its header line
+        self.bytes_written = 0
+
+    def load(self):
+        st = self.store
+        if Path(st.DB_FILE).exists():
+            try:
+                _load_json_document(st.DB_FILE, st.data)
+                if not self.journal:
+                    self.save()
+            except Exception:
+                self.save()
+        else:
+            self.save()
+
+    def recover(self):
+        path = self.store.JOURNAL_FILE
+        if not self.journal or not Path(path).exists():
+            return
+        self._journal_started = os.path.getsize(path) > 0
+        good = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break  # torn write from a crash, drop it and everything after
+                self.store._apply(rec)
+                good += len(line)
+                self._journal_len += 1
+        if good != os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(good)
+
+    def prepare(self, records):
+        if not self.journal:
+            return []  # the snapshot is taken at write time
+        return [json.dumps(r, separators=(",", ":"), default=_to_plain) for r in records]
+
+    def write(self, lines):
+        if not self.journal:
+            self.save()
+            return
+        if lines:
+            # the trailing mark timestamps the batch for read replicas; _apply ignores it
+            mark = json.dumps(["mark", time.time()])
+            # a new journal starts with a random id, which tells replicas it apart from the
+            # rotated one even if the file system hands it the same inode
+            head = "" if self._journal_started else json.dumps(["journal", secrets.token_hex(8)]) + "\n"
+            with open(self.store.JOURNAL_FILE, 'a', encoding='utf-8') as f:
+                self.bytes_written += f.write(head + "\n".join(lines) + "\n" + mark + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_started = True
+            self._journal_len += len(lines)
+        if self._journal_len >= self.store.COMPACT_EVERY:
+            self.compact()
+
+    def compact(self):
+        # fold the journal into a fresh snapshot; replace first so a crash never loses records.
+        # The old journal is rotated rather than truncated, so read replicas can finish it.
+        if not self.journal:
+            return
+        self.save(fsync=True)
+        path = self.store.JOURNAL_FILE
+        if os.path.exists(path):
+            os.replace(path, path + ".1")
+        self._journal_len = 0
+        self._journal_started = False
+
+    def save(self, fsync=False):
+        # journal records are idempotent, so a snapshot never needs the journal cleared
+        st = self.store
+        text = st._dump()
+        tmp = st.DB_FILE + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            self.bytes_written += f.write(text)  # json.dumps output is ASCII, so chars == bytes
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, st.DB_FILE)
+
+
+class SnapshotEngine(JsonEngine):
+    """
+    JsonEngine with the whole-store copy kept in SNAPSHOT_FILE's binary format instead of
+    DB_FILE (imported from DB_FILE on first run). Journal mode works the same way.
+    """
+
+    def load(self):
+        st = self.store
+        if Path(st.SNAPSHOT_FILE).exists():
+            # a damaged snapshot is an error, not something to overwrite
+            st.data.update(read_snapshot(st.SNAPSHOT_FILE))
+            return
+        if Path(st.DB_FILE).exists():
+            _load_json_document(st.DB_FILE, st.data)
+        self.save(fsync=True)
+
+    def save(self, fsync=False):
+        st = self.store
+        with st._quiesce():
+            blob = encode_snapshot(st.data)
+        self.bytes_written += write_snapshot(st.SNAPSHOT_FILE, blob, fsync)
+
+
+class SqliteEngine:
+    """
+    SQLite database in WAL mode, one row per account and staff member. A commit only
+    upserts/deletes the rows it touched. A new database is seeded once from DB_FILE.
+    Searches run on the in-memory indexes, so the table is keyed by accountNo only.
+    """
+    FIELDS = ("name", "age", "email", "pin", "accountNo", "balance")
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS accounts (
+            accountNo TEXT PRIMARY KEY, name TEXT, age INTEGER, email TEXT,
+            pin INTEGER, balance INTEGER, extra TEXT);
+        DROP INDEX IF EXISTS accounts_name;
+        CREATE TABLE IF NOT EXISTS staff (id TEXT PRIMARY KEY, password TEXT, name TEXT);
+        CREATE TABLE IF NOT EXISTS manager (id TEXT, password TEXT);
+    """
+    UPSERT_ACCOUNT = """
+        INSERT INTO accounts (accountNo, name, age, email, pin, balance, extra)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(accountNo) DO UPDATE SET name = excluded.name, age = excluded.age,
+            email = excluded.email, pin = excluded.pin, balance = excluded.balance,
+            extra = excluded.extra
+    """
+    DELETE_ACCOUNT = "DELETE FROM accounts WHERE accountNo = ?"
+    UPSERT_STAFF = """
+        INSERT INTO staff (id, password, name) VALUES (?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET password = excluded.password, name = excluded.name
+    """
+    DELETE_STAFF = "DELETE FROM staff WHERE id = ?"
+
+    def __init__(self, store):
+        self.store = store
+        # writes come from whichever thread flushes, always under the store's I/O lock
+        self.bytes_written = 0  # row payload handed to SQLite, not counting pages and WAL headers
+        self.conn = sqlite3.connect(store.SQLITE_FILE, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # FULL: a commit is on disk when write() returns, as with the other engines' fsync;
+        # NORMAL in WAL mode can lose the latest commits on power loss
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.executescript(self.SCHEMA)
+
+    def load(self):
+        st, c = self.store, self.conn
+        if c.execute("SELECT COUNT(*) FROM manager").fetchone()[0] == 0:
+            self.migrate(st.DB_FILE)
+        st.data["accounts"] = [self._account(r) for r in c.execute(
+            "SELECT accountNo, name, age, email, pin, balance, extra FROM accounts ORDER BY rowid")]
+        st.data["staff"] = [{"id": i, "password": p, "name": n}
+                            for i, p, n in c.execute("SELECT id, password, name FROM staff ORDER BY rowid")]
+        uid, pwd = c.execute("SELECT id, password FROM manager").fetchone()
+        st.data["manager"] = {"id": uid, "password": pwd}
+
+    def migrate(self, json_path):
+        """One-shot import of a data.json document (or legacy account list) into an empty database."""
+        data = {"accounts": [], "staff": [], "manager": self.store.data["manager"]}
+        if Path(json_path).exists():
+            _load_json_document(json_path, data)
+        self._replace_all(data)
+
+    @staticmethod
+    def _account(row):
+        acc_no, name, age, email, pin, balance, extra = row
+        acc = {"name": name, "age": age, "email": email, "pin": pin, "accountNo": acc_no, "balance": balance}
+        if extra:
+            acc.update(json.loads(extra))
+        return acc
+
+    def _account_params(self, acc_no, acc):
+        extra = {k: v for k, v in acc.items() if k not in self.FIELDS and k != "accountNo."}
+        return (acc_no, acc.get("name"), acc.get("age"), acc.get("email"), acc.get("pin"),
+                acc.get("balance"), json.dumps(extra, default=_to_plain) if extra else None)
+
+    def recover(self):
+        pass  # SQLite replays its own WAL
+
+    def prepare(self, records):
+        items = []
+        for rec in records:
+            kind = rec[0]
+            if kind == "acc":
+                items.append((self.UPSERT_ACCOUNT, self._account_params(rec[1], rec[2])))
+            elif kind == "acc_del":
+                items.append((self.DELETE_ACCOUNT, (rec[1],)))
+            elif kind == "staff":
+                items.append((self.UPSERT_STAFF, (rec[1]["id"], rec[1]["password"], rec[1]["name"])))
+            elif kind == "staff_del":
+                items.append((self.DELETE_STAFF, (rec[1],)))
+        return items
+
+    @staticmethod
+    def _payload(params):
+        return sum(len(p) if isinstance(p, str) else 8 for p in params)
+
+    def write(self, items):
+        with self.conn:  # one SQLite transaction per batch
+            for sql, params in items:
+                self.conn.execute(sql, params)
+                self.bytes_written += self._payload(params)
+
+    def _replace_all(self, data):
+        accounts = [self._account_params(a.get("accountNo") or a.get("accountNo."), a) for a in data["accounts"]]
+        with self.conn:
+            self.conn.execute("DELETE FROM accounts")
+            self.conn.execute("DELETE FROM staff")
+            self.conn.execute("DELETE FROM manager")
+            self.conn.executemany(self.UPSERT_ACCOUNT, accounts)
+            self.bytes_written += sum(self._payload(a) for a in accounts)
+            self.conn.executemany(self.UPSERT_STAFF, [(s["id"], s["password"], s["name"]) for s in data["staff"]])
+            self.conn.execute("INSERT INTO manager VALUES (?, ?)", (data["manager"]["id"], data["manager"]["password"]))
+
+    def save(self):
+        with self.store._quiesce():
+            data = {k: self.store.data[k] for k in ("staff", "manager")}
+            data["accounts"] = [dict(a) for a in self.store.data["accounts"]]
+        self._replace_all(data)
+
+    def compact(self):
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+class MmapEngine:
+    """
+    Fixed-width binary account records in MMAP_FILE, accessed through mmap. Names, emails and
+    extra fields go to an append-only string file, staff/manager to a small JSON side file.
+    A commit rewrites only the touched records in place and flushes just their pages.
+    DB_FILE stays the import/export format.
+    """
+    MAGIC = b"BKM1"
+    HEADER = struct.Struct("<4sII")  # magic, record size, slots in use
+    # alive flag, age, pin, balance, name/email/extra string refs, accountNo
+    RECORD = struct.Struct("<BxxxiiqQQQ24s")
+    STRLEN = struct.Struct("<I")
+    GROW = 1024  # slots added whenever the file runs out of room
+    PAGE = mmap.ALLOCATIONGRANULARITY
+
+    def __init__(self, store):
+        self.store = store
+        self.path = Path(store.MMAP_FILE)
+        self.strings_path = self.path.with_suffix('.strings')
+        self.meta_path = self.path.with_suffix('.meta.json')
+        self._file = self._mm = self._strings = None
+        self._slots = {}  # accountNo -> slot
+        self._written = {}  # slot -> ((name, email, extra), refs) as last written
+        self._free = []
+        self._used = 0
+        self.bytes_written = 0
+
+    def load(self):
+        st = self.store
+        if not self.path.exists():
+            # first run: import data.json, then continue in binary
+            if Path(st.DB_FILE).exists():
+                _load_json_document(st.DB_FILE, st.data)
+            self._rebuild(st.data)
+            return
+        self._open()
+        with open(self.strings_path, 'rb') as f:
+            blob = f.read()
+
+        def text(ref):
+            n, = self.STRLEN.unpack_from(blob, ref)
+            return blob[ref + 4:ref + 4 + n].decode('utf-8')
+
+        accounts = []
+        for slot in range(self._used):
+            alive, age, pin, balance, n_ref, e_ref, x_ref, acc_no = self.RECORD.unpack_from(
+                self._mm, self.HEADER.size + slot * self.RECORD.size)
+            if not alive:
+                self._free.append(slot)
+                continue
+            acc_no = acc_no.rstrip(b"\0").decode('utf-8')
+            name, email = text(n_ref), text(e_ref)
+            extra = text(x_ref) if x_ref else None
+            acc = {"name": name, "age": age, "email": email, "pin": pin, "accountNo": acc_no, "balance": balance}
+            if extra:
+                acc.update(json.loads(extra))
+            accounts.append(acc)
+            self._slots[acc_no] = slot
+            self._written[slot] = ((name, email, extra), (n_ref, e_ref, x_ref))
+        st.data["accounts"] = accounts
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        st.data["staff"], st.data["manager"] = meta["staff"], meta["manager"]
+
+    def _open(self):
+        self._file = open(self.path, 'r+b')
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        magic, size, self._used = self.HEADER.unpack_from(self._mm, 0)
+        if magic != self.MAGIC or size != self.RECORD.size:
+            raise ValueError(f"{self.path} is not a {self.MAGIC.decode()} account file")
+        self._strings = open(self.strings_path, 'ab')
+
+    def _close(self):
+        for f in (self._mm, self._file, self._strings):
+            if f is not None:
+                f.close()
+        self._file = self._mm = self._strings = None
+
+    def _rebuild(self, data):
+        # writes fresh files from a full document; also drops garbage from the string file
+        self._close()
+        self._slots, self._written, self._free = {}, {}, []
+        strings, records = io.BytesIO(), io.BytesIO()
+        strings.write(b"\0")  # ref 0 means "no string"
+
+        def put(s):
+            ref = strings.tell()
+            b = s.encode('utf-8')
+            strings.write(self.STRLEN.pack(len(b)) + b)
+            return ref
+
+        for slot, acc in enumerate(data["accounts"]):
+            acc_no, fields = self._fields(acc.get("accountNo") or acc.get("accountNo."), acc)
+            age, pin, balance, name, email, extra = fields
+            refs = (put(name), put(email), put(extra) if extra else 0)
+            records.write(self.RECORD.pack(1, age, pin, balance, *refs, acc_no.encode('utf-8')))
+            self._slots[acc_no] = slot
+            self._written[slot] = ((name, email, extra), refs)
+        self._used = len(self._slots)
+        records.write(b"\0" * (self.GROW * self.RECORD.size))
+        header = self.HEADER.pack(self.MAGIC, self.RECORD.size, self._used)
+        for path, payload in ((self.strings_path, strings.getvalue()), (self.path, header + records.getvalue())):
+            tmp = f"{path}.tmp"
+            with open(tmp, 'wb') as f:
+                self.bytes_written += f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        self._write_meta(json.dumps({"staff": data["staff"], "manager": data["manager"]}, indent=2))
+        self._open()
+
+    def _write_meta(self, text):
+        tmp = f"{self.meta_path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            self.bytes_written += f.write(text)
+        os.replace(tmp, self.meta_path)
+
+    def _fields(self, acc_no, acc):
+        extra = {k: v for k, v in acc.items() if k not in SqliteEngine.FIELDS and k != "accountNo."}
+        fields = (acc.get("age", 0), acc.get("pin", 0), acc.get("balance", 0),
+                  str(acc.get("name", "")), str(acc.get("email", "")),
+                  json.dumps(extra, default=_to_plain) if extra else None)
+        # fail inside the transaction (so it rolls back) if the record can't be encoded
+        if len(acc_no.encode('utf-8')) > 24:
+            raise ValueError("Account number too long for the binary format")
+        self.RECORD.pack(1, *fields[:3], 0, 0, 0, b"")
+        return acc_no, fields
+
+    def recover(self):
+        pass  # records are written in place; nothing is logged after the last flush
+
+    def prepare(self, records):
+        items = []
+        for rec in records:
+            kind = rec[0]
+            if kind == "acc":
+                items.append(("acc",) + self._fields(rec[1], rec[2]))
+            elif kind == "acc_del":
+                items.append(("del", rec[1]))
+            else:  # staff change: the side file is tiny, rewrite it whole
+                st = self.store
+                items.append(("meta", json.dumps({"staff": st.data["staff"], "manager": st.data["manager"]},
+                                                 indent=2)))
+        return items
+
+    def _put_string(self, s):
+        ref = self._strings.tell()
+        b = s.encode('utf-8')
+        self.bytes_written += self._strings.write(self.STRLEN.pack(len(b)) + b)
+        return ref
+
+    def _slot_for(self, acc_no):
+        slot = self._slots.get(acc_no)
+        if slot is not None:
+            return slot
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = self._used
+            if self.HEADER.size + (slot + 1) * self.RECORD.size > len(self._mm):
+                self._mm.close()
+                self._file.truncate(self.HEADER.size + (slot + self.GROW) * self.RECORD.size)
+                self._mm = mmap.mmap(self._file.fileno(), 0)
+            self._used += 1
+        self._slots[acc_no] = slot
+        return slot
+
+    def write(self, items):
+        dirty = set()
+        used = self._used
+        meta = None
+        for item in items:
+            if item[0] == "meta":
+                meta = item[1]
+                continue
+            if item[0] == "del":
+                slot = self._slots.pop(item[1], None)
+                if slot is not None:
+                    off = self.HEADER.size + slot * self.RECORD.size
+                    self._mm[off] = 0
+                    self._written.pop(slot, None)
+                    self._free.append(slot)
+                    dirty.add(off)
+                continue
+            acc_no, (age, pin, balance, name, email, extra) = item[1], item[2]
+            slot = self._slot_for(acc_no)
+            texts = (name, email, extra)
+            old_texts, refs = self._written.get(slot, ((None, None, None), (0, 0, 0)))
+            if texts != old_texts:
+                # strings are only appended when they changed; a deposit writes none
+                refs = tuple(ref if new == old else (self._put_string(new) if new is not None else 0)
+                             for new, old, ref in zip(texts, old_texts, refs))
+                self._written[slot] = (texts, refs)
+            off = self.HEADER.size + slot * self.RECORD.size
+            self.RECORD.pack_into(self._mm, off, 1, age, pin, balance, *refs, acc_no.encode('utf-8'))
+            dirty.add(off)
+        if self._strings.tell():
+            self._strings.flush()
+            os.fsync(self._strings.fileno())  # strings must be durable before records point at them
+        if self._used != used:
+            self.HEADER.pack_into(self._mm, 0, self.MAGIC, self.RECORD.size, self._used)
+            dirty.add(0)
+        pages = set()
+        for off in dirty:
+            pages.add(off // self.PAGE)
+            pages.add((off + self.RECORD.size - 1) // self.PAGE)
+        for page in sorted(pages):
+            start = page * self.PAGE
+            length = min(self.PAGE, len(self._mm) - start)
+            self._mm.flush(start, length)
+            self.bytes_written += length
+        if meta is not None:
+            self._write_meta(meta)
+
+    def save(self):
+        st = self.store
+        with st._quiesce():
+            data = {"accounts": [dict(a) for a in st.data["accounts"]],
+                    "staff": list(st.data["staff"]), "manager": st.data["manager"]}
+        self._rebuild(data)
+
+    def compact(self):
+        self.save()
+
+    def export_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.store._dump())
+
+
+class ShardedEngine:
+    """
+    Accounts split over N shard files in SHARD_DIR by crc32(accountNo) % N, staff/manager in
+    their own small file. A commit rewrites only the shards it touched; loads read the shards
+    in parallel. N is fixed per directory (meta.json) and changed offline with rebalance().
+    """
+    META = "meta.json"
+    STAFF = "staff.json"
+    rewrites = True  # a write rewrites every shard it touches
+
+    def __init__(self, store):
+        self.store = store
+        self.dir = Path(store.SHARD_DIR)
+        self.shards = store.SHARDS
+        self._members = []  # shard -> {accountNo: account record}
+        self.bytes_written = 0
+
+    @staticmethod
+    def shard_of(acc_no, shards):
+        return zlib.crc32(acc_no.encode('utf-8')) % shards
+
+    @staticmethod
+    def _shard_file(directory, k):
+        return Path(directory) / f"shard-{k:03d}.json"
+
+    def load(self):
+        st = self.store
+        new = Path(f"{self.dir}.new")
+        if not self.dir.exists() and (new / self.META).exists():
+            os.replace(new, self.dir)  # finish a rebalance that stopped between its two renames
+        if not (self.dir / self.META).exists():
+            # first run: split data.json into shards
+            if Path(st.DB_FILE).exists():
+                _load_json_document(st.DB_FILE, st.data)
+            self._write_all(self.dir, self.shards, st.data)
+            return
+        with open(self.dir / self.META, 'r', encoding='utf-8') as f:
+            self.shards = json.load(f)["shards"]
+        with ThreadPoolExecutor(min(self.shards, os.cpu_count() or 1)) as ex:
+            parts = list(ex.map(self._read_shard, range(self.shards)))
+        st.data["accounts"] = [acc for part in parts for acc in part]
+        with open(self.dir / self.STAFF, 'r', encoding='utf-8') as f:
+            people = json.load(f)
+        st.data["staff"], st.data["manager"] = people["staff"], people["manager"]
+
+    def _read_shard(self, k):
+        with open(self._shard_file(self.dir, k), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def recover(self):
+        # runs once the table is final (after any columnar conversion): map each shard's members
+        self._members = [{} for _ in range(self.shards)]
+        for acc in self.store.data["accounts"]:
+            acc_no = acc.get("accountNo") or acc.get("accountNo.")
+            self._members[self.shard_of(acc_no, self.shards)][acc_no] = acc
+
+    def prepare(self, records):
+        # called under the transaction's row locks, in commit order: track membership, and
+        # name the files that need rewriting
+        dirty = set()
+        for rec in records:
+            if rec[0] == "acc":
+                k = self.shard_of(rec[1], self.shards)
+                self._members[k][rec[1]] = rec[2]
+            elif rec[0] == "acc_del":
+                k = self.shard_of(rec[1], self.shards)
+                self._members[k].pop(rec[1], None)
+            else:
+                k = "staff"
+            dirty.add(k)
+        return list(dirty)
+
+    def write(self, items):
+        st = self.store
+        dirty = set(items)
+        texts = []
+        with st._quiesce():  # serialise only committed values
+            for k in dirty:
+                if k == "staff":
+                    texts.append((self.dir / self.STAFF, self._staff_text(st.data)))
+                else:
+                    texts.append((self._shard_file(self.dir, k),
+                                  json.dumps(list(self._members[k].values()), default=_to_plain)))
+        for path, text in texts:
+            self._replace(path, text)
+
+    @staticmethod
+    def _staff_text(data):
+        return json.dumps({"staff": data["staff"], "manager": data["manager"]}, indent=2)
+
+    def _replace(self, path, text):
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            self.bytes_written += f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _write_all(self, directory, shards, data):
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        parts = [[] for _ in range(shards)]
+        for acc in data["accounts"]:
+            parts[self.shard_of(acc.get("accountNo") or acc.get("accountNo."), shards)].append(acc)
+        for k, part in enumerate(parts):
+            self._replace(self._shard_file(directory, k), json.dumps(part, default=_to_plain))
+        self._replace(Path(directory) / self.STAFF, self._staff_text(data))
+        # meta.json last: a directory without it is an unfinished write
+        self._replace(Path(directory) / self.META, json.dumps({"shards": shards, "hash": "crc32"}))
+
+    def save(self):
+        st = self.store
+        with st._quiesce():
+            data = {"accounts": [dict(a) for a in st.data["accounts"]],
+                    "staff": list(st.data["staff"]), "manager": st.data["manager"]}
+        self._write_all(self.dir, self.shards, data)
+
+    def compact(self):
+        pass  # every write already replaces whole shard files
+
+    @classmethod
+    def rebalance(cls, directory, shards):
+        """
+        Offline: rewrite a shard directory for a new shard count. The new layout is built in
+        <directory>.new and swapped in with two renames; load() finishes an interrupted swap.
+        """
+        directory = Path(directory)
+        with open(directory / cls.META, 'r', encoding='utf-8') as f:
+            old = json.load(f)["shards"]
+        data = {"accounts": []}
+        for k in range(old):
+            with open(cls._shard_file(directory, k), 'r', encoding='utf-8') as f:
+                data["accounts"].extend(json.load(f))
+        with open(directory / cls.STAFF, 'r', encoding='utf-8') as f:
+            data.update(json.load(f))
+        new, retired = Path(f"{directory}.new"), Path(f"{directory}.old")
+        for d in (new, retired):
+            if d.exists():
+                shutil.rmtree(d)
+        writer = cls.__new__(cls)
+        writer.bytes_written = 0
+        writer._write_all(new, shards, data)
+        os.replace(directory, retired)
+        os.replace(new, directory)
+        shutil.rmtree(retired)
+        return len(data["accounts"])
+
+
+#############################
+# Ledger
+#############################
+class Ledger:
+    """
+    Append-only NDJSON file with one line per balance change:
+    {"ts", "acc", "type", "amount", "balance", "op"}. An in-memory index keeps, per account,
+    the entry timestamps (sorted) and file offsets, so statements bisect to a time range
+    and seek straight to their lines instead of reading the whole file.
+    """
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.read_only = read_only  # replicas index the primary's file but never change it
+        self._lock = threading.Lock()
+        self._times = {}  # accountNo -> array of timestamps, ascending
+        self._offsets = {}  # accountNo -> array of file offsets, same order
+        self._size = 0
+        self._load()
+
+    def _load(self):
+        # one pass to rebuild the index; a torn last line (crash mid-append) is cut off
+        if not os.path.exists(self.path):
+            return
+        self.refresh()
+        if not self.read_only and self._size != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(self._size)
+
+    def refresh(self):
+        # indexes complete lines added since the last call (a replica following the primary)
+        if not os.path.exists(self.path):
+            return
+        with self._lock, open(self.path, 'rb') as f:
+            f.seek(self._size)
+            off = self._size
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    e = json.loads(line)
+                except ValueError:
+                    break
+                self._index(e["acc"], e["ts"], off)
+                off += len(line)
+            self._size = off
+
+    def _index(self, acc_no, ts, off):
+        times = self._times.get(acc_no)
+        if times is None:
+            times = self._times[acc_no] = array('d')
+            self._offsets[acc_no] = array('q')
+        times.append(ts)
+        self._offsets[acc_no].append(off)
+
+    def append(self, entries):
+        with self._lock:
+            lines = []
+            for e in entries:
+                times = self._times.get(e["acc"])
+                if times and e["ts"] < times[-1]:
+                    e["ts"] = times[-1]  # keep each account's timestamps sorted for bisect
+                lines.append((e, json.dumps(e, separators=(",", ":")).encode('utf-8') + b"\n"))
+            with open(self.path, 'ab') as f:
+                f.write(b"".join(line for _, line in lines))
+                f.flush()
+                os.fsync(f.fileno())
+            off = self._size
+            for e, line in lines:
+                self._index(e["acc"], e["ts"], off)
+                off += len(line)
+            self._size = off
+
+    def _read(self, acc_no, lo, hi):
+        with self._lock:
+            offsets = self._offsets.get(acc_no, ())[lo:hi]
+        out = []
+        with open(self.path, 'rb') as f:
+            for off in offsets:
+                f.seek(off)
+                out.append(json.loads(f.readline()))
+        return out
+
+    def count(self, acc_no):
+        return len(self._times.get(acc_no, ()))
+
+    def between(self, acc_no, since=None, until=None):
+        """Entries for acc_no with since <= ts <= until (either bound optional), oldest first."""
+        with self._lock:
+            times = self._times.get(acc_no, ())
+            lo = 0 if since is None else bisect_left(times, since)
+            hi = len(times) if until is None else bisect_right(times, until)
+        return self._read(acc_no, lo, hi)
+
+    def latest(self, acc_no, n=10, skip=0):
+        """The n most recent entries after skipping the newest `skip`, newest first."""
+        total = self.count(acc_no)
+        hi = max(0, total - skip)
+        return self._read(acc_no, max(0, hi - n), hi)[::-1]
+
+
+#############################
+# Month-end Processing
+#############################
+def _load_numpy():
+    # optional; month-end falls back to plain arrays without it
+    global _NUMPY
+    if _NUMPY is None:
+        try:
+            import numpy
+            _NUMPY = numpy
+        except Exception:
+            _NUMPY = False
+    return _NUMPY or None
+
+
+_NUMPY = None
+
+
+def _month_end_kernel(balances, rate_bp, fee, min_balance):
+    """
+    Interest and fee for each balance in one slice of the balance column (array 'q' of minor
+    units), returned as two arrays of the same length. Interest is rate_bp basis points of a
+    positive balance, rounded down; the fee hits balances still under min_balance afterwards,
+    capped so it never takes a balance below zero. Module-level so worker processes can run it.
+    """
+    np = _load_numpy()
+    if np is not None:
+        b = np.frombuffer(balances, dtype=np.int64)
+        interest = np.where(b > 0, b * rate_bp // 10000, 0)
+        after = b + interest
+        fees = np.where(after < min_balance, np.minimum(fee, np.maximum(after, 0)), 0)
+        return array('q', interest.astype(np.int64).tobytes()), array('q', fees.astype(np.int64).tobytes())
+    interest = array('q', [x * rate_bp // 10000 if x > 0 else 0 for x in balances])
+    fees = array('q', [min(fee, max(x + i, 0)) if x + i < min_balance else 0
+                       for x, i in zip(balances, interest)])
+    return interest, fees
+
+
+#############################
+# Read Replica
+#############################
+# A replica is a read-only DataStore in another process that follows a journal-mode primary
+# through its files: the snapshot (DB_FILE) plus the journal the primary appends to. Other
+# engines and modes don't leave that trail, so a primary only writes PRIMARY_FILE when it is
+# a journal-mode JsonEngine, and replicas refuse to load or poll without it. Each
+# primary write ends with a ["mark", time] journal line, which is what lag is measured from.
+# Compaction rotates the journal to JOURNAL_FILE.1; a replica finishes that file and carries
+# on with the new journal, so it only reloads from the snapshot when it falls more than one
+# compaction behind (or the primary cut a torn tail off its journal after a crash).
+class ReplicaEngine:
+    """Read-only engine over a journal-mode JsonEngine's files; poll() applies new journal lines."""
+    read_only = True
+    FORMAT = "json-journal"  # what the primary's PRIMARY_FILE has to say
+
+    def __init__(self, store):
+        self.store = store
+        self.journal_id = None  # identity of the journal file being followed
+        self.offset = 0  # journal bytes applied
+        self.behind = 0  # journal bytes seen on disk but not applied yet
+        self.last_mark = None  # time of the newest primary commit applied
+        self.applied = 0
+        self.rotations = 0  # compactions followed without a reload
+        self.bytes_written = 0
+
+    @staticmethod
+    def _journal_id(path):
+        # the id on a journal's header line (the inode for a journal written before headers);
+        # None if there is no journal, "" while its first line is still being written
+        try:
+            with open(path, 'rb') as f:
+                first = f.readline()
+                st = os.fstat(f.fileno())
+        except OSError:
+            return None
+        if not first.endswith(b"\n"):
+            return ""
+        try:
+            rec = json.loads(first)
+        except ValueError:
+            rec = None
+        if isinstance(rec, list) and rec[:1] == ["journal"]:
+            return rec[1]
+        return st.st_dev, st.st_ino
+
+    def _check_primary(self):
+        try:
+            with open(self.store.PRIMARY_FILE, encoding='utf-8') as f:
+                ok = json.load(f).get("format") == self.FORMAT
+        except (OSError, ValueError, AttributeError):
+            ok = False
+        if not ok:
+            raise RuntimeError("The primary is not a journal-mode JSON store (start it with --journal)")
+
+    def load(self):
+        self._check_primary()
+        # journal first: if the primary compacts before the snapshot is read, the rotated
+        # journal is replayed over the newer snapshot, which is harmless (records are idempotent)
+        self.journal_id = self._journal_id(self.store.JOURNAL_FILE) or None
+        if Path(self.store.DB_FILE).exists():
+            _load_json_document(self.store.DB_FILE, self.store.data)
+
+    def recover(self):
+        self.poll()
+
+    def poll(self):
+        """Applies journal lines written since the last poll. False means the replica can't
+        follow on from where it is and has to be rebuilt."""
+        self._check_primary()
+        path = self.store.JOURNAL_FILE
+        current = self._journal_id(path)
+        if current == "":
+            return True  # a new journal's header isn't complete yet: look again next poll
+        if current != self.journal_id:
+            if self.journal_id is not None:
+                # the primary compacted: finish the rotated journal, then follow the new one
+                if self._journal_id(path + ".1") != self.journal_id or not self._replay(path + ".1"):
+                    return False
+                self.rotations += 1
+            self.journal_id, self.offset = current, 0
+        if current is None:
+            self.behind = 0
+            return True
+        return self._replay(path)
+
+    def _replay(self, path):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return False
+        if size < self.offset:
+            return False
+        if size == self.offset:
+            self.behind = 0
+            return True
+        with open(path, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+        chunk = chunk[:chunk.rfind(b"\n") + 1]  # a line still being written waits for next time
+        for line in chunk.splitlines():
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                return False
+            if rec[0] == "mark":
+                self.last_mark = rec[1]
+            else:
+                self.store._apply(rec)
+                self.applied += 1
+        self.offset += len(chunk)
+        self.behind = size - self.offset
+        return True
+
+    def _read_only(self, *args):
+        raise PermissionError("Replica is read-only")
+
+    prepare = write = save = compact = _read_only
+
+
+class Replica:
+    """
+    Keeps a replica DataStore current from a background thread and answers reads from it.
+    Reads and journal replay share one lock, so a query never sees a half-applied batch.
+    """
+    POLL_INTERVAL = 0.2
+    # DataStore methods clients may call; everything else (all writes) is refused
+    READS = ("search", "statement", "last_transactions", "get_user_details", "account_number_usage",
+             "accounts_page")
+
+    def __init__(self, columnar=False):
+        self.columnar = columnar
+        self.lock = threading.RLock()
+        self.resyncs = 0
+        self.error = None  # why the last poll failed, until one succeeds
+        self.store = self._open()
+        self.polled_at = time.time()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _open(self):
+        return DataStore(engine=ReplicaEngine, columnar=self.columnar)
+
+    def refresh(self):
+        with self.lock:
+            current = self.store.engine.poll()
+            self.store.ledger.refresh()
+        if not current:
+            fresh = self._open()  # built outside the lock; reads keep using the old copy meanwhile
+            with self.lock:
+                self.store = fresh
+                self.resyncs += 1
+        self.polled_at = time.time()
+        self.error = None
+
+    def start(self):
+        def loop():
+            while not self._stop.wait(self.POLL_INTERVAL):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    # primary mid-compaction, files briefly missing, or a primary that stopped
+                    # journaling: try again next tick; lag() keeps growing meanwhile
+                    self.error = f"{type(e).__name__}: {e}"
+        self._thread = threading.Thread(target=loop, name="replica-poll", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def call(self, method, *args, **kwargs):
+        if method not in self.READS:
+            raise PermissionError(f"{method} is not available on a replica")
+        with self.lock:
+            result = getattr(self.store, method)(*args, **kwargs)
+            return [dict(r) for r in result] if isinstance(result, list) else result
+
+    def page(self, start=0, count=100):
+        """A slice of the account table, as plain dicts."""
+        with self.lock:
+            accounts = self.store.data["accounts"]
+            return len(accounts), [dict(accounts[i]) for i in range(start, min(start + count, len(accounts)))]
+
+    def lag(self):
+        with self.lock:
+            e = self.store.engine
+            if e.last_mark is None:
+                seconds = None  # unknown until a primary commit has been seen
+            elif e.behind:
+                seconds = time.time() - e.last_mark
+            else:
+                seconds = time.time() - self.polled_at  # caught up as of the last poll
+            return {"seconds": seconds, "bytes_behind": e.behind, "last_commit": e.last_mark,
+                    "records_applied": e.applied, "resyncs": self.resyncs, "rotations": e.rotations,
+                    "accounts": len(self.store.data["accounts"]), "error": self.error}
+
+
+REPLICA_PORT = 6001
+REPLICA_KEY_FILE = "replica.key"
+
+
+def replica_key(create=False):
+    """
+    The secret replica connections authenticate with: $BANK_REPLICA_KEY, or else the random
+    key in REPLICA_KEY_FILE, which serve_replica() creates readable by its owner only.
+    Requests are unpickled by the replica, so whoever holds the key can run code in it.
+    """
+    env = os.environ.get("BANK_REPLICA_KEY")
+    if env:
+        return env.encode()
+    path = Path(REPLICA_KEY_FILE)
+    if create:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+    try:
+        mode = path.stat().st_mode
+    except FileNotFoundError:
+        raise PermissionError("No replica key: set BANK_REPLICA_KEY or start the replica first") from None
+    if os.name == "posix" and mode & 0o077:
+        raise PermissionError(f"{path} must only be readable by its owner (chmod 600)")
+    key = path.read_text(encoding='utf-8').strip()
+    if not key:
+        raise PermissionError(f"{path} is empty")
+    return key.encode()
+
+
+def serve_replica(port=REPLICA_PORT, authkey=None, columnar=False):
+    """Runs a Replica and serves it on localhost until interrupted, one thread per client."""
+    authkey = authkey or replica_key(create=True)
+    replica = Replica(columnar=columnar)
+    replica.start()
+    listener = Listener(("127.0.0.1", port), authkey=authkey)
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    method, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if method == "lag":
+                        result = replica.lag()
+                    elif method == "page":
+                        result = replica.page(*args, **kwargs)
+                    else:
+                        result = replica.call(method, *args, **kwargs)
+                    conn.send((True, result))
+                except Exception as e:
+                    conn.send((False, f"{type(e).__name__}: {e}"))
+
+    print(f"replica serving {len(replica.store.data['accounts'])} accounts on 127.0.0.1:{port}")
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, OSError):
+                continue
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+    finally:
+        listener.close()
+        replica.stop()
+
+
+class ReplicaClient:
+    """Connection to serve_replica(); read methods mirror DataStore's (search, statement, ...)."""
+
+    def __init__(self, port=REPLICA_PORT, authkey=None):
+        self._conn = Client(("127.0.0.1", port), authkey=authkey or replica_key())
+        self._lock = threading.Lock()
+
+    def _call(self, method, *args, **kwargs):
+        with self._lock:
+            self._conn.send((method, args, kwargs))
+            ok, result = self._conn.recv()
+        if not ok:
+            raise RuntimeError(f"Replica: {result}")
+        return result
+
+    def search(self, **kwargs):
+        return self._call("search", **kwargs)
+
+    def statement(self, acc_no, since=None, until=None):
+        return self._call("statement", acc_no, since, until)
+
+    def last_transactions(self, acc_no, n=10, skip=0):
+        return self._call("last_transactions", acc_no, n, skip)
+
+    def page(self, start=0, count=100):
+        return self._call("page", start, count)
+
+    def lag(self):
+        return self._call("lag")
+
+    def close(self):
+        self._conn.close()
+
+
+#############################
+# Sessions
+#############################
+class SessionTable:
+    """
+    Logged-in sessions, keyed by a hash of their token so the table never holds usable tokens.
+    Sessions expire after TTL seconds idle; when MAX are open the least recently used goes.
+    """
+    TTL = 15 * 60
+    MAX = 1024
+
+    def __init__(self, ttl=None, max_sessions=None):
+        self.ttl = self.TTL if ttl is None else ttl
+        self.max = self.MAX if max_sessions is None else max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # sha256(token) -> [kind, subject, expires], oldest use first
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def issue(self, kind, subject):
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._sessions[self._key(token)] = [kind, subject, time.monotonic() + self.ttl]
+            while len(self._sessions) > self.max:
+                self._sessions.popitem(last=False)
+        return token
+
+    def check(self, token):
+        """(kind, subject) for a live session, sliding its expiry; PermissionError otherwise."""
+        key = self._key(token) if isinstance(token, str) else None
+        with self._lock:
+            s = self._sessions.get(key)
+            now = time.monotonic()
+            if s is None or s[2] < now:
+                self._sessions.pop(key, None)
+                raise PermissionError("Session expired, please log in again")
+            s[2] = now + self.ttl
+            self._sessions.move_to_end(key)
+            return s[0], s[1]
+
+    def revoke(self, token):
+        with self._lock:
+            self._sessions.pop(self._key(token), None)
+
+    def revoke_subject(self, kind, subject):
+        # e.g. a removed staff member or a closed account
+        with self._lock:
+            for key in [k for k, s in self._sessions.items() if s[0] == kind and s[1] == subject]:
+                del self._sessions[key]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+#############################
+# Instrumentation
+#############################
+class Histogram:
+    """Count/total/max plus power-of-two buckets: bucket i holds values below 2**i."""
+    __slots__ = ("count", "errors", "total", "max", "buckets")
+    BUCKETS = 40
+
+    def __init__(self):
+        self.count = self.errors = self.total = self.max = 0
+        self.buckets = [0] * self.BUCKETS
+
+    def add(self, value, error=False):
+        self.count += 1
+        self.errors += error
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.buckets[min(int(value).bit_length(), self.BUCKETS - 1)] += 1
+
+    def quantile(self, q):
+        # upper edge of the bucket holding the q-th value, capped at the observed max
+        want = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= want:
+                return min(2 ** i, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count, "errors": self.errors,
+            "mean": round(self.total / self.count, 1) if self.count else 0,
+            "p50": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99),
+            "max": round(self.max, 1),
+            "buckets": {f"<{2 ** i}": n for i, n in enumerate(self.buckets) if n},
+        }
+
+
+class Metrics:
+    """
+    Collected by DataStore.enable_metrics(): latency (microseconds) of every instrumented
+    method, bytes handed to the OS per write/save, and how many rows each lookup looked at.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.calls = {}  # method -> Histogram of latencies
+        self.bytes = {}  # write method -> Histogram of bytes per call
+        self.scans = {}  # lookup kind ("acc_no", "index", "table") -> Histogram of rows examined
+
+    def _add(self, table, key, value, error=False):
+        with self._lock:
+            h = table.get(key)
+            if h is None:
+                h = table[key] = Histogram()
+            h.add(value, error)
+
+    def wrap(self, name, fn, count_bytes=False):
+        clock = time.perf_counter
+        engine = self.engine
+
+        def timed(*args, **kwargs):
+            before = engine.bytes_written if count_bytes else 0
+            t = clock()
+            error = True
+            try:
+                result = fn(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                self._add(self.calls, name, (clock() - t) * 1e6, error)
+                if count_bytes:
+                    self._add(self.bytes, name, engine.bytes_written - before)
+
+        timed.__name__ = name
+        timed.__doc__ = fn.__doc__
+        return timed
+
+    def scan(self, kind, rows):
+        self._add(self.scans, kind, rows)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "started": self.started,
+                "uptime_s": round(time.time() - self.started, 1),
+                "engine": type(self.engine).__name__,
+                "engine_bytes_written": self.engine.bytes_written,
+                "latency_us": {k: h.snapshot() for k, h in sorted(self.calls.items())},
+                "bytes_per_write": {k: h.snapshot() for k, h in sorted(self.bytes.items())},
+                "scan_rows": {k: h.snapshot() for k, h in sorted(self.scans.items())},
+            }
+
+
+#############################
+# Data Store
+#############################
+class DataStore:
+    DB_FILE = 'data.json'
+    JOURNAL_FILE = 'data.journal'
+    SQLITE_FILE = 'data.db'
+    MMAP_FILE = 'data.bin'
+    SNAPSHOT_FILE = 'data.snap'
+    LEDGER_FILE = 'ledger.ndjson'
+    SHARD_DIR = 'data.shards'
+    PRIMARY_FILE = 'data.primary'  # present only while the files can be followed by a replica
+    SHARDS = 8  # shard count for a new SHARD_DIR; existing ones keep theirs (see rebalance)
+    ENGINES = {"json": JsonEngine, "snapshot": SnapshotEngine, "sqlite": SqliteEngine, "mmap": MmapEngine,
+               "sharded": ShardedEngine}
+    COMPACT_EVERY = 1000  # journal records before they are folded back into DB_FILE
+    GROUP_COMMIT_WINDOW = 0.005  # seconds a group-commit leader waits for other committers
+    MAX_PENDING = 1000  # background mode: commits allowed to wait for the disk before callers block
+    RETRY_DELAY = 1.0  # seconds between attempts after a failed write
+    CLOSE_RETRIES = 3  # failed attempts close() sits through before giving up on pending writes
+    LOCK_STRIPES = 64  # account locks are shared by hash(accountNo) % LOCK_STRIPES
+    LOCK_TIMEOUT = 10.0  # seconds to wait for a row lock before the transaction gives up
+    TRANSFER_CHUNK = 500  # transfers applied per transaction by transfer_batch
+    IMPORT_CHUNK = 1000  # accounts created per transaction by import_accounts
+    CURSOR_PAGE = 1000  # default accounts_page size
+    EXPORT_FIELDS = ("accountNo", "name", "age", "email", "pin", "balance")
+    MONTH_END_PARALLEL_MIN = 500_000  # accounts before month_end() spreads the arithmetic over processes
+    # wrapped by enable_metrics(); the second group are the internal stages a call spends time in
+    INSTRUMENTED = ("create_account", "update_account", "delete_account", "deposit", "withdraw", "search",
+                    "add_staff", "edit_staff", "remove_staff", "check_manager_login", "check_staff_login",
+                    "get_user_details", "login", "reset_pin", "column", "compact", "statement", "last_transactions",
+                    "month_end", "transfer", "transfer_batch", "import_accounts",
+                    "accounts_page", "export_accounts",
+                    "_find_account", "_dump", "_flush", "_write", "_save")
+    BYTES_INSTRUMENTED = ("_write", "_save", "compact")
+
+    def __init__(self, journal=False, group_commit=False, columnar=False,
+                 background=False, flush_on_exit=True, engine="json"):
+        # engine: "json", "sqlite", "mmap", "sharded" or a callable taking the store and returning an engine
+        # journal=True: mutations append one line to JOURNAL_FILE instead of rewriting DB_FILE
+        # group_commit=True: commits from concurrent threads arriving together share one write
+        # columnar=True: accounts live in typed arrays (ColumnarAccounts) instead of dicts
+        # background=True: a worker thread does the disk writes, commits return at once
+        self.journal = journal
+        self.columnar = columnar
+        self.group_commit = group_commit
+        self.background = background
+        self.flush_on_exit = flush_on_exit
+        self.persist_error = None  # last write failure, cleared once a write succeeds
+        self.lost_writes = 0  # commits close() had to give up on because writes kept failing
+        self.metrics = None  # Metrics while enable_metrics() is on
+        self.operator = None  # who ledger entries are credited to unless a call names someone
+        self._on_scan = None
+        # Locking: a transaction holds the stripe locks of the accounts it touches (and the
+        # staff lock for staff/manager changes) until it commits or rolls back. Changes to the
+        # accounts list and lookup indexes take _struct_lock only for the moment they happen.
+        # Whole-store snapshots close the _gate and wait for running transactions to finish.
+        self._stripes = [threading.RLock() for _ in range(self.LOCK_STRIPES)]
+        self._staff_lock = threading.RLock()
+        self._struct_lock = threading.RLock()
+        self._io_lock = threading.RLock()  # serialises engine writes
+        self._gate = threading.Condition()
+        self._active = 0  # transactions in progress
+        self._quiescing = False
+        self._txn = threading.local()
+        self._gc_cond = threading.Condition()
+        self._gc_pending = []  # engine items (journal lines, SQL rows) not yet on disk
+        self._gc_ledger = []  # ledger entries committed with them
+        self._gc_seq = 0  # commits queued
+        self._gc_done = 0  # commits durable
+        self._gc_tried = 0  # commits a write has been attempted for, durable or not
+        self._gc_leader = False
+        self.data = {
+            "accounts": [],
+            "staff": [],
+            "manager": {"id": "admin", "password": "1234"}
+        }
+        self._index = {}  # accountNo -> account record, kept in sync by every mutation
+        self._staff = {}  # staff id -> staff record
+        self._orders = {}  # cursor order -> sorted keys, dropped whenever the index changes
+        self.sessions = SessionTable()
+        self._numbers = AccountNumbers()
+        self._text_indexes = {}  # field -> NgramIndex, built by the first search on that field
+        self._subscribers = []
+        self.engine = (self.ENGINES[engine] if isinstance(engine, str) else engine)(self)
+        self._load_or_init()
+        if not getattr(self.engine, "read_only", False):
+            self._mark_primary()
+        self.ledger = Ledger(self.LEDGER_FILE, read_only=getattr(self.engine, "read_only", False))
+        self._worker = None
+        self._closing = False
+        if background:
+            self._worker = threading.Thread(target=self._persist_loop, name="DataStore-persist", daemon=True)
+            self._worker.start()
+
+    def _load_or_init(self):
+        self.engine.load()
+        if self.columnar:
+            self.data["accounts"] = ColumnarAccounts(self.data["accounts"])
+        self._reindex()
+        self.engine.recover()
+
+    def _mark_primary(self):
+        # replicas replay DB_FILE plus the journal, a trail only a journal-mode JsonEngine
+        # leaves; any other primary removes the marker so they refuse to follow stale files
+        if self.journal and type(self.engine) is JsonEngine:
+            tmp = self.PRIMARY_FILE + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({"format": ReplicaEngine.FORMAT}, f)
+            os.replace(tmp, self.PRIMARY_FILE)
+        else:
+            try:
+                os.remove(self.PRIMARY_FILE)
+            except FileNotFoundError:
+                pass
+
+    def _dump(self):
+        # whole-store compact JSON, taken while no transaction is half-way through
+        with self._quiesce():
+            return json.dumps(self.data, separators=(",", ":"), default=_to_plain)
+
+    def _apply(self, rec):
+        # replays one journal record; every record is an idempotent upsert or delete
+        kind = rec[0]
+        if kind == "acc":
+            acc = self._index.get(rec[1])
+            if acc is None:
+                self._index_account(self._add_account(rec[2]))
+            else:
+                self._unindex_account(acc)
+                acc.clear()
+                acc.update(rec[2])
+                self._index_account(acc)
+        elif kind == "acc_del":
+            acc = self._index.get(rec[1])
+            if acc is not None:
+                self._unindex_account(acc)
+                self.data["accounts"].remove(acc)
+                self._deleted(acc)
+        elif kind == "staff":
+            s = self._staff.get(rec[1]["id"])
+            if s is not None:
+                s.update(rec[1])
+            else:
+                self.data["staff"].append(rec[1])
+                self._staff[rec[1]["id"]] = rec[1]
+        elif kind == "staff_del":
+            s = self._staff.pop(rec[1], None)
+            if s is not None:
+                self.data["staff"].remove(s)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Batches every mutation made inside the block into one durable commit.
+        On exception the in-memory changes are undone and nothing is written.
+        Nested blocks join the outermost transaction.
+        """
+        t = self._txn
+        if getattr(t, "records", None) is not None:
+            yield self
+            return
+        with self._gate:
+            while self._quiescing:
+                self._gate.wait()
+            self._active += 1
+        t.records, t.undo, t.events, t.held, t.ledger, t.deleted = [], [], [], [], [], []
+        ticket = None
+        try:
+            yield self
+            if t.records:
+                ticket = self._enqueue(t.records, t.ledger)
+            events = t.events
+        except BaseException:
+            for undo in reversed(t.undo):
+                undo()
+            raise
+        finally:
+            if self.columnar and t.deleted:
+                # only this transaction's deletes: another one may still roll back into its own
+                with self._struct_lock:
+                    self.data["accounts"].recycle([row.slot for row in t.deleted])
+            for lock in reversed(t.held):
+                lock.release()
+            t.records = t.undo = t.events = t.held = t.ledger = t.deleted = None
+            with self._gate:
+                self._active -= 1
+                self._gate.notify_all()
+        if ticket is not None:
+            if self.background:
+                self._wait_room()
+            elif not getattr(t, "defer_flush", False):  # import_accounts flushes in groups
+                self._flush(ticket)
+        for callback in list(self._subscribers):
+            for event in events:
+                callback(*event)
+
+    def _hold(self, lock):
+        # acquire lock for the rest of the current transaction (two-phase locking)
+        t = self._txn
+        if any(lock is held for held in t.held):
+            return
+        if not lock.acquire(timeout=self.LOCK_TIMEOUT):
+            raise TimeoutError("Account is busy, please try again")
+        t.held.append(lock)
+
+    def _lock_account(self, acc_no):
+        self._hold(self._stripes[hash(acc_no) % self.LOCK_STRIPES])
+
+    def _lock_accounts(self, acc_nos):
+        # several rows at once: stripes are always taken in ascending order, so two
+        # multi-account transactions can never each hold a lock the other is waiting for
+        for i in sorted({hash(a) % self.LOCK_STRIPES for a in acc_nos}):
+            self._hold(self._stripes[i])
+
+    def _lock_staff(self):
+        self._hold(self._staff_lock)
+
+    @contextmanager
+    def _quiesce(self):
+        # pause new transactions and wait for running ones, for a consistent whole-store read
+        mine = 1 if getattr(self._txn, "records", None) is not None else 0
+        with self._gate:
+            while self._quiescing:
+                self._gate.wait()
+            self._quiescing = True
+            while self._active > mine:
+                self._gate.wait()
+        try:
+            yield
+        finally:
+            with self._gate:
+                self._quiescing = False
+                self._gate.notify_all()
+
+    def _log(self, *records, undo=None):
+        self._txn.records.extend(records)
+        if undo is not None:
+            self._txn.undo.append(undo)
+
+    def _post(self, acc_no, kind, amount, balance, operator=None):
+        # ledger entry, written together with the transaction's records once it commits
+        self._txn.ledger.append({"ts": time.time(), "acc": acc_no, "type": kind, "amount": amount,
+                                 "balance": balance, "op": operator or self.operator})
+
+    def _emit(self, event, acc_no, fields=None):
+        # published to subscribers only once the transaction has committed
+        self._txn.events.append((event, acc_no, fields or {}))
+
+    def subscribe(self, callback):
+        """Call callback(event, acc_no, fields) after each commit; event is created/updated/deleted."""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def _touch(self, row, account=False):
+        # remember a record's current values so the transaction can roll it back;
+        # account=True also re-syncs the lookup indexes when the values are restored
+        saved = dict(row)
+
+        def undo():
+            if account:
+                renamed = self._normalize_accno(row)
+                self._unindex_account(row)
+            row.clear()
+            row.update(saved)
+            if account:
+                self._index_account(row, renamed_from=renamed)
+        self._txn.undo.append(undo)
+
+    def _enqueue(self, records, entries=()):
+        # called while the transaction still holds its row locks, so conflicting commits
+        # are queued in the same order they were applied in memory
+        items = self.engine.prepare(records)
+        with self._gc_cond:
+            self._gc_pending.extend(items)
+            self._gc_ledger.extend(entries)
+            self._gc_seq += 1
+            self._gc_cond.notify_all()  # wakes the background worker
+            return self._gc_seq
+
+    def _wait_room(self):
+        # back-pressure: the background queue is bounded
+        with self._gc_cond:
+            while self._gc_seq - self._gc_done > self.MAX_PENDING and self._worker.is_alive():
+                self._gc_cond.wait()
+
+    def _persist_loop(self):
+        failures = 0
+        while True:
+            with self._gc_cond:
+                while self._gc_done == self._gc_seq and not self._closing:
+                    self._gc_cond.wait()
+                if self._gc_done == self._gc_seq:
+                    return
+                batch, upto = self._take_batch()
+            try:
+                self._write(batch)
+            except Exception as e:
+                failures += 1
+                with self._gc_cond:
+                    self.persist_error = e
+                    if self._closing and failures >= self.CLOSE_RETRIES:
+                        # the disk is not coming back in time; let close() return and say so
+                        self.lost_writes = self._gc_seq - self._gc_done
+                        self._gc_done = self._gc_seq
+                        self._gc_cond.notify_all()
+                        return
+                    self._requeue(batch)
+                time.sleep(self.RETRY_DELAY)
+                continue
+            failures = 0
+            with self._gc_cond:
+                self._gc_done = upto
+                self.persist_error = None
+                self._gc_cond.notify_all()
+
+    def commit_seq(self):
+        """Number of the latest commit; it is on disk once durable_seq() reaches it."""
+        return self._gc_seq
+
+    def durable_seq(self):
+        return self._gc_done
+
+    def pending_writes(self):
+        return self._gc_seq - self._gc_done
+
+    def wait_durable(self, timeout=None):
+        with self._gc_cond:
+            return self._gc_cond.wait_for(lambda: self._gc_done == self._gc_seq, timeout)
+
+    def close(self, flush=None):
+        """
+        Stops the background worker; with flush (default flush_on_exit) pending writes land
+        first. Returns how many commits never reached the disk because writes kept failing.
+        """
+        if self._worker is None:
+            # synchronous mode: commits whose write failed are still queued, try them again
+            for attempt in range(self.CLOSE_RETRIES):
+                if self._gc_done == self._gc_seq:
+                    break
+                if attempt:
+                    time.sleep(self.RETRY_DELAY)
+                with self._gc_cond:
+                    self._gc_tried = self._gc_done
+                self._flush(self._gc_seq)
+            if self._gc_done != self._gc_seq:
+                self.lost_writes = self._gc_seq - self._gc_done
+                with self._gc_cond:
+                    self._gc_pending, self._gc_ledger = [], []
+                    self._gc_done = self._gc_tried = self._gc_seq
+                print(f"{self.lost_writes} commits were not saved: {self.persist_error}", file=sys.stderr)
+            return self.lost_writes
+        if flush is None:
+            flush = self.flush_on_exit
+        with self._gc_cond:
+            if not flush:
+                self._take_batch()
+                self._gc_done = self._gc_seq
+            self._closing = True
+            self._gc_cond.notify_all()
+        self._worker.join()
+        self._worker = None
+        self.background = False  # anything committed after close() is written synchronously
+        if self.lost_writes:
+            print(f"{self.lost_writes} commits were not saved: {self.persist_error}", file=sys.stderr)
+        return self.lost_writes
+
+    def _flush(self, ticket):
+        # one caller becomes the leader and writes everything queued so far;
+        # in group_commit mode it first waits a short window for others to join.
+        # The commits are already applied and their locks released, so a failed write
+        # doesn't fail them: they stay queued for the next flush (or close) and
+        # persist_error says why, as in background mode
+        with self._gc_cond:
+            while self._gc_tried < ticket:
+                if self._gc_leader:
+                    self._gc_cond.wait()
+                    continue
+                self._gc_leader = True
+                self._gc_cond.release()
+                try:
+                    if self.group_commit:
+                        time.sleep(self.GROUP_COMMIT_WINDOW)
+                    with self._gc_cond:
+                        batch, upto = self._take_batch()
+                    try:
+                        self._write(batch)
+                    except Exception as e:
+                        with self._gc_cond:
+                            self._requeue(batch)  # next leader retries
+                            self._gc_tried = max(self._gc_tried, upto)
+                            self.persist_error = e
+                        continue
+                    except BaseException:
+                        with self._gc_cond:
+                            self._requeue(batch)
+                        raise
+                    with self._gc_cond:
+                        self._gc_done = upto
+                        self._gc_tried = max(self._gc_tried, upto)
+                        self.persist_error = None
+                finally:
+                    self._gc_cond.acquire()
+                    self._gc_leader = False
+                    self._gc_cond.notify_all()
+
+    def _take_batch(self):
+        # caller holds _gc_cond; everything queued so far, and the commit number it reaches
+        batch = (self._gc_pending, self._gc_ledger)
+        self._gc_pending, self._gc_ledger = [], []
+        return batch, self._gc_seq
+
+    def _requeue(self, batch):
+        items, entries = batch
+        self._gc_pending[:0] = items
+        self._gc_ledger[:0] = entries
+
+    def _write(self, batch):
+        # the ledger goes last: engine records are idempotent, so a retry after a
+        # failure can rewrite them without posting any ledger entry twice
+        items, entries = batch
+        with self._io_lock:
+            self.engine.write(items)
+            if entries:
+                self.ledger.append(entries)
+
+    def enable_metrics(self):
+        """
+        Starts collecting Metrics by wrapping the INSTRUMENTED methods on this instance.
+        While disabled nothing is wrapped, so the only cost left is one check per lookup.
+        """
+        if self.metrics is None:
+            m = Metrics(self.engine)
+            for name in self.INSTRUMENTED:
+                setattr(self, name, m.wrap(name, getattr(self, name), name in self.BYTES_INSTRUMENTED))
+            self._on_scan = m.scan
+            self.metrics = m
+        return self.metrics
+
+    def disable_metrics(self):
+        for name in self.INSTRUMENTED:
+            self.__dict__.pop(name, None)
+        self._on_scan = None
+        self.metrics = None
+
+    def metrics_snapshot(self):
+        m = self.metrics
+        return None if m is None else m.snapshot()
+
+    def dump_metrics(self, path):
+        snap = self.metrics_snapshot()
+        if snap is None:
+            raise ValueError("Metrics are not enabled")
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(snap, f, indent=2)
+        os.replace(tmp, path)
+
+    def compact(self):
+        # journal: fold the log into a fresh snapshot; sqlite: checkpoint the WAL;
+        # mmap: rewrite the record and string files without dead entries
+        with self._io_lock:
+            self.engine.compact()
+
+    def _save(self):
+        with self._io_lock:
+            self.engine.save()
+
+    def _claim_account_no(self):
+        # a fresh number, row-locked and confirmed unused
+        while True:
+            acc_no = self._numbers.allocate()
+            try:
+                self._lock_account(acc_no)
+            except BaseException:
+                self._numbers.release(acc_no)
+                raise
+            if acc_no not in self._index:  # an in-flight rename may have briefly released it
+                return acc_no
+
+    def reserve_account_numbers(self, count):
+        """Pre-allocates a block of numbers for create_account(acc_no=...)."""
+        return self._numbers.reserve(count)
+
+    def release_account_numbers(self, numbers):
+        # hands back reserved numbers that never got an account
+        with self._struct_lock:
+            for n in numbers:
+                if n not in self._index:
+                    self._numbers.release(n)
+
+    def account_number_usage(self):
+        return self._numbers.usage()
+
+    def _normalize_accno(self, acc):
+        return acc.get("accountNo") or acc.get("accountNo.")  # legacy key support
+
+    def _reindex(self):
+        self._index = {}
+        self._numbers = AccountNumbers()
+        self._text_indexes = {}
+        for acc in self.data["accounts"]:
+            self._index_account(acc)
+        self._staff = {s["id"]: s for s in self.data["staff"]}
+        self._orders = {}
+
+    def _index_account(self, acc, renamed_from=None):
+        accno = self._normalize_accno(acc)
+        if accno is None:
+            return
+        with self._struct_lock:
+            if self._index.setdefault(accno, acc) is acc:  # first record wins, same as the old scan
+                self._orders.clear()
+                self._numbers.mark(accno)
+                for field, ix in self._text_indexes.items():
+                    if renamed_from is not None and renamed_from != accno:
+                        ix.rename(renamed_from, accno)  # the row keeps its place in the table
+                    ix.add(accno, acc.get(field, ""))
+
+    def _unindex_account(self, acc):
+        accno = self._normalize_accno(acc)
+        with self._struct_lock:
+            if accno is not None and self._index.get(accno) is acc:
+                del self._index[accno]
+                self._orders.clear()
+                self._numbers.release(accno)
+                for ix in self._text_indexes.values():
+                    ix.remove(accno)
+
+    def _text_index(self, field):
+        # substring indexes cost far more memory than the rows, so each is only built
+        # (in table order) when a search first needs it; callers hold _struct_lock
+        ix = self._text_indexes.get(field)
+        if ix is None:
+            ix = NgramIndex()
+            index = self._index
+            for acc in self.data["accounts"]:
+                accno = self._normalize_accno(acc)
+                if accno is not None and index.get(accno) is acc:
+                    ix.add(accno, acc.get(field, ""))
+            self._text_indexes[field] = ix
+        return ix
+
+    def _order_keys(self, order):
+        # sorted cursor keys, built on first use after the index last changed
+        with self._struct_lock:
+            keys = self._orders.get(order)
+            if keys is None:
+                if order == "accountNo":
+                    keys = sorted(self._index)
+                elif order == "name":
+                    keys = sorted((str(acc.get("name", "")).casefold(), no) for no, acc in self._index.items())
+                else:
+                    raise ValueError(f"Unknown order: {order}")
+                self._orders[order] = keys
+            return keys
+
+    def accounts_page(self, order="accountNo", after=None, limit=None):
+        """
+        Up to `limit` accounts (copies) ordered by "accountNo" or "name", starting after the
+        continuation key `after`. Returns (rows, next key), the key being None at the end.
+        Accounts created or deleted between pages show up or drop out in their place.
+        """
+        limit = limit or self.CURSOR_PAGE
+        keys = self._order_keys(order)
+        if after is not None and order == "name":
+            after = tuple(after)
+        i = bisect_right(keys, after) if after is not None else 0
+        rows, last = [], None
+        while i < len(keys) and len(rows) < limit:
+            key = keys[i]
+            i += 1
+            acc = self._index.get(key[1] if order == "name" else key)
+            if acc is None:
+                continue  # deleted since the order was built
+            rows.append(dict(acc))
+            last = key
+        if i >= len(keys):
+            return rows, None
+        return rows, list(last) if order == "name" else last
+
+    def iter_accounts(self, order="accountNo", after=None, page_size=None):
+        """Generator over account copies, fetched one accounts_page at a time."""
+        while True:
+            rows, after = self.accounts_page(order, after, page_size)
+            yield from rows
+            if after is None:
+                return
+
+    def export_accounts(self, path, fmt=None, order="accountNo"):
+        """
+        Streams every account to a CSV or NDJSON file (by suffix unless fmt is given) in
+        EXPORT_FIELDS columns. import_accounts(restore=True) loads the file back with the same
+        numbers and balances. Returns the row count.
+        """
+        path = Path(path)
+        fmt = fmt or ("csv" if path.suffix.lower() == ".csv" else "ndjson")
+        tmp = path.with_name(path.name + ".tmp")
+        count = 0
+        with open(tmp, "w", newline="" if fmt == "csv" else None, encoding="utf-8") as f:
+            out = csv.writer(f) if fmt == "csv" else None
+            if out:
+                out.writerow(self.EXPORT_FIELDS)
+            after = None
+            while True:
+                rows, after = self.accounts_page(order, after)
+                for acc in rows:
+                    acc["accountNo"] = self._normalize_accno(acc)
+                values = [[acc.get(k) for k in self.EXPORT_FIELDS] for acc in rows]
+                if out:
+                    out.writerows(values)
+                else:
+                    f.writelines(json.dumps(dict(zip(self.EXPORT_FIELDS, v))) + "\n" for v in values)
+                count += len(rows)
+                if after is None:
+                    break
+        os.replace(tmp, path)
+        return count
+
+    def _find_account(self, *, acc_no=None, pin=None, name=None, email=None, prefix=False):
+        if acc_no is not None:
+            # exact account lookups hit the index instead of scanning the table
+            acc = self._index.get(acc_no)
+            candidates = [acc] if acc is not None else []
+            kind = "acc_no"
+        elif name is not None or email is not None:
+            # substring/prefix lookups only touch rows the trigram indexes point at
+            with self._struct_lock:
+                keys = None
+                if name is not None:
+                    keys = self._text_index("name").find(name, prefix)
+                if email is not None:
+                    found = self._text_index("email").find(email, prefix)
+                    if keys is None:
+                        keys = found
+                    else:
+                        found = set(found)
+                        keys = [k for k in keys if k in found]
+                candidates = [self._index[k] for k in keys]
+            name = email = None
+            kind = "index"
+        else:
+            candidates = self.data["accounts"]
+            kind = "table"
+        if self._on_scan is not None:
+            self._on_scan(kind, len(candidates))
+        res = []
+        for acc in candidates:
+            ok = True
+            if pin is not None and acc.get("pin") != pin:
+                ok = False
+            if name is not None and not self._matches(acc.get("name", ""), name, prefix):
+                ok = False
+            if email is not None and not self._matches(acc.get("email", ""), email, prefix):
+                ok = False
+            if ok:
+                res.append(acc)
+        return res
+
+    @staticmethod
+    def _matches(text, q, prefix):
+        text, q = str(text).lower(), q.lower()
+        return text.startswith(q) if prefix else q in text
+
+    @staticmethod
+    def _check_account(name, age, email, pin):
+        # the rules every new account must pass; returns the normalised values
+        if not name or not email:
+            raise ValueError("Name/Email required")
+        age = int(age)
+        pin = int(pin)
+        if age < 18:
+            raise ValueError("Age must be 18+")
+        if len(str(pin)) != 4:
+            raise ValueError("PIN must be 4 digits")
+        return name, age, email, pin
+
+    def create_account(self, name, age, email, pin, acc_no=None):
+        name, age, email, pin = self._check_account(name, age, email, pin)
+        with self.transaction():
+            if acc_no is None:
+                acc_no = self._claim_account_no()
+            else:
+                self._lock_account(acc_no)
+                if acc_no in self._index:
+                    raise ValueError("Account number already in use")
+            acc = self._add_account({"name": name, "age": age, "email": email, "pin": pin,
+                                     "accountNo": acc_no, "balance": 0})
+            self._index_account(acc)
+            self._log(["acc", acc_no, acc], undo=lambda: self._drop_account(acc))
+            self._emit("created", acc_no, dict(acc))
+        return acc
+
+    @staticmethod
+    def _read_rows(f, fmt):
+        # (line number, row dict or None, raw text) from an open CSV or NDJSON file
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row, None
+            return
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield n, row if isinstance(row, dict) else None, line.rstrip("\n")
+
+    def import_accounts(self, path, fmt=None, rejects=None, chunk=None, restore=False):
+        """
+        Creates accounts from a CSV (with a header row) or NDJSON file of name/age/email/pin,
+        streaming it in fixed chunks with one transaction per chunk. When the engine rewrites
+        whole files on commit (and writes are synchronous), chunks are written out in groups
+        that grow with the book, so I/O stays linear; a crash loses at most the latest group.
+        Rows failing create_account's checks go to `rejects` (default <path>.rejects.ndjson)
+        with the reason.
+        Without restore every row gets a new number and a zero balance; with restore=True
+        (for export_accounts files) rows keep their accountNo and balance, which is posted
+        as an "opening" ledger entry, and numbers already in use are rejected.
+        Returns {"imported": n, "rejected": n, "rejects": path or None}.
+        """
+        path = Path(path)
+        fmt = fmt or ("csv" if path.suffix.lower() == ".csv" else "ndjson")
+        rejects = Path(rejects) if rejects else path.with_name(path.name + ".rejects.ndjson")
+        chunk = chunk or self.IMPORT_CHUNK
+        imported = rejected = 0
+        bad = None
+        # commits rewrite the files they touch: write once the unwritten chunks add up to
+        # the rest of the book instead of after every chunk
+        t = self._txn
+        defer = not self.background and getattr(self.engine, "rewrites", False)
+        unwritten = 0
+        with open(path, newline="" if fmt == "csv" else None, encoding="utf-8") as f:
+            rows = self._read_rows(f, fmt)
+            t.defer_flush = defer
+            try:
+                while True:
+                    batch = []
+                    for line, row, raw in rows:
+                        try:
+                            if row is None:
+                                raise ValueError("Malformed row")
+                            values = self._check_account(row.get("name"), row.get("age"),
+                                                         row.get("email"), row.get("pin"))
+                            if restore:
+                                values += self._check_restore(row)
+                            batch.append((line, row, values))
+                        except (TypeError, ValueError) as e:
+                            if bad is None:
+                                bad = open(rejects, "w", encoding="utf-8")
+                            bad.write(json.dumps({"line": line, "row": row if row is not None else raw,
+                                                  "error": str(e)}) + "\n")
+                            rejected += 1
+                            continue
+                        if len(batch) == chunk:
+                            break
+                    if not batch:
+                        break
+                    taken = self._import_batch([values for _, _, values in batch], restore)
+                    for i in taken:
+                        line, row, _ = batch[i]
+                        if bad is None:
+                            bad = open(rejects, "w", encoding="utf-8")
+                        bad.write(json.dumps({"line": line, "row": row,
+                                              "error": "Account number already in use"}) + "\n")
+                    rejected += len(taken)
+                    imported += len(batch) - len(taken)
+                    unwritten += len(batch) - len(taken)
+                    if defer and 2 * unwritten >= len(self.data["accounts"]):
+                        self._flush(self._gc_seq)
+                        unwritten = 0
+            finally:
+                t.defer_flush = False
+                if defer:
+                    self._flush(self._gc_seq)
+                if bad is not None:
+                    bad.close()
+        return {"imported": imported, "rejected": rejected, "rejects": str(rejects) if rejected else None}
+
+    @staticmethod
+    def _check_restore(row):
+        # the exported number and balance a restored row keeps
+        acc_no = row.get("accountNo")
+        if not isinstance(acc_no, str) or not acc_no.strip():
+            raise ValueError("accountNo required")
+        balance = int(row.get("balance"))
+        if balance < 0:
+            raise ValueError("Balance cannot be negative")
+        return acc_no.strip(), balance
+
+    def _import_batch(self, batch, restore=False):
+        # adds one chunk in a single transaction; returns the positions skipped because
+        # their (restored) number was already in use
+        if restore:
+            numbers = [values[4] for values in batch]
+        else:
+            numbers = self.reserve_account_numbers(len(batch))
+        taken = []
+        try:
+            with self.transaction():
+                self._lock_accounts(numbers)
+                for i, (acc_no, values) in enumerate(zip(numbers, batch)):
+                    name, age, email, pin = values[:4]
+                    balance = values[5] if restore else 0
+                    if restore and acc_no in self._index:
+                        taken.append(i)
+                        continue
+                    acc = self._add_account({"name": name, "age": age, "email": email, "pin": pin,
+                                             "accountNo": acc_no, "balance": balance})
+                    self._index_account(acc)
+                    self._log(["acc", acc_no, acc], undo=lambda acc=acc: self._drop_account(acc))
+                    if balance:
+                        self._post(acc_no, "opening", balance, balance)
+                    self._emit("created", acc_no, dict(acc))
+        except BaseException:
+            if not restore:
+                self.release_account_numbers(numbers)
+            raise
+        return taken
+
+    def _add_account(self, acc):
+        # returns the stored record, which is a row view (not acc itself) in columnar mode
+        with self._struct_lock:
+            accounts = self.data["accounts"]
+            accounts.append(acc)
+            row = accounts[-1]
+            accno = self._normalize_accno(row)
+            for ix in self._text_indexes.values():
+                ix.forget(accno)  # a deleted account's number reused: the row is at the end now
+            return row
+
+    def column(self, field):
+        """All values of a numeric account field, without building per-row dicts when columnar."""
+        accounts = self.data["accounts"]
+        if isinstance(accounts, ColumnarAccounts):
+            return accounts.column(field)
+        return (acc.get(field, 0) for acc in accounts)
+
+    def _drop_account(self, acc):
+        with self._struct_lock:
+            accounts = self.data["accounts"]
+            for i in range(len(accounts) - 1, -1, -1):  # new rows sit at the end
+                if accounts[i] is acc:
+                    del accounts[i]
+                    break
+            self._unindex_account(acc)
+        self._deleted(acc)
+
+    def _deleted(self, row):
+        # a columnar row's slot is reused only after the deleting transaction ends
+        if not self.columnar:
+            return
+        t = self._txn
+        if getattr(t, "deleted", None) is not None:
+            t.deleted.append(row)
+        else:
+            with self._struct_lock:
+                self.data["accounts"].recycle([row.slot])
+
+    def update_account(self, acc_no, **fields):
+        with self.transaction():
+            self._lock_account(acc_no)
+            accs = self._find_account(acc_no=acc_no)
+            if not accs:
+                raise ValueError("Account not found")
+            acc = accs[0]
+            old_no = self._normalize_accno(acc)
+            old_balance = acc.get("balance", 0)
+            self._touch(acc, account=True)
+            self._unindex_account(acc)
+            changed = {}
+            for k, v in fields.items():
+                if v is None or v == '':
+                    continue
+                if k == "pin":
+                    v = int(v)
+                    if len(str(v)) != 4:
+                        raise ValueError("PIN must be 4 digits")
+                if k == "age":
+                    v = int(v)
+                    if v < 18:
+                        raise ValueError("Age must be 18+")
+                if k in ["balance"]:
+                    v = int(v)
+                acc[k] = v
+                changed[k] = v
+            new_no = self._normalize_accno(acc)
+            if new_no != old_no:
+                self._lock_account(new_no)
+                if new_no in self._index:
+                    raise ValueError("Account number already in use")
+            self._index_account(acc, renamed_from=old_no)
+            if acc.get("balance", 0) != old_balance:
+                self._post(new_no, "adjust", acc.get("balance", 0) - old_balance, acc.get("balance", 0))
+            if new_no != old_no:
+                self._log(["acc_del", old_no], ["acc", new_no, acc])
+                self._emit("deleted", old_no)
+                self._emit("created", new_no, dict(acc))
+            else:
+                self._log(["acc", new_no, acc])
+                self._emit("updated", new_no, changed)
+        return acc
+
+    def delete_account(self, acc_no):
+        with self.transaction():
+            self._lock_account(acc_no)
+            accs = self._find_account(acc_no=acc_no)
+            if not accs:
+                raise ValueError("Account not found")
+            acc = accs[0]
+            with self._struct_lock:
+                pos = self.data["accounts"].index(acc)
+                del self.data["accounts"][pos]
+                self._unindex_account(acc)
+            self._deleted(acc)
+
+            def undo():
+                with self._struct_lock:
+                    self.data["accounts"].insert(pos, acc)
+                    self._index_account(acc)
+            self._log(["acc_del", acc_no], undo=undo)
+            self._post(acc_no, "close", -acc.get("balance", 0), 0)
+            self._emit("deleted", acc_no)
+        self.sessions.revoke_subject("user", acc_no)
+
+    def deposit(self, acc_no, pin, amount, operator=None, token=None):
+        # token: a session from login() authorises the call instead of the PIN
+        amount = int(amount)
+        if amount <= 0:
+            raise ValueError("Invalid amount")
+        pin, session_op = self._authorise(acc_no, pin, token)
+        operator = operator or session_op
+        with self.transaction():
+            self._lock_account(acc_no)
+            accs = self._find_account(acc_no=acc_no, pin=pin)
+            if not accs:
+                raise ValueError("Invalid account or PIN")
+            self._touch(accs[0])
+            accs[0]["balance"] += amount
+            self._log(["acc", acc_no, accs[0]])
+            self._post(acc_no, "deposit", amount, accs[0]["balance"], operator)
+            self._emit("updated", acc_no, {"balance": accs[0]["balance"]})
+            return accs[0]["balance"]
+
+    def withdraw(self, acc_no, pin, amount, operator=None, token=None):
+        amount = int(amount)
+        pin, session_op = self._authorise(acc_no, pin, token, debit=True)
+        operator = operator or session_op
+        with self.transaction():
+            self._lock_account(acc_no)
+            accs = self._find_account(acc_no=acc_no, pin=pin)
+            if not accs:
+                raise ValueError("Invalid account or PIN")
+            if amount <= 0 or accs[0]["balance"] < amount:
+                raise ValueError("Insufficient balance")
+            self._touch(accs[0])
+            accs[0]["balance"] -= amount
+            self._log(["acc", acc_no, accs[0]])
+            self._post(acc_no, "withdraw", -amount, accs[0]["balance"], operator)
+            self._emit("updated", acc_no, {"balance": accs[0]["balance"]})
+            return accs[0]["balance"]
+
+    def _move(self, src, dst, amount, operator):
+        # one transfer inside the current transaction; rows must already be locked
+        if src == dst:
+            raise ValueError("Cannot transfer to the same account")
+        a, b = self._index.get(src), self._index.get(dst)
+        if a is None or b is None:
+            raise ValueError("Account not found")
+        if amount <= 0 or a["balance"] < amount:
+            raise ValueError("Insufficient balance")
+        self._touch(a)
+        self._touch(b)
+        a["balance"] -= amount
+        b["balance"] += amount
+        self._log(["acc", src, a], ["acc", dst, b])
+        self._post(src, "transfer_out", -amount, a["balance"], operator)
+        self._post(dst, "transfer_in", amount, b["balance"], operator)
+        self._emit("updated", src, {"balance": a["balance"]})
+        self._emit("updated", dst, {"balance": b["balance"]})
+        return a["balance"]
+
+    def transfer(self, src, pin, dst, amount, operator=None, token=None):
+        """Moves amount from src to dst in one commit; returns src's new balance."""
+        amount = int(amount)
+        pin, session_op = self._authorise(src, pin, token, debit=True)
+        operator = operator or session_op
+        with self.transaction():
+            self._lock_accounts((src, dst))
+            if not self._find_account(acc_no=src, pin=pin):
+                raise ValueError("Invalid account or PIN")
+            return self._move(src, dst, amount, operator)
+
+    def transfer_batch(self, transfers, operator="system:batch"):
+        """
+        Applies (src, dst, amount) transfers in order, TRANSFER_CHUNK per commit. Each chunk
+        locks its accounts up front in stripe order, so it runs alongside teller traffic.
+        A transfer that fails is skipped, not the chunk. Returns
+        {"applied": n, "rejected": [(position, reason), ...]}.
+        """
+        applied, rejected = 0, []
+        it = enumerate(transfers)
+        while True:
+            chunk = []  # (position, (src, dst, amount) or the reason the row is unusable)
+            for pos, row in it:
+                try:
+                    src, dst, amount = row
+                    hash(src), hash(dst)
+                    chunk.append((pos, (src, dst, int(amount))))
+                except (TypeError, ValueError) as e:
+                    chunk.append((pos, f"Malformed transfer: {e}"))
+                if len(chunk) == self.TRANSFER_CHUNK:
+                    break
+            if not chunk:
+                break
+            with self.transaction():
+                self._lock_accounts([a for _, t in chunk if isinstance(t, tuple) for a in t[:2]])
+                for pos, t in chunk:
+                    if not isinstance(t, tuple):
+                        rejected.append((pos, t))
+                        continue
+                    try:
+                        self._move(*t, operator)
+                        applied += 1
+                    except ValueError as e:
+                        rejected.append((pos, str(e)))
+        return {"applied": applied, "rejected": rejected}
+
+    def month_end(self, rate_bp=0, fee=0, min_balance=0, workers=None, operator="system:month-end"):
+        """
+        Interest accrual, then a fee for accounts under min_balance, over every account as one
+        transaction (one durable write), with an "interest"/"fee" ledger entry per change.
+        The arithmetic runs on the whole balance column at once (NumPy when installed); books
+        of MONTH_END_PARALLEL_MIN accounts or more are split across `workers` processes.
+        Returns totals for the run.
+        """
+        rate_bp, fee, min_balance = int(rate_bp), int(fee), int(min_balance)
+        if rate_bp < 0 or fee < 0:
+            raise ValueError("Rate and fee can't be negative")
+        with self.transaction():
+            with self._quiesce():
+                # nothing else is running, so every row lock is free; holding them all keeps
+                # other transactions out until this one has been queued for disk
+                for lock in self._stripes:
+                    self._hold(lock)
+            rows = list(self.data["accounts"])
+            balances = array('q', self.column("balance"))
+            n = len(balances)
+            workers = workers or os.cpu_count() or 1
+            if workers > 1 and n >= self.MONTH_END_PARALLEL_MIN:
+                size = -(-n // workers)
+                chunks = [balances[i:i + size] for i in range(0, n, size)]
+                with ProcessPoolExecutor(len(chunks)) as ex:
+                    parts = list(ex.map(_month_end_kernel, chunks, [rate_bp] * len(chunks),
+                                        [fee] * len(chunks), [min_balance] * len(chunks)))
+                interest, fees = array('q'), array('q')
+                for i_part, f_part in parts:
+                    interest.extend(i_part)
+                    fees.extend(f_part)
+            else:
+                interest, fees = _month_end_kernel(balances, rate_bp, fee, min_balance)
+            changed = list(compress(range(n), map(any, zip(interest, fees))))
+            old = [balances[i] for i in changed]
+
+            def undo():
+                for i, b in zip(changed, old):
+                    rows[i]["balance"] = b
+            self._log(undo=undo)
+            for i in changed:
+                row = rows[i]
+                acc_no = self._normalize_accno(row)
+                balance = balances[i] + interest[i]
+                if interest[i]:
+                    self._post(acc_no, "interest", interest[i], balance, operator)
+                if fees[i]:
+                    balance -= fees[i]
+                    self._post(acc_no, "fee", -fees[i], balance, operator)
+                row["balance"] = balance
+                self._log(["acc", acc_no, row])
+                self._emit("updated", acc_no, {"balance": balance})
+        return {"accounts": n, "changed": len(changed), "interest": sum(interest), "fees": sum(fees),
+                "charged": sum(1 for f in fees if f)}
+
+    def statement(self, acc_no, since=None, until=None):
+        """Ledger entries for an account between two time.time() stamps, oldest first."""
+        return self.ledger.between(acc_no, since, until)
+
+    def last_transactions(self, acc_no, n=10, skip=0):
+        """Most recent ledger entries for an account, newest first; skip pages further back."""
+        return self.ledger.latest(acc_no, n, skip)
+
+    def search(self, *, name=None, acc_no=None, email=None, prefix=False):
+        # name/email match case-insensitive substrings, or only the start when prefix=True
+        return self._find_account(name=name, acc_no=acc_no, email=email, prefix=prefix)
+
+    def add_staff(self, staff_id, password, name):
+        with self.transaction():
+            self._lock_staff()
+            if staff_id in self._staff:
+                raise ValueError("Staff already exists")
+            rec = {"id": staff_id, "password": password, "name": name}
+            self.data["staff"].append(rec)
+            self._staff[staff_id] = rec
+
+            def undo():
+                self.data["staff"].remove(rec)
+                del self._staff[staff_id]
+            self._log(["staff", rec], undo=undo)
+
+    def edit_staff(self, staff_id, new_name=None, new_password=None):
+        with self.transaction():
+            self._lock_staff()
+            s = self._staff.get(staff_id)
+            if s is None:
+                raise ValueError("Staff not found")
+            self._touch(s)
+            if new_name:
+                s["name"] = new_name
+            if new_password:
+                s["password"] = new_password
+                self.sessions.revoke_subject("staff", staff_id)
+            self._log(["staff", s])
+
+    def remove_staff(self, staff_id):
+        with self.transaction():
+            self._lock_staff()
+            s = self._staff.pop(staff_id, None)
+            if s is None:
+                raise ValueError("Staff not found")
+            pos = self.data["staff"].index(s)
+            del self.data["staff"][pos]
+
+            def undo():
+                self.data["staff"].insert(pos, s)
+                self._staff[staff_id] = s
+            self._log(["staff_del", staff_id], undo=undo)
+            self.sessions.revoke_subject("staff", staff_id)
+
+    @staticmethod
+    def _same(a, b):
+        # constant-time credential comparison
+        return hmac.compare_digest(str(a).encode(), str(b).encode())
+
+    def check_manager_login(self, uid, pwd):
+        m = self.data["manager"]
+        return self._same(uid, m["id"]) & self._same(pwd, m["password"])
+
+    def check_staff_login(self, uid, pwd):
+        s = self._staff.get(uid)
+        return s is not None and self._same(pwd, s["password"])
+
+    def get_user_details(self, acc_no, pin):
+        accs = self._find_account(acc_no=acc_no, pin=int(pin))
+        return accs[0] if accs else None
+
+    def login(self, role, uid, secret):
+        """
+        Checks credentials once and returns a session token for later calls (or None).
+        role is "manager", "staff" or "user" (uid = account number, secret = PIN).
+        """
+        if role == "manager":
+            ok = self.check_manager_login(uid, secret)
+        elif role == "staff":
+            ok = self.check_staff_login(uid, secret)
+        elif role == "user":
+            acc = self._index.get(uid)
+            ok = acc is not None and self._same(acc.get("pin"), secret)
+        else:
+            raise ValueError(f"Unknown role: {role}")
+        return self.sessions.issue(role, uid) if ok else None
+
+    def logout(self, token):
+        self.sessions.revoke(token)
+
+    def session_account(self, token):
+        """The live account record behind a user session."""
+        kind, acc_no = self.sessions.check(token)
+        acc = self._index.get(acc_no) if kind == "user" else None
+        if acc is None:
+            raise PermissionError("Not an account session")
+        return acc
+
+    def _authorise(self, acc_no, pin, token, debit=False):
+        # -> (pin to check, operator). The account holder's own session replaces the PIN;
+        # a staff/manager session does so only for credits, debits still need the customer's PIN
+        if token is None:
+            return int(pin), None
+        kind, subject = self.sessions.check(token)
+        if kind == "user":
+            if subject != acc_no:
+                raise PermissionError("Session is not for this account")
+            return None, f"{kind}:{subject}"
+        if debit:
+            if pin is None:
+                raise PermissionError("Customer PIN required")
+            return int(pin), f"{kind}:{subject}"
+        return None, f"{kind}:{subject}"
+
+    def reset_pin(self, acc_no, old_pin, new_pin):
+        with self.transaction():
+            self._lock_account(acc_no)
+            accs = self._find_account(acc_no=acc_no, pin=int(old_pin))
+            if not accs:
+                raise ValueError("Invalid account or old PIN")
+            if len(str(new_pin)) != 4:
+                raise ValueError("PIN must be 4 digits")
+            self._touch(accs[0])
+            accs[0]["pin"] = int(new_pin)
+            self._log(["acc", acc_no, accs[0]])
+            self._emit("updated", acc_no, {"pin": accs[0]["pin"]})
+
+
+#############################
+# Headless Commands
+#############################
+def run_headless(argv):
+    """Runs an offline command from argv (see the top of this file); False if there is none."""
+    if "--rebalance" in argv:
+        # with the app closed
+        shards = int(argv[argv.index("--rebalance") + 1])
+        moved = ShardedEngine.rebalance(DataStore.SHARD_DIR, shards)
+        print(f"{moved} accounts rebalanced into {shards} shards")
+        return True
+    if "--convert" in argv:
+        # data.json to data.snap or back again
+        i = argv.index("--convert")
+        size = convert_snapshot(argv[i + 1], argv[i + 2])
+        print(f"{argv[i + 2]}: {size:,} bytes")
+        return True
+    if "--replica" in argv:
+        # read replica of a --journal primary in the same directory
+        serve_replica(columnar="--columnar" in argv)
+        return True
+    if "--import" in argv:
+        # onboarding from a CSV/NDJSON file
+        engine = argv[argv.index("--engine") + 1] if "--engine" in argv else "json"
+        store = DataStore(engine=engine, journal="--journal" in argv)
+        result = store.import_accounts(argv[argv.index("--import") + 1])
+        store.close()
+        print(f"{result['imported']} imported, {result['rejected']} rejected"
+              + (f" (see {result['rejects']})" if result["rejects"] else ""))
+        return True
+    return False
+
+
+if __name__ == "__main__":
+    if not run_headless(sys.argv):
+        sys.exit("usage: python bank_store.py --import FILE | --convert SRC DST | --rebalance N | --replica")
@@ -0,0 +1,376 @@
+# Bank Management System - Headless Benchmarks
+# Times DataStore (bank_store.py) and the legacy Bank class (gui.py) on synthetic books.
+#
+#   python bench.py                                  # 1k/10k/100k/1M accounts, JSON engine
+#   python bench.py --sizes 1000,10000 --journal --out new.json
+#   python bench.py --sizes 10000 --legacy --compare old.json
+#   python bench.py --sizes 100000 --formats-only     # data.json vs snapshot size and load/save
+
+import argparse
+import ast
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+
+from bank_store import AccountNumbers, DataStore, encode_snapshot, read_snapshot, write_snapshot  # noqa: E402
+
+
+#############################
+# Synthetic Data
+#############################
+FIRST = ["Aarav", "Vivaan", "Aditya", "Mohammad", "Arjun", "Sai", "Reyansh", "Ayaan", "Krishna", "Ishaan",
+         "Ananya", "Diya", "Saanvi", "Aadhya", "Fatima", "Priya", "Kavya", "Sara", "Anika", "Meera",
+         "James", "Maria", "Wei", "Olga", "Kaif", "Anuj", "Rohan", "Neha", "Pooja", "Rahul"]
+LAST = ["Sharma", "Verma", "Khan", "Patel", "Singh", "Gupta", "Kumar", "Das", "Reddy", "Iyer",
+        "Nair", "Joshi", "Mehta", "Ali", "Chopra", "Bose", "Rao", "Mishra", "Pandey", "Yadav",
+        "Smith", "Garcia", "Chen", "Ivanova", "Siddiqui", "Kapoor", "Malhotra", "Saxena", "Jain", "Shah"]
+DOMAINS = ["gmail.com", "yahoo.com", "outlook.com", "hotmail.com", "rediffmail.com", "icloud.com"]
+
+
+def _zipf(n, s=1.1):
+    # a few very common values and a long tail, like real name frequencies
+    return [1 / (k ** s) for k in range(1, n + 1)]
+
+
+def make_accounts(n, seed=0):
+    rnd = random.Random(seed)
+    firsts = rnd.choices(FIRST, _zipf(len(FIRST)), k=n)
+    lasts = rnd.choices(LAST, _zipf(len(LAST)), k=n)
+    domains = rnd.choices(DOMAINS, _zipf(len(DOMAINS), 1.5), k=n)
+    state = random.getstate()
+    random.seed(seed)  # AccountNumbers draws from the module-level generator
+    numbers = AccountNumbers().reserve(n)
+    random.setstate(state)
+    accounts = []
+    for i in range(n):
+        first, last = firsts[i], lasts[i]
+        accounts.append({
+            "name": f"{first} {last}",
+            "age": min(90, 18 + int(rnd.expovariate(1 / 20))),
+            "email": f"{first.lower()}.{last.lower()}{rnd.randrange(1000)}@{domains[i]}",
+            "pin": rnd.randrange(1000, 10000),
+            "accountNo": numbers[i],
+            "balance": int(rnd.lognormvariate(9, 1.5)),
+        })
+    return accounts
+
+
+def make_staff(m, seed=0):
+    rnd = random.Random(seed + 1)
+    return [{"id": f"S{i:04d}", "password": str(rnd.randrange(10 ** 6)),
+             "name": f"{rnd.choice(FIRST)} {rnd.choice(LAST)}"} for i in range(m)]
+
+
+def write_dataset(path, n, m, seed=0):
+    accounts = make_accounts(n, seed)
+    doc = {"accounts": accounts, "staff": make_staff(m, seed), "manager": {"id": "admin", "password": "1234"}}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(doc, f)
+    return accounts
+
+
+#############################
+# Measurement
+#############################
+def _percentile(sorted_vals, p):
+    if not sorted_vals:
+        return 0.0
+    k = max(0, min(len(sorted_vals) - 1, math.ceil(p / 100 * len(sorted_vals)) - 1))
+    return sorted_vals[k]
+
+
+def summarize(latencies):
+    """latencies in seconds -> throughput and p50/p99 in microseconds."""
+    lat = sorted(latencies)
+    total = sum(lat)
+    out = {
+        "ops": len(lat),
+        "total_s": round(total, 6),
+        "ops_per_s": round(len(lat) / total, 1) if total else None,
+        "p50_us": round(_percentile(lat, 50) * 1e6, 1),
+        "p99_us": round(_percentile(lat, 99) * 1e6, 1),
+    }
+    return out
+
+
+def timed(fn, args_list):
+    # per-call latencies; memory is measured in separate passes so tracemalloc never skews them
+    lat = []
+    clock = time.perf_counter
+    for args in args_list:
+        t = clock()
+        fn(*args)
+        lat.append(clock() - t)
+    return lat
+
+
+@contextmanager
+def in_dir(path):
+    old = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(old)
+
+
+def peak_of(fn):
+    """Peak traced allocation while running fn(), and fn's result."""
+    tracemalloc.start()
+    try:
+        result = fn()
+        return tracemalloc.get_traced_memory()[1], result
+    finally:
+        tracemalloc.stop()
+
+
+#############################
+# DataStore Benchmarks
+#############################
+def bench_datastore(n, ops, store_kw, seed, workdir, memory):
+    rnd = random.Random(seed + 2)
+    with in_dir(workdir):
+        accounts = write_dataset(DataStore.DB_FILE, n, max(1, n // 1000), seed)
+        res = {}
+
+        t = time.perf_counter()
+        store = DataStore(**store_kw)
+        res["load"] = summarize([time.perf_counter() - t])
+        if memory:
+            store.close()
+            peak, store = peak_of(lambda: DataStore(**store_kw))
+            res["load"]["peak_mb"] = round(peak / 2 ** 20, 2)
+
+        created = []
+        res["create_account"] = summarize(timed(
+            lambda *a: created.append(store.create_account(*a)["accountNo"]),
+            [(f"{rnd.choice(FIRST)} {rnd.choice(LAST)}", rnd.randrange(18, 80),
+              f"bench{i}@example.com", 1234) for i in range(ops)]))
+
+        picks = [rnd.choice(accounts) for _ in range(ops)]
+        res["deposit"] = summarize(timed(store.deposit, [(a["accountNo"], a["pin"], 500) for a in picks]))
+        res["withdraw"] = summarize(timed(store.withdraw, [(a["accountNo"], a["pin"], 100) for a in picks]))
+
+        def name_query():
+            name = rnd.choice(accounts)["name"]
+            i = rnd.randrange(max(1, len(name) - 3))
+            return name[i:i + 4]
+
+        res["search_name"] = summarize(timed(lambda q: store.search(name=q), [(name_query(),) for _ in range(ops)]))
+        res["search_acc_no"] = summarize(timed(lambda q: store.search(acc_no=q),
+                                               [(rnd.choice(accounts)["accountNo"],) for _ in range(ops)]))
+        res["delete_account"] = summarize(timed(store.delete_account, [(no,) for no in created]))
+
+        saves = max(1, min(5, ops))
+        res["save"] = summarize(timed(store._save, [()] * saves))
+        if memory:
+            peak, _ = peak_of(store._save)
+            res["save"]["peak_mb"] = round(peak / 2 ** 20, 2)
+        store.close()
+        return res
+
+
+#############################
+# File Format Benchmarks
+#############################
+def _save_json(path, data, indent=None):
+    separators = None if indent else (",", ":")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(data, indent=indent, separators=separators))
+
+
+def _load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+FORMATS = {
+    # name -> (save(path, data), load(path), file name)
+    "json_indent": (lambda p, d: _save_json(p, d, indent=2), _load_json, "indent.json"),
+    "json": (_save_json, _load_json, "data.json"),
+    "snapshot": (lambda p, d: write_snapshot(p, encode_snapshot(d)), read_snapshot, "data.snap"),
+}
+
+
+def bench_formats(n, seed, workdir, repeats=3):
+    """Save and load times plus file size for the whole book in each on-disk format."""
+    data = {"accounts": make_accounts(n, seed), "staff": make_staff(max(1, n // 1000), seed),
+            "manager": {"id": "admin", "password": "admin123"}}
+    res = {}
+    with in_dir(workdir):
+        for name, (save, load, path) in FORMATS.items():
+            res[f"{name}_save"] = summarize(timed(save, [(path, data)] * repeats))
+            res[f"{name}_save"]["file_mb"] = round(os.path.getsize(path) / 2 ** 20, 2)
+            res[f"{name}_load"] = summarize(timed(load, [(path,)] * repeats))
+    return res
+
+
+#############################
+# Legacy Bank Benchmarks
+#############################
+def load_legacy_bank():
+    """
+    The Bank class from gui.py, without running the module (it opens a Tk window on import).
+    Returns a function that executes the class body, which is where Bank reads data.json.
+    """
+    tree = ast.parse((HERE / "gui.py").read_text(encoding="utf-8"))
+    cls = next(node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == "Bank")
+    code = compile(ast.Module(body=[cls], type_ignores=[]), "gui.py", "exec")
+
+    def build():
+        ns = {"json": json, "random": random, "string": __import__("string"), "Path": Path}
+        exec(code, ns)
+        return ns["Bank"]
+
+    return build
+
+
+def bench_legacy(n, ops, seed, workdir, memory):
+    rnd = random.Random(seed + 2)
+    build = load_legacy_bank()
+    with in_dir(workdir):
+        # gui.py's Bank keeps a bare list of accounts under the old "accountNo." key
+        accounts = make_accounts(n, seed)
+        for a in accounts:
+            a["accountNo."] = a.pop("accountNo")
+        with open("data.json", 'w', encoding='utf-8') as f:
+            json.dump(accounts, f)
+        res = {}
+
+        t = time.perf_counter()
+        Bank = build()
+        res["load"] = summarize([time.perf_counter() - t])
+        if memory:
+            peak, Bank = peak_of(build)
+            res["load"]["peak_mb"] = round(peak / 2 ** 20, 2)
+
+        created = []
+        res["create_account"] = summarize(timed(
+            lambda *a: created.append(Bank.createAccount(*a)["accountNo."]),
+            [(f"{rnd.choice(FIRST)} {rnd.choice(LAST)}", rnd.randrange(18, 80),
+              f"bench{i}@example.com", 1234) for i in range(ops)]))
+        picks = [rnd.choice(accounts) for _ in range(ops)]
+        res["deposit"] = summarize(timed(Bank.depositMoney, [(a["accountNo."], a["pin"], 500) for a in picks]))
+        res["withdraw"] = summarize(timed(Bank.withdrawMoney, [(a["accountNo."], a["pin"], 100) for a in picks]))
+        res["search_acc_no"] = summarize(timed(Bank.getDetails, [(a["accountNo."], a["pin"]) for a in picks]))
+        res["delete_account"] = summarize(timed(Bank.deleteAccount, [(no, 1234) for no in created]))
+        return res
+
+
+#############################
+# Reporting
+#############################
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def print_table(results):
+    for target, by_size in results.items():
+        for size, ops in by_size.items():
+            print(f"\n{target} @ {int(size):,} accounts")
+            print(f"  {'operation':<16}{'ops/s':>12}{'p50 us':>12}{'p99 us':>12}{'peak MB':>10}{'file MB':>10}")
+            for name, r in ops.items():
+                ops_s = "-" if not r["ops_per_s"] else f"{r['ops_per_s']:,.{0 if r['ops_per_s'] >= 100 else 2}f}"
+                print(f"  {name:<16}{ops_s:>12}{r['p50_us']:>12,.1f}{r['p99_us']:>12,.1f}"
+                      f"{r.get('peak_mb', ''):>10}{r.get('file_mb', ''):>10}")
+
+
+def compare(base, new, threshold):
+    """Prints p50 changes against an older results file; returns the regressions beyond threshold %."""
+    regressions = []
+    print(f"\nvs {base['meta'].get('git') or 'baseline'} (p50 change, + is slower)")
+    for target, by_size in new["results"].items():
+        for size, ops in by_size.items():
+            old_ops = base["results"].get(target, {}).get(size, {})
+            for name, r in ops.items():
+                old = old_ops.get(name)
+                if not old or not old["p50_us"]:
+                    continue
+                change = (r["p50_us"] - old["p50_us"]) / old["p50_us"] * 100
+                flag = ""
+                if change > threshold:
+                    flag = "  REGRESSION"
+                    regressions.append((target, size, name, change))
+                print(f"  {target:<10}{int(size):>10,}  {name:<16}{old['p50_us']:>12,.1f} -> "
+                      f"{r['p50_us']:>12,.1f} us  {change:+7.1f}%{flag}")
+    return regressions
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Headless DataStore / legacy Bank benchmarks")
+    p.add_argument("--sizes", default="1000,10000,100000,1000000", help="comma separated account counts")
+    p.add_argument("--ops", type=int, default=200, help="operations timed per kind and size")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--engine", default="json", choices=sorted(DataStore.ENGINES))
+    p.add_argument("--journal", action="store_true")
+    p.add_argument("--columnar", action="store_true")
+    p.add_argument("--group-commit", action="store_true")
+    p.add_argument("--legacy", action="store_true", help="also benchmark gui.py's Bank class")
+    p.add_argument("--no-memory", action="store_true", help="skip the tracemalloc passes")
+    p.add_argument("--no-formats", action="store_true", help="skip the data.json vs snapshot comparison")
+    p.add_argument("--formats-only", action="store_true", help="only run the data.json vs snapshot comparison")
+    p.add_argument("--out", default="bench_results.json")
+    p.add_argument("--compare", help="older results file to compare against")
+    p.add_argument("--threshold", type=float, default=10.0, help="p50 slowdown (%%) counted as a regression")
+    args = p.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    store_kw = {"engine": args.engine, "journal": args.journal, "columnar": args.columnar,
+                "group_commit": args.group_commit}
+    results = {} if args.formats_only else {"datastore": {}}
+    if args.legacy and not args.formats_only:
+        results["legacy"] = {}
+    if not args.no_formats:
+        results["formats"] = {}
+    for n in sizes:
+        if not args.formats_only:
+            with tempfile.TemporaryDirectory(prefix="bank-bench-") as d:
+                print(f"datastore: {n:,} accounts...", file=sys.stderr)
+                results["datastore"][str(n)] = bench_datastore(n, args.ops, store_kw, args.seed, d,
+                                                               not args.no_memory)
+        if not args.no_formats:
+            with tempfile.TemporaryDirectory(prefix="bank-bench-") as d:
+                print(f"formats: {n:,} accounts...", file=sys.stderr)
+                results["formats"][str(n)] = bench_formats(n, args.seed, d)
+        if "legacy" in results:
+            with tempfile.TemporaryDirectory(prefix="bank-bench-") as d:
+                print(f"legacy: {n:,} accounts...", file=sys.stderr)
+                results["legacy"][str(n)] = bench_legacy(n, args.ops, args.seed, d, not args.no_memory)
+
+    doc = {
+        "meta": {"git": _git_rev(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "python": platform.python_version(), "platform": platform.platform(),
+                 "ops": args.ops, "seed": args.seed, "store": store_kw},
+        "results": results,
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(doc, f, indent=2)
+    print_table(results)
+    print(f"\nresults written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        if compare(base, doc, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -17,10 +17,20 @@ class Bank:
     except Exception as err:
         print(f"An exception occurred: {err}")
 
+    # account number -> record, so lookups don't scan the whole list
+    index = {i.get('accountNo.'): i for i in data if isinstance(i, dict) and i.get('accountNo.')}
+
     @classmethod
     def __update(cls):
         with open(cls.database, 'w') as fs:
-            fs.write(json.dumps(cls.data, indent=4))
+            fs.write(json.dumps(cls.data, separators=(",", ":")))
+
+    @classmethod
+    def __find(cls, accnumber, pin):
+        acc = cls.index.get(accnumber)
+        if acc is not None and acc['pin'] == pin:
+            return [acc]
+        return []
 
     @classmethod
     def __account_generate(cls):
@@ -29,7 +39,10 @@ class Bank:
         spchar = random.choices("!@#%^&*", k=1)
         acc_id = alpha + num + spchar
         random.shuffle(acc_id)
-        return "".join(acc_id)
+        acc_id = "".join(acc_id)
+        if acc_id in cls.index:  # collisions are rare in this keyspace, so just draw again
+            return cls.__account_generate()
+        return acc_id
 
     @classmethod
     def createAccount(cls, name, age, email, pin):
@@ -45,12 +58,13 @@ class Bank:
             return None
         else:
             cls.data.append(info)
+            cls.index[info["accountNo."]] = info
             Bank.__update()
             return info
 
     @classmethod
     def depositMoney(cls, accnumber, pin, amount):
-        userdata = [i for i in Bank.data if i['accountNo.'] == accnumber and i['pin'] == pin]
+        userdata = Bank.__find(accnumber, pin)
         if userdata == []:
             return False
         else:
@@ -62,7 +76,7 @@ class Bank:
 
     @classmethod
     def withdrawMoney(cls, accnumber, pin, amount):
-        userdata = [i for i in Bank.data if i['accountNo.'] == accnumber and i['pin'] == pin]
+        userdata = Bank.__find(accnumber, pin)
         if userdata == []:
             return False
         else:
@@ -74,17 +88,18 @@ class Bank:
 
     @classmethod
     def getDetails(cls, accnumber, pin):
-        userdata = [i for i in Bank.data if i['accountNo.'] == accnumber and i['pin'] == pin]
+        userdata = Bank.__find(accnumber, pin)
         if userdata == []:
             return None
         return userdata[0]
 
     @classmethod
     def deleteAccount(cls, accnumber, pin):
-        userdata = [i for i in Bank.data if i['accountNo.'] == accnumber and i['pin'] == pin]
+        userdata = Bank.__find(accnumber, pin)
         if userdata == []:
             return False
         cls.data.remove(userdata[0])
+        cls.index.pop(accnumber, None)
         Bank.__update()
         return True
 
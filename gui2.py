@@ -2,192 +2,89 @@
 # Final Stable Version with Custom Dialogs + Background + Optimizations
 # Author: ChatGPT
 
-import json
-import random
-import string
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 
-try:
-    from PIL import Image, ImageTk
-    PIL_OK = True
-except Exception:
-    PIL_OK = False
+from bank_store import DataStore, ReplicaClient, run_headless
 
 
 #############################
-# Data Layer
+# Background Image
 #############################
-class DataStore:
-    DB_FILE = 'data.json'
-
-    def __init__(self):
-        self.data = {
-            "accounts": [],
-            "staff": [],
-            "manager": {"id": "admin", "password": "1234"}
-        }
-        self._load_or_init()
-
-    def _load_or_init(self):
-        if Path(self.DB_FILE).exists():
-            try:
-                with open(self.DB_FILE, 'r', encoding='utf-8') as f:
-                    raw = json.load(f)
-                if isinstance(raw, list):
-                    self.data["accounts"] = raw
-                elif isinstance(raw, dict):
-                    # merge keys
-                    for k in ["accounts", "staff", "manager"]:
-                        if k in raw:
-                            self.data[k] = raw[k]
-                self._save()
-            except Exception:
-                self._save()
-        else:
-            self._save()
+def _load_pil():
+    # PIL is only needed on a background cache miss, so it's imported on first use
+    global _PIL
+    if _PIL is None:
+        try:
+            from PIL import Image
+            _PIL = Image
+        except Exception:
+            _PIL = False
+    return _PIL or None
 
-    def _save(self):
-        with open(self.DB_FILE, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, indent=2)
 
-    @staticmethod
-    def _gen_account_no():
-        alpha = ''.join(random.choices(string.ascii_uppercase, k=3))
-        num = ''.join(random.choices(string.digits, k=3))
-        return f"{alpha}{num}"
-
-    def _normalize_accno(self, acc):
-        return acc.get("accountNo") or acc.get("accountNo.")  # legacy key support
-
-    def _find_account(self, *, acc_no=None, pin=None, name=None):
-        res = []
-        for acc in self.data["accounts"]:
-            accno = self._normalize_accno(acc)
-            ok = True
-            if acc_no is not None and accno != acc_no:
-                ok = False
-            if pin is not None and acc.get("pin") != pin:
-                ok = False
-            if name is not None and name.lower() not in acc.get("name", "").lower():
-                ok = False
-            if ok:
-                res.append(acc)
-        return res
-
-    def create_account(self, name, age, email, pin):
-        if not name or not email:
-            raise ValueError("Name/Email required")
-        age = int(age)
-        pin = int(pin)
-        if age < 18:
-            raise ValueError("Age must be 18+")
-        if len(str(pin)) != 4:
-            raise ValueError("PIN must be 4 digits")
-        acc_no = self._gen_account_no()
-        acc = {"name": name, "age": age, "email": email, "pin": pin, "accountNo": acc_no, "balance": 0}
-        self.data["accounts"].append(acc)
-        self._save()
-        return acc
-
-    def update_account(self, acc_no, **fields):
-        accs = self._find_account(acc_no=acc_no)
-        if not accs:
-            raise ValueError("Account not found")
-        acc = accs[0]
-        for k, v in fields.items():
-            if v is None or v == '':
-                continue
-            if k == "pin":
-                v = int(v)
-                if len(str(v)) != 4:
-                    raise ValueError("PIN must be 4 digits")
-            if k == "age":
-                v = int(v)
-                if v < 18:
-                    raise ValueError("Age must be 18+")
-            if k in ["balance"]:
-                v = int(v)
-            acc[k] = v
-        self._save()
-        return acc
-
-    def delete_account(self, acc_no):
-        accs = self._find_account(acc_no=acc_no)
-        if not accs:
-            raise ValueError("Account not found")
-        self.data["accounts"].remove(accs[0])
-        self._save()
-
-    def deposit(self, acc_no, pin, amount):
-        amount = int(amount)
-        if amount <= 0:
-            raise ValueError("Invalid amount")
-        accs = self._find_account(acc_no=acc_no, pin=int(pin))
-        if not accs:
-            raise ValueError("Invalid account or PIN")
-        accs[0]["balance"] += amount
-        self._save()
-        return accs[0]["balance"]
-
-    def withdraw(self, acc_no, pin, amount):
-        amount = int(amount)
-        accs = self._find_account(acc_no=acc_no, pin=int(pin))
-        if not accs:
-            raise ValueError("Invalid account or PIN")
-        if amount <= 0 or accs[0]["balance"] < amount:
-            raise ValueError("Insufficient balance")
-        accs[0]["balance"] -= amount
-        self._save()
-        return accs[0]["balance"]
-
-    def search(self, *, name=None, acc_no=None):
-        return self._find_account(name=name, acc_no=acc_no)
-
-    def add_staff(self, staff_id, password, name):
-        if any(s["id"] == staff_id for s in self.data["staff"]):
-            raise ValueError("Staff already exists")
-        self.data["staff"].append({"id": staff_id, "password": password, "name": name})
-        self._save()
-
-    def edit_staff(self, staff_id, new_name=None, new_password=None):
-        for s in self.data["staff"]:
-            if s["id"] == staff_id:
-                if new_name:
-                    s["name"] = new_name
-                if new_password:
-                    s["password"] = new_password
-                self._save()
-                return
-        raise ValueError("Staff not found")
+_PIL = None
 
-    def remove_staff(self, staff_id):
-        for s in self.data["staff"]:
-            if s["id"] == staff_id:
-                self.data["staff"].remove(s)
-                self._save()
-                return
-        raise ValueError("Staff not found")
 
-    def check_manager_login(self, uid, pwd):
-        return uid == self.data["manager"]["id"] and pwd == self.data["manager"]["password"]
+class ScaledBackground:
+    """
+    bg.jpg scaled to a window size, cached on disk as PNG (which Tk loads without PIL).
+    Cache files are keyed by the source's mtime and size plus the target size.
+    """
+    CACHE_DIR = '.cache'
+    KEEP = 8  # cached sizes kept on disk per source version
+
+    def __init__(self, path):
+        self.path = Path(path)
 
-    def check_staff_login(self, uid, pwd):
-        return any(s["id"] == uid and s["password"] == pwd for s in self.data["staff"])
+    def _key(self):
+        st = self.path.stat()
+        return f"{st.st_mtime_ns}-{st.st_size}"
 
-    def get_user_details(self, acc_no, pin):
-        accs = self._find_account(acc_no=acc_no, pin=int(pin))
-        return accs[0] if accs else None
+    def cache_path(self, size):
+        w, h = size
+        return Path(self.CACHE_DIR) / f"{self.path.stem}-{w}x{h}-{self._key()}.png"
+
+    def cached(self, size):
+        # a ready cache file for this size, or None
+        try:
+            p = self.cache_path(size)
+        except OSError:
+            return None
+        return p if p.exists() else None
 
-    def reset_pin(self, acc_no, old_pin, new_pin):
-        accs = self._find_account(acc_no=acc_no, pin=int(old_pin))
-        if not accs:
-            raise ValueError("Invalid account or old PIN")
-        if len(str(new_pin)) != 4:
-            raise ValueError("PIN must be 4 digits")
-        accs[0]["pin"] = int(new_pin)
-        self._save()
+    def render(self, size):
+        """Decodes, scales and caches the image; safe off the Tk thread. None without PIL."""
+        Image = _load_pil()
+        if Image is None:
+            return None
+        p = self.cache_path(size)
+        p.parent.mkdir(exist_ok=True)
+        with Image.open(self.path) as img:
+            img.draft("RGB", size)  # lets the JPEG decoder downscale while decoding
+            img = img.convert("RGB").resize(size)
+        tmp = p.with_suffix('.tmp')
+        img.save(tmp, "PNG", compress_level=1)
+        os.replace(tmp, p)
+        # drop files made from an older version of the source, and all but the newest sizes
+        key = self._key()
+        current = []
+        for old in p.parent.glob(f"{self.path.stem}-*.png"):
+            if old.stem.endswith(key):
+                current.append(old)
+            else:
+                old.unlink(missing_ok=True)
+        current.sort(key=lambda f: f.stat().st_mtime_ns, reverse=True)
+        for old in current[self.KEEP:]:
+            old.unlink(missing_ok=True)
+        return p
 
 
 #############################
@@ -247,49 +144,423 @@ class FormDialog(tk.Toplevel):
             messagebox.showerror("Invalid", "Please enter valid numeric values where required.")
 
 
+#############################
+# Reusable Virtual Account Table
+#############################
+class AccountTable(ttk.Frame):
+    """
+    Treeview that only materialises the visible window of rows (plus OVERSCAN).
+    Scrolling re-fills the same few items in place, so cost does not depend on len(rows).
+    """
+    COLS = ("Name", "Age", "Email", "AccountNo", "PIN", "Balance")
+    OVERSCAN = 4
+
+    def __init__(self, parent, height=16):
+        super().__init__(parent)
+        self.rows = []
+        self.live = False  # rows is the store's own list, so creates/deletes are already in it
+        self.start = 0
+        self._sel_key = None
+        self._items = {}  # accountNo -> item id, for the rows currently materialised
+        self._rowheight = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+
+        self.tree = ttk.Treeview(self, columns=self.COLS, show='headings', height=height, selectmode='browse')
+        for c in self.COLS:
+            self.tree.heading(c, text=c)
+            self.tree.column(c, width=150 if c != "Email" else 220, anchor="center")
+        self.vsb = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.count_lbl = ttk.Label(self, text="")
+
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.vsb.grid(row=0, column=1, sticky="ns")
+        self.count_lbl.grid(row=1, column=0, columnspan=2, sticky="w", pady=(4, 0))
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        self.tree.bind("<Configure>", lambda e: self._render())
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1, "units") or "break")
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1, "units") or "break")  # X11 wheel
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1, "units") or "break")
+        self.tree.bind("<Prior>", lambda e: self.scroll(-1, "pages") or "break")
+        self.tree.bind("<Next>", lambda e: self.scroll(1, "pages") or "break")
+        self.tree.bind("<Up>", self._on_arrow)
+        self.tree.bind("<Down>", self._on_arrow)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+
+    @staticmethod
+    def row_values(acc):
+        accno = acc.get("accountNo") or acc.get("accountNo.")
+        return (acc['name'], acc['age'], acc['email'], accno, acc['pin'], acc['balance'])
+
+    def set_rows(self, rows, live=False):
+        # a new source starts at the top; refreshing the same source keeps the scroll position
+        if rows is not self.rows:
+            self.start = 0
+            self.rows = rows
+        self.live = live
+        self._render()
+
+    def on_change(self, event, acc_no, fields):
+        # DataStore subscriber: patch just the affected item instead of re-rendering
+        if event == "updated":
+            iid = self._items.get(acc_no)
+            if iid is not None:
+                acc = self.rows[self.start + self.tree.index(iid)]
+                self.tree.item(iid, values=self.row_values(acc))
+            return
+        if event == "deleted" and not self.live:
+            for i, acc in enumerate(self.rows):
+                if (acc.get("accountNo") or acc.get("accountNo.")) == acc_no:
+                    del self.rows[i]
+                    break
+            else:
+                return
+        elif event == "created" and not self.live:
+            return  # search results don't grow
+        if event == "created" and self.start + len(self._items) < len(self.rows) - 1:
+            self._update_count()  # appended below the window, nothing visible changes
+        else:
+            self._render()
+
+    def _visible(self):
+        h = self.tree.winfo_height()
+        if h <= 1:  # not mapped yet
+            return int(self.tree.cget("height"))
+        return max(1, (h - self._rowheight) // self._rowheight)  # one row's worth for the heading
+
+    def _render(self):
+        total = len(self.rows)
+        visible = self._visible()
+        self.start = max(0, min(self.start, total - visible))
+        window = self.rows[self.start:self.start + visible + self.OVERSCAN]
+        items = self.tree.get_children()
+        if len(items) > len(window):
+            self.tree.delete(*items[len(window):])
+        for i in range(len(items), len(window)):
+            self.tree.insert('', 'end', iid=f"r{i}")
+        selected = ()
+        self._items = {}
+        for i, acc in enumerate(window):
+            vals = self.row_values(acc)
+            self.tree.item(f"r{i}", values=vals)
+            self._items[vals[3]] = f"r{i}"
+            if vals[3] == self._sel_key:
+                selected = (f"r{i}",)
+        if tuple(self.tree.selection()) != selected:
+            self.tree.selection_set(selected)
+        self._update_count()
+
+    def _update_count(self):
+        total = len(self.rows)
+        visible = self._visible()
+        if total:
+            self.vsb.set(self.start / total, min(1.0, (self.start + visible) / total))
+            last = min(total, self.start + visible)
+            self.count_lbl.configure(text=f"Showing {self.start + 1}-{last} of {total} accounts")
+        else:
+            self.vsb.set(0, 1)
+            self.count_lbl.configure(text="No accounts")
+
+    def scroll(self, n, what):
+        step = self._visible() if what == "pages" else 1
+        self.start += int(n) * step
+        self._render()
+
+    def _on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self.start = int(float(args[1]) * len(self.rows))
+            self._render()
+        elif args[0] == "scroll":
+            self.scroll(args[1], args[2])
+
+    def _on_arrow(self, event):
+        # at the edge of the window, move the window instead of the highlight
+        sel = self.tree.selection()
+        if not sel:
+            return None
+        pos = self.tree.index(sel[0])
+        before = self.start
+        if event.keysym == "Up" and pos == 0:
+            self.scroll(-1, "units")
+        elif event.keysym == "Down" and pos >= self._visible() - 1:
+            self.scroll(1, "units")
+        if self.start == before:
+            return None
+        item = self.tree.get_children()[pos]
+        self.tree.selection_set((item,))
+        self.tree.focus(item)
+        return "break"
+
+    def _on_select(self, _event):
+        sel = self.tree.selection()
+        if sel:
+            self._sel_key = self.tree.item(sel[0], "values")[3]
+
+
+#############################
+# Diagnostics Panel
+#############################
+class DiagnosticsDialog(tk.Toplevel):
+    """Live view of DataStore metrics, with a switch to turn collection on/off and a JSON dump."""
+    REFRESH_MS = 1000
+    COLUMNS = ("Metric", "Count", "Errors", "Mean", "p50", "p99", "Max")
+    SECTIONS = (("latency_us", "Latency (us)"), ("bytes_per_write", "Bytes written"),
+                ("scan_rows", "Rows scanned"))
+
+    def __init__(self, parent, store):
+        super().__init__(parent)
+        self.title("Diagnostics")
+        self.geometry("760x460")
+        self.store = store
+
+        top = ttk.Frame(self); top.pack(fill="x", padx=10, pady=8)
+        self.enabled = tk.BooleanVar(value=store.metrics is not None)
+        ttk.Checkbutton(top, text="Collect metrics", variable=self.enabled,
+                        command=self._toggle).pack(side="left")
+        ttk.Button(top, text="Reset", command=self._reset).pack(side="left", padx=6)
+        ttk.Button(top, text="Dump JSON...", command=self._dump).pack(side="left", padx=6)
+        self.summary = ttk.Label(top, text="")
+        self.summary.pack(side="right")
+
+        self.tree = ttk.Treeview(self, columns=self.COLUMNS, show="tree headings")
+        self.tree.column("#0", width=130)
+        for c in self.COLUMNS:
+            self.tree.heading(c, text=c)
+            self.tree.column(c, width=170 if c == "Metric" else 70, anchor="w" if c == "Metric" else "e")
+        self.tree.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+
+        self._job = None
+        self.protocol("WM_DELETE_WINDOW", self._close)
+        self.refresh()
+
+    def _toggle(self):
+        if self.enabled.get():
+            self.store.enable_metrics()
+        else:
+            self.store.disable_metrics()
+        self.refresh()
+
+    def _reset(self):
+        if self.store.metrics is not None:
+            self.store.disable_metrics()
+            self.store.enable_metrics()
+        self.refresh()
+
+    def _dump(self):
+        if self.store.metrics is None:
+            messagebox.showwarning("Diagnostics", "Turn on metrics collection first.", parent=self)
+            return
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=".json", initialfile="metrics.json",
+                                            filetypes=[("JSON", "*.json")])
+        if path:
+            try:
+                self.store.dump_metrics(path)
+            except Exception as e:
+                messagebox.showerror("Error", str(e), parent=self)
+
+    def refresh(self):
+        self.tree.delete(*self.tree.get_children())
+        snap = self.store.metrics_snapshot()
+        if snap is None:
+            self.summary.configure(text="Metrics off")
+        else:
+            self.summary.configure(text=f"{snap['engine']}: {snap['engine_bytes_written']:,} bytes written "
+                                        f"in {snap['uptime_s']:,.0f}s")
+            for key, label in self.SECTIONS:
+                parent = self.tree.insert("", "end", text=label, open=True)
+                for name, h in snap[key].items():
+                    self.tree.insert(parent, "end", values=(
+                        name, h["count"], h["errors"], f"{h['mean']:,.0f}", f"{h['p50']:,.0f}",
+                        f"{h['p99']:,.0f}", f"{h['max']:,.0f}"))
+        self._job = self.after(self.REFRESH_MS, self.refresh)
+
+    def _close(self):
+        if self._job is not None:
+            self.after_cancel(self._job)
+        self.destroy()
+
+
 #############################
 # GUI App
 #############################
 class App(tk.Tk):
-    def __init__(self, store: DataStore):
+    POLL_MS = 250  # how often the pending-writes indicator checks the store
+    BG_POLL_MS = 30  # how often to check on the background decode worker
+    RESIZE_DEBOUNCE_MS = 150  # rescale once the window has stopped resizing for this long
+    BG_LRU = 4  # scaled background images kept in memory, by window size
+
+    def __init__(self, store: DataStore, started=None, show_timings=False, replica=None):
+        # started: perf_counter() at launch, so the timing breakdown includes the store load
+        # replica: ReplicaClient that takes the Manager panel's searches off the primary
+        self._started = time.perf_counter() if started is None else started
+        self.timings = {}  # startup phase -> ms since launch
+        self.show_timings = show_timings
+        self._mark("store")
         super().__init__()
         self.title("Bank Management System")
         self.geometry("1100x700")
         self.store = store
+        self.replica = replica
+        self.session = None  # token from the current login
+        self._mark("window")
 
-        # Background
+        # Background (decoded off the Tk thread on a cache miss)
         self._bg_img = None
+        self._bg_images = OrderedDict()  # (w, h) -> PhotoImage, least recently used first
+        self._bg_size = None  # size the background should currently have
+        self._bg_worker = None
+        self._resize_job = None
         self._bg_label = tk.Label(self)
         self._bg_label.place(relx=0, rely=0, relwidth=1, relheight=1)
-        self._set_background("bg.jpg")
+        self._background = ScaledBackground("bg.jpg")
+        self._set_background((1100, 700))
+        self.bind("<Configure>", self._on_configure)
 
         # Container (opaque so text visible)
         self.container = tk.Frame(self, bg="#ffffff", bd=0, highlightthickness=0)
         self.container.place(relx=0.5, rely=0.5, anchor="center", relwidth=0.96, relheight=0.92)
 
+        # frames are built on first use; only the login screen is needed at startup
+        self._frame_classes = {F.__name__: F for F in (LoginFrame, ManagerFrame, StaffFrame, UserFrame)}
         self.frames = {}
-        for F in (LoginFrame, ManagerFrame, StaffFrame, UserFrame):
-            frame = F(parent=self.container, controller=self)
-            self.frames[F.__name__] = frame
-            frame.place(relx=0, rely=0, relwidth=1, relheight=1)
+
+        # pending writes indicator (background persistence)
+        self._durable_waiters = []  # (commit seq, callback)
+        self.save_status = tk.Label(self, text="", bg="#1e293b", fg="#ffffff", padx=6)
+        self.save_status.place(relx=1, rely=1, anchor="se")
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self._poll_persistence()
 
         self.show_frame("LoginFrame")
+        self._mark("login_built")
+        self.after_idle(self._mark, "login_shown")
+
+    def _mark(self, phase):
+        self.timings[phase] = round((time.perf_counter() - self._started) * 1000, 1)
+        if self.show_timings:
+            print(f"startup: {phase:<12} {self.timings[phase]:8.1f} ms", file=sys.stderr)
+
+    def after_durable(self, callback):
+        # run callback on the Tk thread once everything committed so far is on disk
+        self._durable_waiters.append((self.store.commit_seq(), callback))
+
+    def notify_saved(self, title, text):
+        # success messages wait for the change to be durable, not just applied in memory
+        self.after_durable(lambda: messagebox.showinfo(title, text))
+
+    def _poll_persistence(self):
+        done = self.store.durable_seq()
+        ready = [cb for seq, cb in self._durable_waiters if seq <= done]
+        self._durable_waiters = [(seq, cb) for seq, cb in self._durable_waiters if seq > done]
+        for cb in ready:
+            cb()
+        pending = self.store.pending_writes()
+        if self.store.persist_error is not None:
+            text = f"Save failed, retrying ({pending} pending)"
+        elif pending:
+            text = f"Saving... {pending} pending"
+        else:
+            text = "All changes saved"
+        if self.save_status.cget("text") != text:
+            self.save_status.configure(text=text)
+        self.after(self.POLL_MS, self._poll_persistence)
+
+    def _on_close(self):
+        if self.store.pending_writes():
+            self.save_status.configure(text="Saving before exit...")
+            self.update_idletasks()
+        lost = self.store.close()
+        if lost:
+            messagebox.showerror("Save failed", f"{lost} recent changes could not be saved and are lost:\n"
+                                                f"{self.store.persist_error}")
+        self.destroy()
+
+    def _on_configure(self, event):
+        # the root's bindtag is on every child too, so only react to the window itself
+        if event.widget is not self:
+            return
+        size = (event.width, event.height)
+        if size == self._bg_size or min(size) < 2:
+            return
+        if self._resize_job is not None:
+            self.after_cancel(self._resize_job)
+        self._resize_job = self.after(self.RESIZE_DEBOUNCE_MS, self._set_background, size)
+
+    def _set_background(self, size):
+        self._resize_job = None
+        self._bg_size = size
+        img = self._bg_images.get(size)
+        if img is not None:
+            self._bg_images.move_to_end(size)
+            self._bg_img = img
+            self._bg_label.configure(image=img)
+            return
+        if self._bg_img is None:
+            self.configure(bg="#1e293b")  # shown until (or instead of) the image
+        if not self._background.path.exists():
+            return
+        cached = self._background.cached(size)
+        if cached is not None:
+            self._show_background(cached, size)
+        elif self._bg_worker is None:
+            self._start_bg_worker(size)
+        # else: the running worker picks up the newest size when it finishes
 
-    def _set_background(self, path):
-        if PIL_OK and Path(path).exists():
+    def _start_bg_worker(self, size):
+        result = {}
+
+        def work():
             try:
-                # cache scaled image
-                img = Image.open(path)
-                img = img.resize((1100, 700))
-                self._bg_img = ImageTk.PhotoImage(img)
-                self._bg_label.configure(image=self._bg_img)
+                result["path"] = self._background.render(size)
             except Exception:
-                self.configure(bg="#1e293b")
+                result["path"] = None
+
+        self._bg_worker = threading.Thread(target=work, name="bg-decode", daemon=True)
+        self._bg_worker.start()
+        self.after(self.BG_POLL_MS, self._poll_background, size, result)
+
+    def _poll_background(self, size, result):
+        # Tk isn't thread-safe, so the worker only writes the cache file and the Tk thread loads it
+        if self._bg_worker.is_alive():
+            self.after(self.BG_POLL_MS, self._poll_background, size, result)
+            return
+        self._bg_worker = None
+        if result.get("path") is None:
+            return  # no PIL or unreadable image: keep the plain background
+        if size == self._bg_size:
+            self._show_background(result["path"], size)
         else:
-            self.configure(bg="#1e293b")
+            self._set_background(self._bg_size)  # resized again while this one was rendering
+
+    def _show_background(self, path, size):
+        try:
+            img = tk.PhotoImage(file=str(path))
+        except tk.TclError:
+            return
+        self._bg_images[size] = img
+        while len(self._bg_images) > self.BG_LRU:
+            self._bg_images.popitem(last=False)
+        self._bg_img = img
+        self._bg_label.configure(image=img)
+        if "background" not in self.timings:
+            self._mark("background")
+
+    def get_frame(self, name):
+        frame = self.frames.get(name)
+        if frame is None:
+            frame = self._frame_classes[name](parent=self.container, controller=self)
+            frame.place(relx=0, rely=0, relwidth=1, relheight=1)
+            self.frames[name] = frame
+        return frame
+
+    def logout(self):
+        if self.session is not None:
+            self.store.logout(self.session)
+            self.session = None
+        self.show_frame("LoginFrame")
 
     def show_frame(self, name):
-        frame = self.frames[name]
+        frame = self.get_frame(name)
         frame.tkraise()
         if hasattr(frame, "on_show"):
             frame.on_show()
@@ -351,13 +622,22 @@ class LoginFrame(ttk.Frame):
 
     def login(self):
         ds = self.controller.store
+        if self.controller.session is not None:
+            ds.logout(self.controller.session)
+            self.controller.session = None
         if self.role.get() == "Manager":
-            if ds.check_manager_login(self.id_entry.get(), self.pwd_entry.get()):
+            token = ds.login("manager", self.id_entry.get(), self.pwd_entry.get())
+            if token:
+                ds.operator = f"manager:{self.id_entry.get()}"
+                self.controller.session = token
                 self.controller.show_frame("ManagerFrame")
             else:
                 messagebox.showerror("Error", "Invalid Manager login")
         elif self.role.get() == "Staff":
-            if ds.check_staff_login(self.id_entry.get(), self.pwd_entry.get()):
+            token = ds.login("staff", self.id_entry.get(), self.pwd_entry.get())
+            if token:
+                ds.operator = f"staff:{self.id_entry.get()}"
+                self.controller.session = token
                 self.controller.show_frame("StaffFrame")
             else:
                 messagebox.showerror("Error", "Invalid Staff login")
@@ -367,10 +647,10 @@ class LoginFrame(ttk.Frame):
             if not pin.isdigit():
                 messagebox.showerror("Error", "Enter numeric PIN")
                 return
-            details = ds.get_user_details(acc, int(pin))
-            if details:
-                frame: UserFrame = self.controller.frames["UserFrame"]
-                frame.current_user = details
+            token = ds.login("user", acc, int(pin))
+            if token:
+                ds.operator = f"user:{acc}"
+                self.controller.session = token
                 self.controller.show_frame("UserFrame")
             else:
                 messagebox.showerror("Error", "Invalid User login")
@@ -383,7 +663,8 @@ class ManagerFrame(ttk.Frame):
 
         top = ttk.Frame(self); top.pack(fill="x", pady=8)
         ttk.Label(top, text="Manager Panel", font=("Arial", 20, "bold")).pack(side="left", padx=8)
-        ttk.Button(top, text="Logout", command=lambda: controller.show_frame("LoginFrame")).pack(side="right", padx=8)
+        ttk.Button(top, text="Logout", command=controller.logout).pack(side="right", padx=8)
+        ttk.Button(top, text="Diagnostics", command=self.show_diagnostics).pack(side="right", padx=8)
 
         # search bar
         sb = ttk.Frame(self); sb.pack(fill="x", pady=4)
@@ -392,44 +673,63 @@ class ManagerFrame(ttk.Frame):
         ttk.Button(sb, text="Search by Name", command=self.search_name).pack(side="left", padx=4)
         ttk.Button(sb, text="Search by Account", command=self.search_acc).pack(side="left", padx=4)
         ttk.Button(sb, text="Show All", command=self.refresh).pack(side="left", padx=4)
+        self.replica_lbl = ttk.Label(sb, text="")
+        self.replica_lbl.pack(side="right", padx=8)
 
         # table
-        cols = ("Name", "Age", "Email", "AccountNo", "PIN", "Balance")
-        self.tree = ttk.Treeview(self, columns=cols, show='headings', height=16)
-        for c in cols:
-            self.tree.heading(c, text=c)
-            self.tree.column(c, width=150 if c != "Email" else 220, anchor="center")
-        self.tree.pack(fill='both', expand=True, padx=8, pady=6)
+        self.table = AccountTable(self, height=16)
+        self.table.pack(fill='both', expand=True, padx=8, pady=6)
+        self.tree = self.table.tree
+        controller.store.subscribe(self.table.on_change)  # patch rows in place after each change
 
         # action buttons
         btns = ttk.Frame(self); btns.pack(pady=6)
         ttk.Button(btns, text="Create Account", command=self.create_account).pack(side='left', padx=5)
         ttk.Button(btns, text="Update Selected", command=self.update_selected).pack(side='left', padx=5)
         ttk.Button(btns, text="Delete Selected", command=self.delete_selected).pack(side='left', padx=5)
+        ttk.Button(btns, text="Import...", command=self.import_accounts).pack(side='left', padx=5)
+        ttk.Button(btns, text="Export...", command=self.export_accounts).pack(side='left', padx=5)
         ttk.Separator(btns, orient="vertical").pack(side="left", fill="y", padx=8)
         ttk.Button(btns, text="Add Staff", command=self.add_staff).pack(side='left', padx=5)
         ttk.Button(btns, text="Edit Staff", command=self.edit_staff).pack(side='left', padx=5)
         ttk.Button(btns, text="Remove Staff", command=self.remove_staff).pack(side='left', padx=5)
+        ttk.Separator(btns, orient="vertical").pack(side="left", fill="y", padx=8)
+        ttk.Button(btns, text="Month End", command=self.month_end).pack(side='left', padx=5)
 
     def on_show(self):
         self.refresh()
 
+    def show_diagnostics(self):
+        DiagnosticsDialog(self, self.controller.store)
+
     def _fill_table(self, accounts):
-        self.tree.delete(*self.tree.get_children())
-        for acc in accounts:
-            accno = acc.get("accountNo") or acc.get("accountNo.")
-            self.tree.insert('', 'end', values=(acc['name'], acc['age'], acc['email'], accno, acc['pin'], acc['balance']))
+        self.table.set_rows(accounts, live=accounts is self.controller.store.data["accounts"])
 
     def refresh(self):
         self._fill_table(self.controller.store.data["accounts"])
 
+    def _reader(self):
+        # searches go to the read replica when one is configured
+        replica = self.controller.replica
+        if replica is None:
+            return self.controller.store
+        lag = replica.lag()
+        if lag.get("error"):
+            text = f"Replica stalled: {lag['error']}"
+        elif lag["seconds"] is None:
+            text = "Replica lag: unknown"
+        else:
+            text = f"Replica lag: {lag['seconds']:.1f}s"
+        self.replica_lbl.configure(text=text)
+        return replica
+
     def search_name(self):
         q = self.search_txt.get().strip()
-        self._fill_table(self.controller.store.search(name=q) if q else self.controller.store.data["accounts"])
+        self._fill_table(self._reader().search(name=q) if q else self.controller.store.data["accounts"])
 
     def search_acc(self):
         q = self.search_txt.get().strip()
-        self._fill_table(self.controller.store.search(acc_no=q) if q else self.controller.store.data["accounts"])
+        self._fill_table(self._reader().search(acc_no=q) if q else self.controller.store.data["accounts"])
 
     def create_account(self):
         d = FormDialog(self, "Create Account", [
@@ -442,10 +742,43 @@ class ManagerFrame(ttk.Frame):
         if d.result:
             try:
                 self.controller.store.create_account(d.result["name"], d.result["age"], d.result["email"], d.result["pin"])
-                self.refresh()
             except Exception as e:
                 messagebox.showerror("Error", str(e))
 
+    def import_accounts(self):
+        path = filedialog.askopenfilename(parent=self, title="Import accounts",
+                                          filetypes=[("CSV", "*.csv"), ("NDJSON", "*.ndjson *.jsonl"), ("All", "*.*")])
+        if not path:
+            return
+        restore = messagebox.askyesnocancel("Import", "Restore an export, keeping its account numbers "
+                                            "and balances?\n(No creates new empty accounts.)", parent=self)
+        if restore is None:
+            return
+        self.configure(cursor="watch")
+        self.update_idletasks()
+        try:
+            r = self.controller.store.import_accounts(path, restore=restore)
+            msg = f"Imported: {r['imported']}\nRejected: {r['rejected']}"
+            if r["rejects"]:
+                msg += f"\nSee {r['rejects']}"
+            self.controller.notify_saved("Import", msg)
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+        finally:
+            self.configure(cursor="")
+
+    def export_accounts(self):
+        path = filedialog.asksaveasfilename(parent=self, title="Export accounts", defaultextension=".csv",
+                                            initialfile="accounts.csv",
+                                            filetypes=[("CSV", "*.csv"), ("NDJSON", "*.ndjson *.jsonl")])
+        if not path:
+            return
+        try:
+            n = self.controller.store.export_accounts(path)
+            messagebox.showinfo("Export", f"{n} accounts written to {path}")
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+
     def _selected_accno(self):
         sel = self.tree.selection()
         if not sel:
@@ -469,7 +802,6 @@ class ManagerFrame(ttk.Frame):
         if d.result:
             try:
                 self.controller.store.update_account(accno, **{k: v for k, v in d.result.items() if v != ""})
-                self.refresh()
             except Exception as e:
                 messagebox.showerror("Error", str(e))
 
@@ -480,7 +812,6 @@ class ManagerFrame(ttk.Frame):
         if messagebox.askyesno("Confirm", f"Delete account {accno}?"):
             try:
                 self.controller.store.delete_account(accno)
-                self.refresh()
             except Exception as e:
                 messagebox.showerror("Error", str(e))
 
@@ -495,7 +826,7 @@ class ManagerFrame(ttk.Frame):
         if d.result:
             try:
                 self.controller.store.add_staff(d.result["sid"], d.result["pwd"], d.result["name"])
-                messagebox.showinfo("OK", "Staff added.")
+                self.controller.notify_saved("OK", "Staff added.")
             except Exception as e:
                 messagebox.showerror("Error", str(e))
 
@@ -511,7 +842,7 @@ class ManagerFrame(ttk.Frame):
                 self.controller.store.edit_staff(d.result["sid"],
                                                  new_name=(d.result["name"] or None),
                                                  new_password=(d.result["pwd"] or None))
-                messagebox.showinfo("OK", "Staff updated.")
+                self.controller.notify_saved("OK", "Staff updated.")
             except Exception as e:
                 messagebox.showerror("Error", str(e))
 
@@ -523,7 +854,23 @@ class ManagerFrame(ttk.Frame):
         if d.result:
             try:
                 self.controller.store.remove_staff(d.result["sid"])
-                messagebox.showinfo("OK", "Staff removed.")
+                self.controller.notify_saved("OK", "Staff removed.")
+            except Exception as e:
+                messagebox.showerror("Error", str(e))
+
+
+    def month_end(self):
+        d = FormDialog(self, "Month-end Processing", [
+            {"label": "Interest (basis points)", "key": "rate", "type": "int", "initial": 0},
+            {"label": "Fee below minimum", "key": "fee", "type": "int", "initial": 0},
+            {"label": "Minimum balance", "key": "min", "type": "int", "initial": 0},
+        ], submit_text="Run")
+        self.wait_window(d)
+        if d.result:
+            try:
+                r = self.controller.store.month_end(d.result["rate"] or 0, d.result["fee"] or 0, d.result["min"] or 0)
+                self.controller.notify_saved("Month End", f"Accounts: {r['accounts']}\nInterest paid: {r['interest']}\n"
+                                                          f"Fees charged: {r['fees']} ({r['charged']} accounts)")
             except Exception as e:
                 messagebox.showerror("Error", str(e))
 
@@ -535,7 +882,7 @@ class StaffFrame(ttk.Frame):
 
         top = ttk.Frame(self); top.pack(fill="x", pady=8)
         ttk.Label(top, text="Staff Panel", font=("Arial", 20, "bold")).pack(side="left", padx=8)
-        ttk.Button(top, text="Logout", command=lambda: controller.show_frame("LoginFrame")).pack(side="right", padx=8)
+        ttk.Button(top, text="Logout", command=controller.logout).pack(side="right", padx=8)
 
         # search & table to view accounts
         sb = ttk.Frame(self); sb.pack(fill="x", pady=4)
@@ -545,26 +892,22 @@ class StaffFrame(ttk.Frame):
         ttk.Button(sb, text="Search by Account", command=self.search_acc).pack(side="left", padx=4)
         ttk.Button(sb, text="Show All", command=self.refresh).pack(side="left", padx=4)
 
-        cols = ("Name", "Age", "Email", "AccountNo", "PIN", "Balance")
-        self.tree = ttk.Treeview(self, columns=cols, show='headings', height=14)
-        for c in cols:
-            self.tree.heading(c, text=c)
-            self.tree.column(c, width=150 if c != "Email" else 220, anchor="center")
-        self.tree.pack(fill='both', expand=True, padx=8, pady=6)
+        self.table = AccountTable(self, height=14)
+        self.table.pack(fill='both', expand=True, padx=8, pady=6)
+        self.tree = self.table.tree
+        controller.store.subscribe(self.table.on_change)  # patch rows in place after each change
 
         btns = ttk.Frame(self); btns.pack(pady=6)
         ttk.Button(btns, text="Deposit", command=self.deposit).pack(side='left', padx=5)
         ttk.Button(btns, text="Withdraw", command=self.withdraw).pack(side='left', padx=5)
+        ttk.Button(btns, text="Transfer", command=self.transfer).pack(side='left', padx=5)
         ttk.Button(btns, text="Update (name/age/email)", command=self.update_user).pack(side='left', padx=5)
 
     def on_show(self):
         self.refresh()
 
     def _fill_table(self, accounts):
-        self.tree.delete(*self.tree.get_children())
-        for acc in accounts:
-            accno = acc.get("accountNo") or acc.get("accountNo.")
-            self.tree.insert('', 'end', values=(acc['name'], acc['age'], acc['email'], accno, acc['pin'], acc['balance']))
+        self.table.set_rows(accounts, live=accounts is self.controller.store.data["accounts"])
 
     def refresh(self):
         self._fill_table(self.controller.store.data["accounts"])
@@ -588,12 +931,11 @@ class StaffFrame(ttk.Frame):
         return d.result
 
     def deposit(self):
-        res = self._acc_prompt("Deposit", need_pin=True, need_amount=True)
+        res = self._acc_prompt("Deposit", need_amount=True)
         if not res: return
         try:
-            bal = self.controller.store.deposit(res["acc"], res["pin"], res["amt"])
-            messagebox.showinfo("Success", f"New Balance: {bal}")
-            self.refresh()
+            bal = self.controller.store.deposit(res["acc"], None, res["amt"], token=self.controller.session)
+            self.controller.notify_saved("Success", f"New Balance: {bal}")
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
@@ -601,9 +943,24 @@ class StaffFrame(ttk.Frame):
         res = self._acc_prompt("Withdraw", need_pin=True, need_amount=True)
         if not res: return
         try:
-            bal = self.controller.store.withdraw(res["acc"], res["pin"], res["amt"])
-            messagebox.showinfo("Success", f"New Balance: {bal}")
-            self.refresh()
+            bal = self.controller.store.withdraw(res["acc"], res["pin"], res["amt"], token=self.controller.session)
+            self.controller.notify_saved("Success", f"New Balance: {bal}")
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+
+    def transfer(self):
+        d = FormDialog(self, "Transfer", [
+            {"label": "From Account", "key": "src", "type": "text"},
+            {"label": "PIN", "key": "pin", "type": "int"},
+            {"label": "To Account", "key": "dst", "type": "text"},
+            {"label": "Amount", "key": "amt", "type": "int"},
+        ], submit_text="Transfer")
+        self.wait_window(d)
+        if not d.result: return
+        try:
+            bal = self.controller.store.transfer(d.result["src"], d.result["pin"], d.result["dst"], d.result["amt"],
+                                                 token=self.controller.session)
+            self.controller.notify_saved("Success", f"New Balance: {bal}")
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
@@ -617,42 +974,84 @@ class StaffFrame(ttk.Frame):
         if d.result:
             try:
                 self.controller.store.update_account(d.result["acc"], **{d.result["field"]: d.result["value"]})
-                messagebox.showinfo("OK", "Updated successfully")
-                self.refresh()
+                self.controller.notify_saved("OK", "Updated successfully")
             except Exception as e:
                 messagebox.showerror("Error", str(e))
 
 
 class UserFrame(ttk.Frame):
+    PAGE_SIZE = 10  # mini-statement rows per page
+
     def __init__(self, parent, controller: App):
         super().__init__(parent)
         self.controller = controller
-        self.current_user = None
+        self.page = 0
 
         top = ttk.Frame(self); top.pack(fill="x", pady=8)
         ttk.Label(top, text="User Panel", font=("Arial", 20, "bold")).pack(side="left", padx=8)
-        ttk.Button(top, text="Logout", command=lambda: controller.show_frame("LoginFrame")).pack(side="right", padx=8)
+        ttk.Button(top, text="Logout", command=controller.logout).pack(side="right", padx=8)
 
-        self.info = tk.Text(self, height=16)
-        self.info.pack(fill='both', expand=True, padx=8, pady=8)
+        self.info = tk.Text(self, height=7)
+        self.info.pack(fill='x', padx=8, pady=8)
 
         ttk.Button(self, text="Reset PIN", command=self.reset_pin).pack(pady=6)
 
+        # mini-statement, newest first, read page by page from the ledger
+        ttk.Label(self, text="Mini Statement", font=("Arial", 13, "bold")).pack(anchor="w", padx=8)
+        cols = ("Date", "Type", "Amount", "Balance", "By")
+        self.stmt = ttk.Treeview(self, columns=cols, show="headings", height=self.PAGE_SIZE)
+        for c in cols:
+            self.stmt.heading(c, text=c)
+            self.stmt.column(c, width=150 if c == "Date" else 110, anchor="e" if c in ("Amount", "Balance") else "w")
+        self.stmt.pack(fill='both', expand=True, padx=8, pady=4)
+        nav = ttk.Frame(self); nav.pack(pady=4)
+        self.newer_btn = ttk.Button(nav, text="< Newer", command=lambda: self.show_statement(self.page - 1))
+        self.newer_btn.pack(side="left", padx=5)
+        self.page_lbl = ttk.Label(nav, text="")
+        self.page_lbl.pack(side="left", padx=8)
+        self.older_btn = ttk.Button(nav, text="Older >", command=lambda: self.show_statement(self.page + 1))
+        self.older_btn.pack(side="left", padx=5)
+
+    @property
+    def current_user(self):
+        # read through the session every time so details are never stale
+        try:
+            return self.controller.store.session_account(self.controller.session)
+        except PermissionError:
+            return None
+
     def on_show(self):
         self.show_details()
+        self.show_statement(0)
+
+    def show_statement(self, page):
+        self.stmt.delete(*self.stmt.get_children())
+        if not self.current_user:
+            return
+        ds = self.controller.store
+        accno = self.current_user.get("accountNo") or self.current_user.get("accountNo.")
+        pages = max(1, -(-ds.ledger.count(accno) // self.PAGE_SIZE))
+        self.page = min(max(0, page), pages - 1)
+        for e in ds.last_transactions(accno, self.PAGE_SIZE, self.page * self.PAGE_SIZE):
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(e["ts"]))
+            self.stmt.insert("", "end", values=(when, e["type"], f"{e['amount']:+}", e["balance"], e.get("op") or ""))
+        self.page_lbl.configure(text=f"Page {self.page + 1} of {pages}")
+        self.newer_btn.state(["!disabled"] if self.page > 0 else ["disabled"])
+        self.older_btn.state(["!disabled"] if self.page < pages - 1 else ["disabled"])
 
     def show_details(self):
         self.info.delete(1.0, tk.END)
-        if self.current_user:
-            accno = self.current_user.get("accountNo") or self.current_user.get("accountNo.")
+        user = self.current_user
+        if user:
+            accno = user.get("accountNo") or user.get("accountNo.")
             # show all details (including PIN, as requested earlier)
             ordered = {
-                "name": self.current_user.get("name"),
-                "age": self.current_user.get("age"),
-                "email": self.current_user.get("email"),
+                "name": user.get("name"),
+                "age": user.get("age"),
+                "email": user.get("email"),
                 "accountNo": accno,
-                "pin": self.current_user.get("pin"),
-                "balance": self.current_user.get("balance"),
+                "pin": user.get("pin"),
+                "balance": user.get("balance"),
             }
             for k, v in ordered.items():
                 self.info.insert(tk.END, f"{k}: {v}\n")
@@ -669,9 +1068,7 @@ class UserFrame(ttk.Frame):
             try:
                 accno = self.current_user.get("accountNo") or self.current_user.get("accountNo.")
                 self.controller.store.reset_pin(accno, d.result["old"], d.result["new"])
-                messagebox.showinfo("Success", "PIN reset successfully")
-                # reload current user details
-                self.current_user = self.controller.store.search(acc_no=accno)[0]
+                self.controller.notify_saved("Success", "PIN reset successfully")
                 self.show_details()
             except Exception as e:
                 messagebox.showerror("Error", str(e))
@@ -681,6 +1078,18 @@ class UserFrame(ttk.Frame):
 # Main Entry
 #############################
 if __name__ == "__main__":
-    store = DataStore()
-    app = App(store)
+    multiprocessing.freeze_support()  # month-end worker processes in the frozen build
+    if run_headless(sys.argv):
+        # offline commands (--rebalance, --convert, --replica, --import); see bank_store.py
+        sys.exit(0)
+    started = time.perf_counter()
+    engine = sys.argv[sys.argv.index("--engine") + 1] if "--engine" in sys.argv else "json"
+    if "--use-replica" in sys.argv and ("--journal" not in sys.argv or engine != "json"):
+        # replicas follow the JSON journal, so a primary writing anything else would leave them behind
+        sys.exit("--use-replica needs a journal-mode JSON primary: add --journal with the json engine")
+    store = DataStore(background=True, engine=engine, journal="--journal" in sys.argv)
+    if "--metrics" in sys.argv:
+        store.enable_metrics()
+    replica = ReplicaClient() if "--use-replica" in sys.argv else None
+    app = App(store, started=started, show_timings="--timing" in sys.argv, replica=replica)
     app.mainloop()
@@ -13,11 +13,21 @@ class Bank:
     except Exception as err:
         print(f"An exception accured as{err}")
 
+    # account number -> record, so lookups don't scan the whole list
+    index={i.get('accountNo.'):i for i in data if isinstance(i,dict) and i.get('accountNo.')}
+
     @classmethod
     def __Update(cls):
         with open(cls.database,'w')as fs:
             fs.write(json.dumps(cls.data))    
 
+    @classmethod
+    def __find(cls,accnumber,pin):
+        acc=cls.index.get(accnumber)
+        if acc is not None and acc['pin']==pin:
+            return [acc]
+        return []
+
     @classmethod
     def __accoungenrete(cls):
         alpha=random.choices(string.ascii_letters,k=3)
@@ -25,13 +35,16 @@ class Bank:
         spchar=random.choices("!@#%^&*",k=1)
         id=alpha+num+spchar
         random.shuffle(id)
-        return "".join(id)
+        id="".join(id)
+        if id in cls.index:
+            return cls.__accoungenrete()
+        return id
 
     def depositMony(self):
         accnumber=input("tell your account number :- ")
         pin=int(input("please tell your pin as well"))
 
-        userdata = [i for i in Bank.data if i['accountNo.']==accnumber and i['pin']==pin]
+        userdata = Bank.__find(accnumber,pin)
         print(f"{userdata}mk2003")
         if userdata == []:
             print("Sorry no data found !")
@@ -49,7 +62,7 @@ class Bank:
         accnumber=input("tell your account number :- ")
         pin=int(input("please tell your pin as well"))
 
-        userdata = [i for i in Bank.data if i['accountNo.']==accnumber and i['pin']==pin]
+        userdata = Bank.__find(accnumber,pin)
         print(f"{userdata}mk2003")
         if userdata == []:
             print("Sorry no data found !")
@@ -67,12 +80,13 @@ class Bank:
         accnumber=input("Enter your account number :- ")
         pin=int(input("please tell your pin as well"))
 
-        userdata=[i for i in Bank.data if i['accountNo.'] == accnumber and i['pin'] == pin]
+        userdata=Bank.__find(accnumber,pin)
         if userdata == []:
             print("No data found")
         else:
             index=Bank.data.index(userdata[0])
             Bank.data.pop(index)
+            Bank.index.pop(accnumber,None)
             print ("Account deleted succesfully")
 
             Bank.__Update()
@@ -82,7 +96,7 @@ class Bank:
         accnumber=input("Enter your account number :- ")
         pin=int(input("please tell your pin as well"))
 
-        userdata=[i for i in Bank.data if i['accountNo.'] == accnumber and i['pin'] == pin]
+        userdata=Bank.__find(accnumber,pin)
         if userdata == []:
             print("No data found")
         else:
@@ -94,7 +108,7 @@ class Bank:
         accnumber=input("Enter your account number :- ")
         pin=int(input("please tell your pin as well"))
 
-        userdata=[i for i in Bank.data if i['accountNo.'] == accnumber and i['pin'] == pin]
+        userdata=Bank.__find(accnumber,pin)
         if userdata == []:
             print("No data found")
         else:
@@ -147,6 +161,7 @@ class Bank:
             print("plrase notedown your account number")
 
             Bank.data.append(info)
+            Bank.index[info["accountNo."]]=info
             Bank.__Update()
 
 
@@ -0,0 +1,820 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bank_store import ColumnarAccounts, DataStore, MmapEngine, NgramIndex, ShardedEngine, Replica, ReplicaEngine, decode_snapshot, encode_snapshot, replica_key  # noqa: E402
+
+
+class StoreTestCase(unittest.TestCase):
+    """Runs each test in its own empty directory, since DataStore works on relative paths."""
+    store_kw = {}
+
+    def setUp(self):
+        self._old_cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory(prefix="bank-test-")
+        os.chdir(self._tmp.name)
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        os.chdir(self._old_cwd)
+        self._tmp.cleanup()
+
+    def open_store(self, **kw):
+        store = DataStore(**{**self.store_kw, **kw})
+        self.stores.append(store)
+        return store
+
+    def new_account(self, store, name="Test", balance=0):
+        acc_no = store.create_account(name, 30, f"{name.lower()}@example.com", 1234)["accountNo"]
+        if balance:
+            store.deposit(acc_no, 1234, balance)
+        return acc_no
+
+
+class MonthEndTest(StoreTestCase):
+    def _run_after_slot_reuse(self, **kw):
+        store = self.open_store(**kw)
+        a, b, c = (self.new_account(store, n) for n in ("A", "B", "C"))
+        store.delete_account(a)
+        d = self.new_account(store, "D")  # A leaves a gap before it in columnar mode
+        for acc_no, amount in ((b, 100), (c, 200), (d, 5000)):
+            store.deposit(acc_no, 1234, amount)
+        store.month_end(rate_bp=100)
+        return store, {n: store.search(acc_no=n)[0]["balance"] for n in (b, c, d)}, (b, c, d)
+
+    def test_interest_goes_to_the_right_accounts(self):
+        for columnar in (False, True):
+            with self.subTest(columnar=columnar):
+                store, balances, (b, c, d) = self._run_after_slot_reuse(columnar=columnar)
+                self.assertEqual(balances, {b: 101, c: 202, d: 5050})
+                self.assertEqual(store.last_transactions(d, 1)[0]["amount"], 50)
+                store.close()
+                self.stores.remove(store)
+                for f in (DataStore.DB_FILE, DataStore.LEDGER_FILE):
+                    os.remove(f)
+
+    def test_column_follows_list_order(self):
+        store = self.open_store(columnar=True)
+        nos = [self.new_account(store, n, balance=i + 1) for i, n in enumerate("ABCD")]
+        store.delete_account(nos[1])
+        self.new_account(store, "E", balance=99)
+        self.assertEqual(list(store.column("balance")), [acc["balance"] for acc in store.data["accounts"]])
+
+    def test_compaction_keeps_rows_and_side_fields(self):
+        store = self.open_store(columnar=True)
+        nos = [self.new_account(store, n, balance=i + 1) for i, n in enumerate("ABCDEFGH")]
+        store.update_account(nos[6], note="vip")
+        accounts = store.data["accounts"]
+        with mock.patch.object(ColumnarAccounts, "COMPACT_MIN", 2):
+            for acc_no in (nos[0], nos[3], nos[4]):
+                store.delete_account(acc_no)
+        self.assertEqual(len(accounts._rows), 5)  # the third delete compacted the table
+        self.assertEqual(list(accounts._order), list(range(5)))
+        expect = [(n, i + 1) for i, n in enumerate(nos) if i not in (0, 3, 4)]
+        self.assertEqual([(a["accountNo"], a["balance"]) for a in accounts], expect)
+        self.assertEqual(list(store.column("balance")), [b for _, b in expect])
+        self.assertEqual(store.search(acc_no=nos[6])[0]["note"], "vip")
+        self.assertEqual(store.search(acc_no=nos[7])[0]["name"], "H")
+        self.assertNotIn("note", store.search(acc_no=nos[5])[0])
+
+
+class RollbackTest(StoreTestCase):
+    # journal mode, so committing next to an open transaction needn't wait for a full snapshot
+    store_kw = {"journal": True}
+
+    def _in_open_transaction(self, store, work):
+        """
+        Runs work() inside a transaction on another thread and leaves it open; returns
+        finish(), which rolls it back (by raising) and waits for the thread.
+        """
+        ready, go, errors = threading.Event(), threading.Event(), []
+
+        def run():
+            try:
+                with store.transaction():
+                    work()
+                    ready.set()
+                    go.wait(10)
+                    raise RuntimeError("rollback")
+            except RuntimeError:
+                pass
+            except BaseException as e:
+                errors.append(e)
+                ready.set()
+
+        t = threading.Thread(target=run)
+        t.start()
+        self.assertTrue(ready.wait(10))
+
+        def finish():
+            go.set()
+            t.join(10)
+            self.assertEqual(errors, [])
+        return finish
+
+    def _other_stripe_number(self, store, acc_no):
+        # a fresh number whose row lock is not the one the open transaction holds
+        stripe = hash(acc_no) % store.LOCK_STRIPES
+        for n in store.reserve_account_numbers(16):
+            if hash(n) % store.LOCK_STRIPES != stripe:
+                return n
+        self.fail("no free stripe")
+
+    def test_rolled_back_delete_survives_concurrent_create(self):
+        for columnar in (False, True):
+            with self.subTest(columnar=columnar):
+                store = self.open_store(columnar=columnar)
+                x = self.new_account(store, "X", balance=777)
+                finish = self._in_open_transaction(store, lambda: store.delete_account(x))
+                c = self._other_stripe_number(store, x)
+                store.create_account("C", 30, "c@example.com", 1234, acc_no=c)  # while X's row can still be restored
+                finish()
+                self.assertEqual(store.search(acc_no=x)[0]["balance"], 777)
+                self.assertEqual(len(store.search(acc_no=c)), 1)
+                nos = [store._normalize_accno(a) for a in store.data["accounts"]]
+                self.assertEqual(sorted(nos), sorted(set(nos)))
+                store.close()
+                self.stores.remove(store)
+                reopened = self.open_store(columnar=columnar)
+                self.assertEqual(reopened.search(acc_no=x)[0]["balance"], 777)
+                self.assertEqual(len(reopened.search(acc_no=c)), 1)
+                reopened.close()
+                self.stores.remove(reopened)
+                for f in (DataStore.DB_FILE, DataStore.JOURNAL_FILE):
+                    os.remove(f)
+
+    def test_rolled_back_deposit_restores_balance_while_others_commit(self):
+        store = self.open_store()
+        a = self.new_account(store, "A", balance=100)
+        finish = self._in_open_transaction(store, lambda: store.deposit(a, 1234, 50))
+        b = self._other_stripe_number(store, a)
+        store.create_account("B", 30, "b@example.com", 1234, acc_no=b)
+        store.deposit(b, 1234, 10)
+        finish()
+        self.assertEqual(store.search(acc_no=a)[0]["balance"], 100)
+        self.assertEqual(store.search(acc_no=b)[0]["balance"], 10)
+        self.assertEqual([e["type"] for e in store.last_transactions(a)], ["deposit"])
+
+    def test_concurrent_transfers_keep_the_total(self):
+        store = self.open_store(columnar=True)
+        nos = [self.new_account(store, f"N{i}", balance=1000) for i in range(20)]
+        errors = []
+
+        def teller(seed):
+            for i in range(200):
+                src, dst = nos[(seed + i) % 20], nos[(seed * 7 + i * 3 + 1) % 20]
+                try:
+                    store.transfer(src, 1234, dst, 7)
+                except ValueError:
+                    pass
+                except BaseException as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=teller, args=(k,)) for k in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sum(store.column("balance")), 20 * 1000)
+
+
+class TransferTest(StoreTestCase):
+    def test_batch_reports_bad_rows_and_keeps_going(self):
+        store = self.open_store()
+        store.TRANSFER_CHUNK = 2
+        a, b = self.new_account(store, "A", balance=100), self.new_account(store, "B")
+        result = store.transfer_batch([(a, b, 10), (a, b, "abc"), (a,), (a, b, 10**6), None, (b, a, 5),
+                                       ([a], b, 1)])
+        self.assertEqual(result["applied"], 2)
+        self.assertEqual([pos for pos, _ in result["rejected"]], [1, 2, 3, 4, 6])
+        self.assertTrue(result["rejected"][0][1].startswith("Malformed transfer"))
+        self.assertEqual(result["rejected"][2][1], "Insufficient balance")
+        self.assertEqual(store.search(acc_no=a)[0]["balance"], 95)
+        self.assertEqual(store.search(acc_no=b)[0]["balance"], 5)
+
+    def test_failed_transfer_changes_nothing(self):
+        store = self.open_store()
+        a, b = self.new_account(store, "A", balance=100), self.new_account(store, "B")
+        for args in ((a, 9999, b, 5), (a, 1234, a, 5), (a, 1234, "NOPE", 5), (a, 1234, b, 101)):
+            with self.assertRaises(ValueError):
+                store.transfer(*args)
+        self.assertEqual(store.search(acc_no=a)[0]["balance"], 100)
+        self.assertEqual(store.last_transactions(b), [])
+
+
+class RenameTest(StoreTestCase):
+    def test_rename_onto_a_used_number_is_refused(self):
+        for kw in ({"journal": True}, {"engine": "sqlite"}, {}):
+            with self.subTest(**kw):
+                store = self.open_store(**kw)
+                ann, bob = self.new_account(store, "Ann", balance=100), self.new_account(store, "Bob", balance=500)
+                with self.assertRaises(ValueError):
+                    store.update_account(ann, accountNo=bob, name="Annie")
+                self.assertEqual(store.search(acc_no=ann)[0]["name"], "Ann")
+                self.assertEqual(store.search(acc_no=bob)[0]["balance"], 500)
+                store.close()
+                self.stores.remove(store)
+                reopened = self.open_store(**kw)
+                self.assertEqual({acc["accountNo"]: acc["balance"] for acc in reopened.search()},
+                                 {ann: 100, bob: 500})
+                self.assertEqual(reopened.search(acc_no=ann)[0]["name"], "Ann")
+                reopened.delete_account(ann)
+                reopened.delete_account(bob)
+
+    def test_rename_to_a_free_number_survives_reopen(self):
+        store = self.open_store(journal=True)
+        ann = self.new_account(store, "Ann", balance=100)
+        new_no = store.reserve_account_numbers(1)[0]
+        store.update_account(ann, accountNo=new_no)
+        store.close()
+        self.stores.remove(store)
+        reopened = self.open_store(journal=True)
+        self.assertEqual(reopened.search(acc_no=ann), [])
+        self.assertEqual(reopened.search(acc_no=new_no)[0]["balance"], 100)
+
+
+class ExportImportTest(StoreTestCase):
+    def test_restore_round_trips_an_export(self):
+        for name in ("book.csv", "book.ndjson"):
+            with self.subTest(name):
+                os.makedirs(name + ".d")
+                os.chdir(name + ".d")
+                store = self.open_store()
+                a, b = self.new_account(store, "Ann", balance=250), self.new_account(store, "Bob")
+                self.assertEqual(store.export_accounts(name), 2)
+                source = sorted((acc["accountNo"], acc["name"], acc["pin"], acc["balance"])
+                                for acc in store.search())
+                os.makedirs("restored")
+                os.chdir("restored")
+                copy = self.open_store()
+                result = copy.import_accounts(Path("..", name), restore=True)
+                self.assertEqual((result["imported"], result["rejected"]), (2, 0))
+                self.assertEqual(sorted((acc["accountNo"], acc["name"], acc["pin"], acc["balance"])
+                                        for acc in copy.search()), source)
+                self.assertEqual([t["type"] for t in copy.last_transactions(a)], ["opening"])
+                self.assertEqual(copy.last_transactions(b), [])
+                again = copy.import_accounts(Path("..", name), restore=True)
+                self.assertEqual((again["imported"], again["rejected"]), (0, 2))
+                self.assertNotIn(copy.create_account("Cy", 30, "cy@example.com", 1234)["accountNo"], (a, b))
+                os.chdir(self._tmp.name)
+
+    def test_plain_import_assigns_new_numbers(self):
+        store = self.open_store()
+        a = self.new_account(store, "Ann", balance=250)
+        store.export_accounts("book.csv")
+        result = store.import_accounts("book.csv")
+        self.assertEqual(result["imported"], 1)
+        copy = [acc for acc in store.search(name="Ann") if acc["accountNo"] != a]
+        self.assertEqual(len(copy), 1)
+        self.assertEqual(copy[0]["balance"], 0)
+
+    def test_rewriting_engine_keeps_chunks_fixed_and_groups_writes(self):
+        with open("book.ndjson", "w", encoding="utf-8") as f:
+            for i in range(100):
+                f.write(json.dumps({"name": f"N{i}", "age": 30, "email": f"n{i}@example.com", "pin": 1234}) + "\n")
+        store = self.open_store()
+        self.assertTrue(store.engine.rewrites)
+        with mock.patch.object(store, "_import_batch", wraps=store._import_batch) as batches, \
+                mock.patch.object(store.engine, "save", wraps=store.engine.save) as saves:
+            self.assertEqual(store.import_accounts("book.ndjson", chunk=5)["imported"], 100)
+        self.assertEqual({len(c.args[0]) for c in batches.call_args_list}, {5})
+        self.assertLessEqual(saves.call_count, 6)  # 20 chunks, written as the book doubles
+        self.assertEqual(store.pending_writes(), 0)
+        store.close()
+        self.stores.remove(store)
+        self.assertEqual(len(self.open_store().search()), 100)
+
+
+class SnapshotTest(unittest.TestCase):
+    def account(self, **kw):
+        return {"name": "Ann", "age": 30, "email": "ann@example.com", "pin": 1234,
+                "accountNo": "ABC123", "balance": 0, **kw}
+
+    def test_values_round_trip_with_their_types(self):
+        class Name(str):
+            pass
+        for odd in ({"balance": True}, {"age": False}, {"name": Name("Ann")}, {"balance": 2 ** 63}):
+            with self.subTest(odd):
+                data = {"accounts": [self.account(), self.account(accountNo="ABC124", **odd)], "staff": []}
+                back = decode_snapshot(encode_snapshot(data))["accounts"]
+                self.assertEqual(back, data["accounts"])
+                key, value = next(iter(odd.items()))
+                self.assertIs(type(back[1][key]), type(value) if type(value) is not Name else str)
+
+
+class SessionTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = self.open_store()
+        self.a = self.new_account(self.store, "A", balance=100)
+        self.b = self.new_account(self.store, "B")
+        self.store.add_staff("s1", "pw", "Staff One")
+        self.staff = self.store.login("staff", "s1", "pw")
+
+    def test_user_session_replaces_pin_for_its_own_account_only(self):
+        token = self.store.login("user", self.a, 1234)
+        self.assertEqual(self.store.withdraw(self.a, None, 10, token=token), 90)
+        self.assertEqual(self.store.transfer(self.a, None, self.b, 10, token=token), 80)
+        with self.assertRaises(PermissionError):
+            self.store.deposit(self.b, None, 5, token=token)
+
+    def test_staff_session_needs_customer_pin_for_debits(self):
+        with self.assertRaises(PermissionError):
+            self.store.withdraw(self.a, None, 5, token=self.staff)
+        with self.assertRaises(PermissionError):
+            self.store.transfer(self.a, None, self.b, 5, token=self.staff)
+        with self.assertRaises(ValueError):
+            self.store.withdraw(self.a, 9999, 5, token=self.staff)
+        self.assertEqual(self.store.withdraw(self.a, 1234, 5, token=self.staff), 95)
+        self.assertEqual(self.store.last_transactions(self.a, 1)[0]["op"], "staff:s1")
+
+    def test_staff_session_deposits_without_pin(self):
+        self.assertEqual(self.store.deposit(self.a, None, 5, token=self.staff), 105)
+
+    def test_sessions_end_with_the_account_or_staff_member(self):
+        token = self.store.login("user", self.a, 1234)
+        self.store.remove_staff("s1")
+        self.store.delete_account(self.a)
+        for t in (token, self.staff):
+            with self.assertRaises(PermissionError):
+                self.store.sessions.check(t)
+
+
+class NgramIndexTest(unittest.TestCase):
+    def test_substring_prefix_and_order(self):
+        ix = NgramIndex()
+        for key, text in (("k1", "Alice Smith"), ("k2", "Bob Smithson"), ("k3", "Smi")):
+            ix.add(key, text)
+        self.assertEqual(ix.find("smith"), ["k1", "k2"])
+        self.assertEqual(ix.find("SMI", prefix=True), ["k3"])
+        self.assertEqual(ix.find("b"), ["k2"])
+        self.assertEqual(ix.find("zzz"), [])
+
+    def test_changes_and_stale_postings(self):
+        ix = NgramIndex()
+        for i in range(5000):
+            ix.add(i, f"name{i}")
+        for i in range(0, 5000, 2):
+            ix.remove(i)  # enough to trigger a rebuild of the postings
+        ix.add(3, "renamed")
+        ix.add(0, "name0")  # back in its old place, as after a rolled-back delete
+        self.assertEqual(ix.find("name1")[:3], [1, 11, 13])
+        self.assertEqual(ix.find("name0"), [0])
+        self.assertEqual(ix.find("renamed"), [3])
+        self.assertNotIn(3, ix.find("name3"))
+
+
+class SearchTest(StoreTestCase):
+    def test_indexes_follow_changes_after_first_search(self):
+        store = self.open_store()
+        a = self.new_account(store, "Alice")
+        self.assertEqual([acc["accountNo"] for acc in store.search(name="alic")], [a])
+        b = self.new_account(store, "Alicia")
+        store.update_account(a, name="Zed")
+        self.assertEqual([acc["accountNo"] for acc in store.search(name="alic")], [b])
+        self.assertEqual([acc["accountNo"] for acc in store.search(email="alicia@")], [b])
+        store.delete_account(b)
+        self.assertEqual(store.search(email="alicia@"), [])
+
+    def test_hits_follow_table_order_after_renames(self):
+        rnd = random.Random(5)
+        names = ["Ann", "Anna", "Hannah", "Joanne", "Bob", "Dan"]
+        for columnar in (False, True):
+            with self.subTest(columnar=columnar):
+                store = self.open_store(columnar=columnar)
+                nos = [self.new_account(store, rnd.choice(names)) for _ in range(30)]
+                gone, fresh = [], iter(range(1000))
+                for step in range(300):
+                    op = rnd.random()
+                    acc_no = rnd.choice(nos)
+                    if op < 0.4:
+                        new_no = f"ZZZ{next(fresh):03d}"
+                        store.update_account(acc_no, accountNo=new_no)
+                        nos[nos.index(acc_no)] = new_no
+                    elif op < 0.5:
+                        with self.assertRaises(ValueError):  # rolled back
+                            store.update_account(acc_no, accountNo=rnd.choice([n for n in nos if n != acc_no]), name="Ann")
+                    elif op < 0.65 and len(nos) > 10:
+                        store.delete_account(acc_no)
+                        nos.remove(acc_no)
+                        gone.append(acc_no)
+                    elif op < 0.8:
+                        store.update_account(acc_no, name=rnd.choice(names))
+                    else:
+                        reuse = gone.pop(rnd.randrange(len(gone))) if gone and rnd.random() < 0.5 else None
+                        nos.append(store.create_account(rnd.choice(names), 30, "x@example.com", 1234,
+                                                        acc_no=reuse)["accountNo"])
+                    for q in ("an", "ann", "o"):
+                        scan = [a["accountNo"] for a in store.data["accounts"] if q in a["name"].lower()]
+                        self.assertEqual([a["accountNo"] for a in store.search(name=q)], scan, step)
+                store.close()
+                self.stores.remove(store)
+                os.remove(DataStore.DB_FILE)
+
+
+class ReplicaTest(StoreTestCase):
+    store_kw = {"journal": True}
+
+    def test_replica_follows_across_compactions(self):
+        primary = self.open_store()
+        primary.COMPACT_EVERY = 10
+        replica = DataStore(engine=ReplicaEngine)
+        self.stores.append(replica)
+        nos = []
+        for i in range(35):
+            nos.append(self.new_account(primary, f"N{i}", balance=i + 1))
+            self.assertTrue(replica.engine.poll())  # never needs a rebuild
+        self.assertGreaterEqual(replica.engine.rotations, 3)
+        self.assertEqual({n: replica.search(acc_no=n)[0]["balance"] for n in nos},
+                         {n: primary.search(acc_no=n)[0]["balance"] for n in nos})
+
+    def test_replica_rebuilds_when_two_compactions_behind(self):
+        primary = self.open_store()
+        primary.COMPACT_EVERY = 4
+        self.new_account(primary, "A")
+        replica = DataStore(engine=ReplicaEngine)
+        self.stores.append(replica)
+        for i in range(12):  # three compactions; the journal it was reading is gone
+            self.new_account(primary, f"N{i}")
+        self.assertFalse(replica.engine.poll())
+
+    def test_replica_tells_journals_apart_when_an_inode_is_reused(self):
+        self.open_store()  # writes the snapshot and the primary marker
+
+        def journal(header, *names):
+            lines = [["journal", header]]
+            for name in names:
+                lines += [["acc", name, {"accountNo": name, "name": name, "balance": 0}], ["mark", 1.0]]
+            return "".join(json.dumps(line) + "\n" for line in lines)
+        with open(DataStore.JOURNAL_FILE, "w", encoding="utf-8") as f:
+            f.write(journal("0" * 16, "AAA001"))
+        replica = DataStore(engine=ReplicaEngine)
+        self.stores.append(replica)
+        self.assertTrue(replica.engine.poll())
+        # a new journal in the same inode, as a file system may hand out after a rotation;
+        # followed by offset, its second record would look like the next line of the old one
+        with open(DataStore.JOURNAL_FILE, "r+", encoding="utf-8") as f:
+            f.truncate(0)
+            f.write(journal("1" * 16, "BBB001", "BBB002"))
+        self.assertFalse(replica.engine.poll())
+
+    def test_replica_refuses_primaries_it_cannot_follow(self):
+        for kw in ({"journal": False}, {"engine": "snapshot"}, {"engine": "sqlite"}):
+            with self.subTest(**kw):
+                primary = self.open_store(**kw)
+                self.new_account(primary, "A")
+                with self.assertRaises(RuntimeError):
+                    DataStore(engine=ReplicaEngine)
+
+    def test_replica_stops_when_the_primary_stops_journaling(self):
+        primary = self.open_store()
+        replica = DataStore(engine=ReplicaEngine)
+        self.stores.append(replica)
+        primary.close()
+        self.stores.remove(primary)
+        self.open_store(journal=False)
+        with self.assertRaises(RuntimeError):
+            replica.engine.poll()
+
+    def test_lag_is_unknown_until_a_commit_is_seen(self):
+        primary = self.open_store()
+        replica = Replica()
+        self.stores.append(replica.store)
+        self.assertIsNone(replica.lag()["seconds"])
+        self.new_account(primary, "A")
+        replica.refresh()
+        lag = replica.lag()
+        self.assertIsNotNone(lag["seconds"])
+        self.assertEqual(lag["accounts"], 1)
+
+    @unittest.skipUnless(os.name == "posix", "file modes")
+    def test_replica_key_file(self):
+        old = os.environ.pop("BANK_REPLICA_KEY", None)
+        try:
+            with self.assertRaises(PermissionError):
+                replica_key()
+            key = replica_key(create=True)
+            self.assertEqual(len(key), 64)
+            self.assertEqual(os.stat("replica.key").st_mode & 0o777, 0o600)
+            self.assertEqual(replica_key(), key)
+            os.chmod("replica.key", 0o644)
+            with self.assertRaises(PermissionError):
+                replica_key()
+        finally:
+            if old is not None:
+                os.environ["BANK_REPLICA_KEY"] = old
+
+
+class EngineTestCase(StoreTestCase):
+    """Round trips through an engine's files: change a store, reopen it, compare."""
+
+    def reopen(self, store, **kw):
+        store.close()
+        self.stores.remove(store)
+        return self.open_store(**kw)
+
+    @staticmethod
+    def contents(store):
+        accounts = sorted((dict(acc) for acc in store.data["accounts"]), key=lambda acc: acc.get("accountNo") or "")
+        return accounts, sorted(store.data["staff"], key=lambda s: s["id"]), store.data["manager"]
+
+    def populate(self, store, n=5):
+        nos = [self.new_account(store, f"N{i}", balance=10 * i) for i in range(n)]
+        store.update_account(nos[0], name="Renamed", email="r\u00e9@example.com")
+        store.delete_account(nos[1])
+        store.update_account(nos[2], note="vip")  # a field outside the fixed columns
+        store.add_staff("s1", "pw", "Staff One")
+        return nos
+
+
+class JsonEngineTest(EngineTestCase):
+    def test_reopen_round_trip(self):
+        for kw in ({}, {"journal": True}, {"journal": True, "columnar": True}):
+            with self.subTest(**kw):
+                store = self.open_store(**kw)
+                self.populate(store)
+                before = self.contents(store)
+                self.assertEqual(self.contents(self.reopen(store, **kw)), before)
+                for f in (DataStore.DB_FILE, DataStore.JOURNAL_FILE):
+                    if os.path.exists(f):
+                        os.remove(f)
+
+    def test_torn_journal_tail_is_dropped(self):
+        store = self.open_store(journal=True)
+        a = self.new_account(store, "A", balance=10)
+        store.close()
+        self.stores.remove(store)
+        good = os.path.getsize(DataStore.JOURNAL_FILE)
+        with open(DataStore.JOURNAL_FILE, "a", encoding="utf-8") as f:
+            f.write('["acc","ZZZ999",{"name":"Half')  # the crash hit mid-line
+        reopened = self.open_store(journal=True)
+        self.assertEqual(os.path.getsize(DataStore.JOURNAL_FILE), good)
+        self.assertEqual(reopened.search(acc_no="ZZZ999"), [])
+        reopened.deposit(a, 1234, 5)  # appends after the cut, not after the torn bytes
+        self.assertEqual(self.reopen(reopened, journal=True).search(acc_no=a)[0]["balance"], 15)
+
+    def test_compaction_keeps_every_record(self):
+        store = self.open_store(journal=True)
+        store.COMPACT_EVERY = 4
+        nos = [self.new_account(store, f"N{i}", balance=i + 1) for i in range(10)]
+        self.assertTrue(os.path.exists(DataStore.JOURNAL_FILE + ".1"))
+        reopened = self.reopen(store, journal=True)
+        self.assertEqual({acc["accountNo"]: acc["balance"] for acc in reopened.search()},
+                         {n: i + 1 for i, n in enumerate(nos)})
+
+
+class SqliteEngineTest(EngineTestCase):
+    store_kw = {"engine": "sqlite"}
+
+    def test_commits_are_fully_synchronous(self):
+        store = self.open_store()
+        self.assertEqual(store.engine.conn.execute("PRAGMA synchronous").fetchone()[0], 2)  # FULL
+        indexes = store.engine.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' "
+                                            "AND tbl_name = 'accounts' AND sql IS NOT NULL").fetchall()
+        self.assertEqual(indexes, [])
+
+    def test_reopen_round_trip(self):
+        store = self.open_store()
+        self.populate(store)
+        before = self.contents(store)
+        self.assertEqual(self.contents(self.reopen(store)), before)
+
+    def test_migrates_data_json_once(self):
+        legacy = [{"name": "Old", "age": 40, "email": "old@example.com", "pin": 1111,
+                   "accountNo.": "LEG001", "balance": 7, "note": "kept"}]
+        with open(DataStore.DB_FILE, "w", encoding="utf-8") as f:
+            json.dump(legacy, f)
+        store = self.open_store()
+        acc = store.search(acc_no="LEG001")[0]
+        self.assertEqual((acc["balance"], acc["note"]), (7, "kept"))
+        a = self.new_account(store, "New")
+        os.remove(DataStore.DB_FILE)  # later opens read the database, not data.json
+        reopened = self.reopen(store)
+        self.assertEqual(sorted(acc["accountNo"] for acc in reopened.search()), sorted(["LEG001", a]))
+        self.assertEqual(reopened.search(acc_no="LEG001")[0]["note"], "kept")
+
+
+class SmallMmapEngine(MmapEngine):
+    GROW = 4
+
+
+class MmapEngineTest(EngineTestCase):
+    store_kw = {"engine": SmallMmapEngine}
+
+    def test_reopen_round_trip(self):
+        store = self.open_store()
+        self.populate(store)
+        before = self.contents(store)
+        self.assertEqual(self.contents(self.reopen(store)), before)
+
+    def test_file_grows_past_its_spare_slots(self):
+        store = self.open_store()
+        nos = [self.new_account(store, f"N{i}", balance=i) for i in range(3 * SmallMmapEngine.GROW + 1)]
+        engine = store.engine
+        self.assertGreaterEqual(len(engine._mm), engine.HEADER.size + len(nos) * engine.RECORD.size)
+        reopened = self.reopen(store)
+        self.assertEqual({acc["accountNo"]: acc["balance"] for acc in reopened.search()},
+                         {n: i for i, n in enumerate(nos)})
+
+    def test_deleted_slots_are_reused(self):
+        store = self.open_store()
+        a, b = self.new_account(store, "A"), self.new_account(store, "B", balance=5)
+        used = store.engine._used
+        store.delete_account(a)
+        c = self.new_account(store, "C", balance=9)
+        self.assertEqual(store.engine._used, used)
+        reopened = self.reopen(store)
+        self.assertEqual({acc["accountNo"]: acc["balance"] for acc in reopened.search()}, {b: 5, c: 9})
+        self.assertEqual(reopened.engine._used, used)
+
+
+class ShardedEngineTest(EngineTestCase):
+    store_kw = {"engine": "sharded"}
+
+    def shard_contents(self, directory=DataStore.SHARD_DIR):
+        # accountNo -> the shard file it is stored in
+        found = {}
+        for path in Path(directory).glob("shard-*.json"):
+            with open(path, encoding="utf-8") as f:
+                found.update((acc["accountNo"], path.name) for acc in json.load(f))
+        return found
+
+    def test_reopen_round_trip(self):
+        store = self.open_store()
+        self.populate(store, n=20)
+        before = self.contents(store)
+        self.assertEqual(self.contents(self.reopen(store)), before)
+        stored = self.shard_contents()
+        self.assertEqual(sorted(stored), sorted(acc["accountNo"] for acc in before[0]))
+        for acc_no, name in stored.items():
+            self.assertEqual(name, f"shard-{ShardedEngine.shard_of(acc_no, DataStore.SHARDS):03d}.json")
+
+    def test_rebalance_changes_the_shard_count(self):
+        store = self.open_store()
+        self.populate(store, n=20)
+        before = self.contents(store)
+        store.close()
+        self.stores.remove(store)
+        self.assertEqual(ShardedEngine.rebalance(DataStore.SHARD_DIR, 3), 19)
+        self.assertEqual(len(list(Path(DataStore.SHARD_DIR).glob("shard-*.json"))), 3)
+        self.assertFalse(Path(DataStore.SHARD_DIR + ".old").exists())
+        reopened = self.open_store()
+        self.assertEqual(reopened.engine.shards, 3)
+        self.assertEqual(self.contents(reopened), before)
+        a = self.new_account(reopened, "After", balance=3)
+        self.assertEqual(self.reopen(reopened).search(acc_no=a)[0]["balance"], 3)
+
+    def test_load_finishes_an_interrupted_swap(self):
+        store = self.open_store()
+        self.populate(store, n=10)
+        before = self.contents(store)
+        store.close()
+        self.stores.remove(store)
+        # rebalance stopped between its renames: the old layout retired, the new one not in place
+        writer = ShardedEngine.__new__(ShardedEngine)
+        writer.bytes_written = 0
+        with open(Path(DataStore.SHARD_DIR) / ShardedEngine.STAFF, encoding="utf-8") as f:
+            people = json.load(f)
+        writer._write_all(DataStore.SHARD_DIR + ".new", 5, {"accounts": before[0], **people})
+        os.replace(DataStore.SHARD_DIR, DataStore.SHARD_DIR + ".old")
+        reopened = self.open_store()
+        self.assertEqual(reopened.engine.shards, 5)
+        self.assertEqual(self.contents(reopened), before)
+        self.assertFalse(Path(DataStore.SHARD_DIR + ".new").exists())
+
+    def test_load_ignores_an_unfinished_new_layout(self):
+        store = self.open_store()
+        self.populate(store, n=10)
+        before = self.contents(store)
+        store.close()
+        self.stores.remove(store)
+        os.makedirs(DataStore.SHARD_DIR + ".new")  # rebalance died before writing meta.json
+        (Path(DataStore.SHARD_DIR + ".new") / "shard-000.json").write_text("[", encoding="utf-8")
+        self.assertEqual(self.contents(self.open_store()), before)
+
+
+class SnapshotEngineTest(EngineTestCase):
+    store_kw = {"engine": "snapshot"}
+
+    def test_reopen_round_trip(self):
+        for kw in ({}, {"journal": True}, {"journal": True, "columnar": True}):
+            with self.subTest(**kw):
+                store = self.open_store(**kw)
+                store.COMPACT_EVERY = 3
+                self.populate(store)
+                before = self.contents(store)
+                self.assertEqual(self.contents(self.reopen(store, **kw)), before)
+                for f in (DataStore.SNAPSHOT_FILE, DataStore.JOURNAL_FILE, DataStore.JOURNAL_FILE + ".1"):
+                    if os.path.exists(f):
+                        os.remove(f)
+
+    def test_imports_data_json_then_keeps_the_snapshot(self):
+        legacy = [{"name": "Old", "age": 40, "email": "old@example.com", "pin": 1111,
+                   "accountNo.": "LEG001", "balance": 7}]
+        with open(DataStore.DB_FILE, "w", encoding="utf-8") as f:
+            json.dump(legacy, f)
+        store = self.open_store()
+        self.assertTrue(os.path.exists(DataStore.SNAPSHOT_FILE))
+        a = self.new_account(store, "New", balance=3)
+        os.remove(DataStore.DB_FILE)
+        reopened = self.reopen(store)
+        self.assertEqual(reopened.search(acc_no="LEG001")[0]["accountNo."], "LEG001")  # kept verbatim
+        self.assertEqual(reopened.search(acc_no=a)[0]["balance"], 3)
+
+    def test_damaged_snapshot_is_an_error(self):
+        store = self.open_store()
+        self.new_account(store, "A")
+        store.close()
+        self.stores.remove(store)
+        with open(DataStore.SNAPSHOT_FILE, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 0xFF]))
+        size = os.path.getsize(DataStore.SNAPSHOT_FILE)
+        with self.assertRaises(ValueError):
+            DataStore(engine="snapshot")
+        self.assertEqual(os.path.getsize(DataStore.SNAPSHOT_FILE), size)  # left for recovery, not overwritten
+
+
+class BackgroundWriteTest(StoreTestCase):
+    def test_close_gives_up_when_writes_keep_failing(self):
+        store = self.open_store(background=True)
+        store.RETRY_DELAY = 0.01
+        a = self.new_account(store, "A")
+        self.assertTrue(store.wait_durable(5))
+
+        def broken(*args):
+            raise OSError("disk full")
+        store._write = broken
+        store.deposit(a, 1234, 5)
+        store.deposit(a, 1234, 5)
+        done = threading.Event()
+        lost = []
+        t = threading.Thread(target=lambda: (lost.append(store.close()), done.set()))
+        t.start()
+        self.assertTrue(done.wait(10), "close() hung on a failing disk")
+        self.assertEqual(lost, [2])
+        self.assertIsInstance(store.persist_error, OSError)
+
+    def test_close_flushes_pending_writes(self):
+        store = self.open_store(background=True)
+        a = self.new_account(store, "A", balance=40)
+        self.assertEqual(store.close(), 0)
+        self.assertEqual(self.open_store().search(acc_no=a)[0]["balance"], 40)
+
+
+class SyncWriteFailureTest(StoreTestCase):
+    store_kw = {"journal": True}
+
+    def break_disk(self, store):
+        write = store.engine.write
+
+        def broken(items):
+            raise OSError("disk full")
+        store.engine.write = broken
+        return lambda: setattr(store.engine, "write", write)
+
+    def test_failed_write_keeps_the_commit_and_reports_it(self):
+        store = self.open_store()
+        a = self.new_account(store, "A", balance=100)
+        events = []
+        store.subscribe(lambda *e: events.append(e))
+        repair = self.break_disk(store)
+        self.assertEqual(store.deposit(a, 1234, 50), 150)  # applied, so no error for the teller
+        self.assertIsInstance(store.persist_error, OSError)
+        self.assertEqual(store.pending_writes(), 1)
+        self.assertEqual(events, [("updated", a, {"balance": 150})])
+        repair()
+        store.deposit(a, 1234, 5)  # the next write carries the earlier commit too
+        self.assertIsNone(store.persist_error)
+        self.assertEqual(store.pending_writes(), 0)
+        store.close()
+        self.stores.remove(store)
+        reopened = self.open_store()
+        self.assertEqual(reopened.search(acc_no=a)[0]["balance"], 155)
+        self.assertEqual([t["amount"] for t in reopened.last_transactions(a)], [5, 50, 100])
+
+    def test_close_retries_then_reports_lost_commits(self):
+        store = self.open_store()
+        store.RETRY_DELAY = 0.01
+        a = self.new_account(store, "A")
+        self.break_disk(store)
+        store.deposit(a, 1234, 5)
+        store.deposit(a, 1234, 5)
+        self.assertEqual(store.close(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()